@@ -449,6 +449,7 @@ class ViscaCameraController extends CameraController {
         // finally starts the session on IPv4.
         // Using 127.0.0.1 eliminates the RST,ACKs and delays.
         this.url = "http://" + cam_data.visca_server_address + "/server";
+        this.compact_url = "http://" + cam_data.visca_server_address + "/compact";
 
         // Counter to disambiguate requests for debugging
         this.sendCount = 0;
@@ -551,6 +552,55 @@ class ViscaCameraController extends CameraController {
               });
     }
 
+    // Send a pan, tilt, zoom, slew or velocity request in the server's
+    // compact text format, returning a promise.
+    // Used for jogs and joysticks, which send many requests.
+    // a_fields are in the order the server expects; null is sent as "_".
+    send_compact_request(a_command, a_fields) {
+        var url = this.compact_url;
+        var words = [a_command, this.address];
+        for (const field of a_fields) {
+            words.push((field === null) ? '_' : String(field));
+        }
+        var body = words.join(' ');
+        console.log( "Send compact VISCA request", url, body );
+
+        return new Promise(
+            function(resolve, reject) {
+                var req = new XMLHttpRequest();
+                req.open('POST', url);
+                // Unlike application/json, text/plain needs no CORS preflight
+                req.setRequestHeader('Content-Type', 'text/plain');
+
+                req.onload = () => {
+                    if (req.readyState === 4) {
+                        if ((req.status === 200) || (req.status === 0)) {
+                            if (req.responseText == 'ok') {
+                                resolve();
+                            }
+                            else {
+                                reject(req.responseText);
+                            }
+                        } else {
+                            reject('Error from server: ' + req.statusText);
+                        }
+                    }
+                };
+
+                req.onerror = () => {
+                    reject('Network error');
+                };
+
+                req.send(body);
+              });
+    }
+
+    // Send this.request (pan, tilt or zoom) from a jog or slew button
+    send_button_request() {
+        return this.send_compact_request(this.request['command'],
+                                         [this.request['value'], this.request['speed']]);
+    }
+
     //==========================================================================
     // Button onclick handlers for various camera actions
     // TODO: these are incomplete until we figure out what to DO with the results...
@@ -694,7 +744,7 @@ class ViscaJogCameraController extends ViscaCameraController {
         e.currentTarget.setPointerCapture(e.pointerId);
         if (this.actionState == 'JOG') {
             // Jog: send command, start timer to repeat jog
-            this.send_visca_request(this.request)
+            this.send_button_request()
                 .then((response) => {
                     if (this.actionState == 'JOG') {
                         // If button still active, start a timer to repeat jog.
@@ -710,7 +760,7 @@ class ViscaJogCameraController extends ViscaCameraController {
         }
         else {
             // slew: send start command
-            this.send_visca_request(this.request)
+            this.send_button_request()
                 .then((response) => {
                     console.log('mousedown slew success');
                 })
@@ -731,7 +781,7 @@ class ViscaJogCameraController extends ViscaCameraController {
         }
         else if (this.actionState == 'SLEW') {
             this.request['value'] = 'stop';
-            this.send_visca_request(this.request)
+            this.send_button_request()
                 .then((response) => {
                     console.log('mouseup stopped slew');
                 })
@@ -747,7 +797,7 @@ class ViscaJogCameraController extends ViscaCameraController {
     on_timer() {
         if (this.actionState == 'JOG') {
             console.log('timer: repeat jog');
-            this.send_visca_request(this.request)
+            this.send_button_request()
                 .then((response) => {
                     console.log('jog timer success. Restarting timer');
                     this.jogTimer = window.setTimeout(this.on_timer.bind(this), this.jog_repeat);
@@ -778,6 +828,12 @@ class ViscaJoystickCameraController extends ViscaCameraController {
 
 //==========================================================================
 // Joystick pan/tilt: velocity set by distance from axis
+//
+// Sends the desired velocity to the server's "velocity" command only when it
+// changes. The server ramps the camera's speed toward it, so motion is smooth
+// however coarse or bursty our updates are. While the stick is held we
+// repeat the velocity every second, since the server stops a camera whose
+// client has gone quiet.
 class JoystickPTZ {
     constructor(a_canvas_id, a_visca_controller) {
         this.canvas_id = a_canvas_id;
@@ -786,19 +842,17 @@ class JoystickPTZ {
         this.tilt_max   = a_visca_controller.slew_tilt_max;
         this.dead_limit = 5;    // deadband half-width
 
-        // Requested values set by mouse down, mouse move
+        // Requested velocities -1 to +1 set by mouse down, mouse move.
+        // Positive is left and up, as seen by the camera.
         this.active = false;
-        this.desired_d_pan = 'stop';
-        this.desired_v_pan = 0;
-        this.desired_d_tilt = 'stop';
-        this.desired_v_tilt = 0;
+        this.desired_pan = 0;
+        this.desired_tilt = 0;
 
         // Set by communications
         this.in_progress = false;
-        this.last_d_pan = 'stop';
-        this.last_v_pan = 0;
-        this.last_d_tilt = 'stop';
-        this.last_v_tilt = 0;
+        this.last_pan = 0;
+        this.last_tilt = 0;
+        this.keepalive = null;
 
         this.connect();
     }
@@ -811,12 +865,11 @@ class JoystickPTZ {
             if (e.button === 0) {
                 c.setPointerCapture(e.pointerId);
                 this.in_progress = false;
-                this.last_d_pan = 'stop';
-                this.last_v_pan = 0;
-                this.last_d_tilt = 'stop';
-                this.last_v_tilt = 0;
+                this.last_pan = 0;
+                this.last_tilt = 0;
 
                 this.active = true;
+                this.keepalive = setInterval(() => { this.do_joy_comm(true); }, 1000);
                 this.do_joy_action(e);
             }
         });
@@ -830,23 +883,29 @@ class JoystickPTZ {
         c.addEventListener("pointerup", (e) => {
             c.releasePointerCapture(e.pointerId);
             if (this.active) {
-                this.active = false;
+                this.stop_joy();
                 console.log('Pointerup: stop');
 
-                var ctx = c.getContext("2d");
-                ctx.clearRect(0, 0, c.width, c.height);
-
-                this.desired_d_pan = 'stop';
-                this.desired_v_pan = 0;
-                this.desired_d_tilt = 'stop';
-                this.desired_v_tilt = 0;
+                this.desired_pan = 0;
+                this.desired_tilt = 0;
                 // Perform the action when we can
-                this.do_joy_comm();
+                this.do_joy_comm(false);
             }
         });
     }
 
-    // Convert a mouse position to desired pan and tilt directions and velocities
+    // Stop tracking the mouse
+    stop_joy() {
+        this.active = false;
+        clearInterval(this.keepalive);
+        this.keepalive = null;
+
+        var c = document.getElementById(this.canvas_id);
+        var ctx = c.getContext("2d");
+        ctx.clearRect(0, 0, c.width, c.height);
+    }
+
+    // Convert a mouse position to desired pan and tilt velocities
     do_joy_action(e) {
         var c = document.getElementById(this.canvas_id);
         var half_width = c.width/2;
@@ -866,94 +925,60 @@ class JoystickPTZ {
         ctx.arc(e.offsetX, e.offsetY, this.dead_limit/2, 0, 2*Math.PI);
         ctx.fill();
 
-        // Convert mouse position to pan and tilt velocities
-        this.desired_d_pan = 'stop';
-        this.desired_v_pan = 0;
+        // Convert mouse position to pan and tilt velocities.
+        // At least on the VC520 PRO, squaring gives TOO MUCH space to slow-speed,
+        // so velocity is linear in distance.
+        this.desired_pan = 0;
         if (x > this.dead_limit) {
-            this.desired_d_pan = 'right';
-            this.desired_v_pan = (x - this.dead_limit)/(half_width - this.dead_limit);
+            this.desired_pan = -(x - this.dead_limit)/(half_width - this.dead_limit);
         }
         else if (x < -this.dead_limit) {
-            this.desired_d_pan = 'left';
-            this.desired_v_pan = -(x + this.dead_limit)/(half_width - this.dead_limit);
+            this.desired_pan = -(x + this.dead_limit)/(half_width - this.dead_limit);
         }
-        // Square the 0 to 1 velocity value to give finer slow-speed resolution
-        //this.desired_v_pan = (this.desired_v_pan < 1.0)
-        //        ? Math.round(this.desired_v_pan*this.desired_v_pan*this.pan_max)
-        //        : this.pan_max;
-        // At least on the VC520 PRO, squaring gives TOO MUCH space to slow-speed
-        this.desired_v_pan = (this.desired_v_pan < 1.0)
-                ? Math.round(this.desired_v_pan*this.pan_max)
-                : this.pan_max;
-
-        this.desired_d_tilt = 'stop';
-        this.desired_v_tilt = 0;
+
+        this.desired_tilt = 0;
         if (y > this.dead_limit) {
-            this.desired_d_tilt = 'up';
-            this.desired_v_tilt = (y - this.dead_limit)/(half_height - this.dead_limit);
+            this.desired_tilt = (y - this.dead_limit)/(half_height - this.dead_limit);
         }
         else if (y < -this.dead_limit) {
-            this.desired_d_tilt = 'down';
-            this.desired_v_tilt = -(y + this.dead_limit)/(half_height - this.dead_limit);
+            this.desired_tilt = (y + this.dead_limit)/(half_height - this.dead_limit);
         }
-        // Square the -1 to +1 value to give finer slow-speed resolution
-        //this.desired_v_tilt = (this.desired_v_tilt < 1.0)
-        //        ? Math.round(this.desired_v_tilt*this.desired_v_tilt*this.tilt_max)
-        //        : this.tilt_max;
-        // At least on the VC520 PRO, squaring gives TOO MUCH space to slow-speed
-        this.desired_v_tilt = (this.desired_v_tilt < 1.0)
-                ? Math.round(this.desired_v_tilt*this.tilt_max)
-                : this.tilt_max;
-
-        var text = 'Desired do_joy_action ' + this.desired_d_pan + '(' + this.desired_v_pan + ') ' +
-                   this.desired_d_tilt + '(' + this.desired_v_tilt + ')';
+
+        // Two decimal places is finer than the camera's speed steps
+        this.desired_pan  = Math.round(Math.max(-1, Math.min(1, this.desired_pan))*100)/100;
+        this.desired_tilt = Math.round(Math.max(-1, Math.min(1, this.desired_tilt))*100)/100;
+
+        var text = 'Desired do_joy_action pan ' + this.desired_pan + ' tilt ' + this.desired_tilt;
         console.log(text);
 
         // See if we can start the action
-        this.do_joy_comm();
+        this.do_joy_comm(false);
     }
 
-    // If communications isn't busy, and a change has been requested, tell the
-    // server to move the camera
-    do_joy_comm() {
+    // If communications isn't busy, and a change has been requested
+    // (or a_repeat is set), tell the server the desired velocity
+    do_joy_comm(a_repeat) {
         if ((!this.in_progress) &&
-           ((this.desired_v_pan != this.last_v_pan) || (this.desired_v_tilt != this.last_v_tilt) ||
-            (this.desired_d_pan != this.last_d_pan) || (this.desired_d_tilt != this.last_d_tilt)))
+            (a_repeat || (this.desired_pan != this.last_pan) || (this.desired_tilt != this.last_tilt)))
         {
             // Able to make a change, and change has been requested
             this.in_progress = true;
-            this.last_d_pan = this.desired_d_pan;
-            this.last_v_pan = this.desired_v_pan;
-            this.last_d_tilt = this.desired_d_tilt;
-            this.last_v_tilt = this.desired_v_tilt;
-
-            var text = 'do_joy_comm ' + this.desired_d_pan + '(' + this.desired_v_pan + ') ' +
-                        this.desired_d_tilt + '(' + this.desired_v_tilt + ')';
-            console.log(text);
-
-            var request = {};
-            request['command'] = 'slew';
-            request['pan-value'] = this.desired_d_pan;
-            request['pan-speed'] = this.desired_v_pan;
-            request['tilt-value'] = this.desired_d_tilt;
-            request['tilt-speed'] = this.desired_v_tilt;
-            this.visca_controller.send_visca_request(request)
+            this.last_pan = this.desired_pan;
+            this.last_tilt = this.desired_tilt;
+
+            // Fields: pan, tilt, zoom, pan-max, tilt-max
+            this.visca_controller.send_compact_request('velocity',
+                [this.desired_pan, this.desired_tilt, null, this.pan_max, this.tilt_max])
                 .then((response) => {
                     // No longer busy. Check to see if anything has changed.
                     this.in_progress = false;
-                    this.do_joy_comm();
+                    this.do_joy_comm(false);
                 })
                 .catch((a_error) => {
-                    this.show_result('Failed joystick slew: ' + a_error);
-                    // TODO: try to send stop? release capture? Mark idle?
-                    console.log('ERROR: joystick slew failed');
-                    var c = document.getElementById(this.canvas_id);
-
-                    var ctx = c.getContext("2d");
-                    ctx.clearRect(0, 0, c.width, c.height);
-                    c.releasePointerCapture(e.pointerId);
+                    this.visca_controller.show_result('Failed joystick velocity: ' + a_error);
+                    console.log('ERROR: joystick velocity failed');
+                    this.stop_joy();
                     this.in_progress = false;
-                    this.active = false;
                 })
         }
     }
@@ -961,6 +986,7 @@ class JoystickPTZ {
 
 //==========================================================================
 // Joystick zoom: velocity set by distance from axis
+// Sends velocities to the server like JoystickPTZ
 class JoystickZoom {
     constructor(a_canvas_id, a_visca_controller) {
         this.canvas_id = a_canvas_id;
@@ -968,15 +994,15 @@ class JoystickZoom {
         this.zoom_max   = 7;    // Max in Sony definition; max for Vaddio HD-20
         this.dead_limit = 10;   // deadband half-width
 
-        // Requested values set by mouse down, mouse move
+        // Requested velocity -1 to +1 set by mouse down, mouse move.
+        // Positive is in.
         this.active = false;
-        this.desired_d_zoom = 'stop';
-        this.desired_v_zoom = 0;
+        this.desired_zoom = 0;
 
         // Set by communications
         this.in_progress = false;
-        this.last_d_zoom = 'stop';
-        this.last_v_zoom = 0;
+        this.last_zoom = 0;
+        this.keepalive = null;
 
         this.connect();
     }
@@ -989,10 +1015,10 @@ class JoystickZoom {
             if (e.button === 0) {
                 c.setPointerCapture(e.pointerId);
                 this.in_progress = false;
-                this.last_d_zoom = 'stop';
-                this.last_v_zoom = 0;
+                this.last_zoom = 0;
 
                 this.active = true;
+                this.keepalive = setInterval(() => { this.do_joy_comm(true); }, 1000);
                 this.do_joy_action(e);
             }
         });
@@ -1006,26 +1032,32 @@ class JoystickZoom {
         c.addEventListener("pointerup", (e) => {
             c.releasePointerCapture(e.pointerId);
             if (this.active) {
-                this.active = false;
+                this.stop_joy();
                 console.log('Pointerup: stop');
 
-                var ctx = c.getContext("2d");
-                ctx.clearRect(0, 0, c.width, c.height);
-
-                this.desired_d_zoom = 'stop';
-                this.desired_v_zoom = 0;
+                this.desired_zoom = 0;
                 // Perform the action when we can
-                this.do_joy_comm();
+                this.do_joy_comm(false);
             }
         });
     }
 
-    // Convert a mouse position to desired zoom direction and velocity
+    // Stop tracking the mouse
+    stop_joy() {
+        this.active = false;
+        clearInterval(this.keepalive);
+        this.keepalive = null;
+
+        var c = document.getElementById(this.canvas_id);
+        var ctx = c.getContext("2d");
+        ctx.clearRect(0, 0, c.width, c.height);
+    }
+
+    // Convert a mouse position to desired zoom velocity
     do_joy_action(e) {
         var c = document.getElementById(this.canvas_id);
         var half_width  = c.width/2;
         var half_height = c.height/2;
-        let x = Math.min(e.offsetX, c.width) - half_width;
         let y = half_height - Math.min(e.offsetY, c.height);
 
         // Draw a line from center to mouse
@@ -1041,62 +1073,44 @@ class JoystickZoom {
         ctx.fill();
 
         // Convert mouse position to zoom velocity
-        this.desired_d_zoom = 'stop';
-        this.desired_v_zoom = 0;
+        this.desired_zoom = 0;
         if (y > this.dead_limit) {
-            this.desired_d_zoom = 'in';
-            this.desired_v_zoom = (y - this.dead_limit)/(half_height - this.dead_limit);
+            this.desired_zoom = (y - this.dead_limit)/(half_height - this.dead_limit);
         }
         else if (y < -this.dead_limit) {
-            this.desired_d_zoom = 'out';
-            this.desired_v_zoom = -(y + this.dead_limit)/(half_height - this.dead_limit);
+            this.desired_zoom = (y + this.dead_limit)/(half_height - this.dead_limit);
         }
-        this.desired_v_zoom = (this.desired_v_zoom < 1.0)
-                ? Math.round(this.desired_v_zoom*this.zoom_max)
-                : this.zoom_max;
+        this.desired_zoom = Math.round(Math.max(-1, Math.min(1, this.desired_zoom))*100)/100;
 
-        var text = 'Desired do_joy_action ' + this.desired_d_zoom + '(' + this.desired_v_zoom + ')';
+        var text = 'Desired do_joy_action zoom ' + this.desired_zoom;
         console.log(text);
 
         // See if we can start the action
-        this.do_joy_comm();
+        this.do_joy_comm(false);
     }
 
-    // If communications isn't busy, and a change has been requested, tell the
-    // server to move the camera
-    do_joy_comm() {
-        if ((!this.in_progress) &&
-           ((this.desired_v_zoom != this.last_v_zoom) || (this.desired_d_zoom != this.last_d_zoom)))
+    // If communications isn't busy, and a change has been requested
+    // (or a_repeat is set), tell the server the desired velocity
+    do_joy_comm(a_repeat) {
+        if ((!this.in_progress) && (a_repeat || (this.desired_zoom != this.last_zoom)))
         {
             // Able to make a change, and change has been requested
             this.in_progress = true;
-            this.last_d_zoom = this.desired_d_zoom;
-            this.last_v_zoom = this.desired_v_zoom;
-
-            var text = 'do_joy_comm ' + this.desired_d_zoom + '(' + this.desired_v_zoom + ')';
-            console.log(text);
-
-            var request = {};
-            request['command'] = 'zoom';
-            request['value'] = this.desired_d_zoom;
-            request['speed'] = this.desired_v_zoom;
+            this.last_zoom = this.desired_zoom;
 
-            this.visca_controller.send_visca_request(request)
+            // Fields: pan, tilt, zoom, pan-max, tilt-max, zoom-max
+            this.visca_controller.send_compact_request('velocity',
+                [null, null, this.desired_zoom, null, null, this.zoom_max])
                 .then((response) => {
                     // No longer busy. Check to see if anything has changed.
                     this.in_progress = false;
-                    this.do_joy_comm();
+                    this.do_joy_comm(false);
                 })
                 .catch((a_error) => {
-                    this.show_result('Failed joystick slew: ' + a_error);
-                    // TODO: try to send stop? release capture? Mark idle?
-                    console.log('ERROR: joystick slew failed');
-                    var c = document.getElementById(this.canvas_id);
-                    var ctx = c.getContext("2d");
-                    ctx.clearRect(0, 0, c.width, c.height);
-                    c.releasePointerCapture(e.pointerId);
+                    this.visca_controller.show_result('Failed joystick velocity: ' + a_error);
+                    console.log('ERROR: joystick velocity failed');
+                    this.stop_joy();
                     this.in_progress = false;
-                    this.active = false;
                 })
         }
     }
@@ -1104,14 +1118,16 @@ class JoystickZoom {
 
 //==========================================================================
 // Save and Load presets
+// The server visits or programs all of a camera's presets in one request,
+// and keeps a copy of their positions. We save them to or load them from
+// a file.
 class SaveAndLoadPresets {
     constructor(a_visca_controller, a_result_text, a_wait_for_movement_msec) {
         this.visca_controller = a_visca_controller;
         this.result_text = a_result_text;
+        // No longer used: the server waits for the camera to stop moving
         this.wait_for_preset = a_wait_for_movement_msec;
-        this.presetTimer = null;
         this.presets = [];
-        this.cancel = false;
         this.isActive = false;
     }
 
@@ -1119,48 +1135,45 @@ class SaveAndLoadPresets {
         this.result_text.innerHTML = a_text;
     }
 
+    // Have the server stop after its current preset. The capture or
+    // restore request then reports what was done.
     request_cancel() {
-        this.cancel = true;
+        this.show_result('Canceling after this preset...');
+
+        var request = {};
+        request['command'] = 'cancel-presets';
+        this.visca_controller.send_visca_request(request)
+            .catch((a_error) => {
+                this.show_result('Failed canceling: ' + a_error);
+            });
     }
 
+    // Have the server visit presets a_preset_number to max_preset,
+    // and save their positions to a file.
+    // Some cameras allow preset 0, some don't: the server skips any the
+    // camera rejects. (Aver VC520+ NEVER returns an error: it just
+    // interprets anything higher than 10 as preset 10.)
     get_next_preset(a_preset_number) {
-        if (this.cancel) {
-            this.finish("Canceled saving presets");
-            return;
-        }
-
         this.isActive = true;
-        this.show_result('Saving preset ' + a_preset_number);
+        this.show_result('Saving presets ' + a_preset_number + ' to ' +
+                         this.visca_controller.max_preset);
 
         var request = {};
-        request['command'] = 'go-preset';
-        request['value'] = a_preset_number;
+        request['command'] = 'capture-presets';
+        request['first'] = a_preset_number;
+        request['last'] = this.visca_controller.max_preset;
         this.visca_controller.send_visca_request(request)
             .then((response) => {
-                console.log('Got preset ' + request['value']);
-                // Wait for the camera to move before reading its position
-                this.presetTimer = window.setTimeout(this.on_save_preset_timer.bind(this),
-                                                     this.wait_for_preset,
-                                                     a_preset_number);
+                if (response['canceled']) {
+                    this.finish('Canceled saving presets after ' +
+                                response['presets'].length + ' presets');
+                    return;
+                }
+                this.presets = response['presets'];
+                this.save_preset_file();
             })
             .catch((a_error) => {
-                if (this.a_preset_number == 0) {
-                    // Some cameras allow preset 0, some don't. Try 1
-                    this.get_next_preset(1);
-                }
-                else {
-                    // For any other error, save results thus far and stop.
-                    // (Ideally, we would parse the error and look for
-                    // an explicit "reset number out of range", but our visca
-                    // server currently doesn't return it nicely, and it isn't
-                    // clear that camera from different vendors report the
-                    // error in the same way.)
-                    // Actually, Aver VC520+ NEVER returns an error: it just
-                    // interprets anything higher than 10 as preset 10.
-                    window.clearTimeout(this.presetTimer);
-                    this.presetTimer = null;
-                    this.save_preset_file();
-                }
+                this.finish('Failed saving presets: ' + a_error);
             });
     }
 
@@ -1176,94 +1189,29 @@ class SaveAndLoadPresets {
         this.finish("Finished saving presets");
     }
 
-    on_save_preset_timer(a_preset_number) {
-        // Read the camera's position and zoom
-        this.presetTimer = null;
-
-        var request = {};
-        request['command'] = 'report';
-        this.visca_controller.send_visca_request(request)
-            .then((response) => {
-                // Save the info for this preset
-                var pre = {"preset":a_preset_number,
-                           "pan":response['pan'],
-                           "tilt":response['tilt'],
-                           "zoom":response['zoom']};
-                this.presets.push(pre);
-
-                if (a_preset_number < this.visca_controller.max_preset) {
-                    this.get_next_preset(a_preset_number+1);
-                }
-                else {
-                    this.save_preset_file();
-                }
-            })
-            .catch((a_error) => {
-                this.finish('Failed read position: ' + a_error);
-            });
-    }
-
-    // Convert JSON preset data and start setting presets
+    // Convert JSON preset data and have the server set the presets
     load(a_json_string) {
         this.isActive = true;
         this.presets = JSON.parse(a_json_string);
-        this.move_to_next_preset(0);
-    }
-
-    // Move to the position specified by presets[a_preset_index]
-    move_to_next_preset(a_preset_index) {
-        if (this.cancel) {
-            this.finish("Canceled loading presets");
-            return;
-        }
+        this.show_result('Loading ' + this.presets.length + ' presets');
 
         var request = {};
-        request['command'] = 'moveto';
-        request['pan']  = this.presets[a_preset_index].pan;
-        request['tilt'] = this.presets[a_preset_index].tilt;
-        request['zoom'] = this.presets[a_preset_index].zoom;
-        this.show_result('Loading preset ' + this.presets[a_preset_index].preset);
-        this.visca_controller.send_visca_request(request)
-            .then((response) => {
-                console.log('Moved to preset[' + a_preset_index + ']');
-                // Wait for the camera to move before saving as preset
-                this.presetTimer = window.setTimeout(this.on_load_preset_timer.bind(this),
-                                                     this.wait_for_preset,
-                                                     a_preset_index);
-            })
-            .catch((a_error) => {
-                this.finish('Failed move: ' + a_error);
-                window.clearTimeout(this.presetTimer);
-                this.presetTimer = null;
-            });
-    }
-
-    on_load_preset_timer(a_preset_index) {
-        if (this.cancel) {
-            this.finish("Canceled loading presets");
-            return;
-        }
-
-        // Set a camera preset
-        this.presetTimer = null;
-
-        var request = {};
-        request['command'] = 'set-preset';
-        request['value'] = this.presets[a_preset_index].preset;
+        request['command'] = 'restore-presets';
+        request['presets'] = this.presets;
         this.visca_controller.send_visca_request(request)
             .then((response) => {
-                console.log('Loaded preset ' + request['value']);
-                a_preset_index = a_preset_index + 1;
-                if (a_preset_index < this.presets.length) {
-                    this.show_result('Loaded preset ' + request['value']);
-                    this.move_to_next_preset(a_preset_index);
+                var text = "Finished loading presets";
+                if (response['canceled']) {
+                    text = 'Canceled loading presets after ' +
+                           response['restored'].length + ' presets';
                 }
-                else {
-                    this.finish("Finished loading presets");
+                if (response['skipped'].length > 0) {
+                    text += '. Failed: ' + response['skipped'].join(', ');
                 }
+                this.finish(text);
             })
             .catch((a_error) => {
-                this.finish('Failed set preset: ' + a_error);
+                this.finish('Failed loading presets: ' + a_error);
             });
     }
 }
@@ -0,0 +1,362 @@
+# Latency benchmark for visca-server.py
+#
+# Drives the server over HTTP, timing each command end to end, and reports
+# p50/p95/p99 latency and throughput for each command type. Results can be
+# written as JSON, and compared with an earlier run to spot regressions.
+#
+# Either benchmark a server that is already running:
+#   python visca-bench.py --server 127.0.0.1:8080 --camera 1
+# or let the benchmark start visca-sim.py and visca-server.py itself, once
+# for each transport and serial baud rate:
+#   python visca-bench.py --spawn --transports serial udp tcp raw-udp --bauds 9600 38400
+#
+# Benchmarking moves the camera, and programs presets 1 and 2.
+
+import sys
+import os
+import time
+import json
+import argparse
+import datetime
+import subprocess
+import tempfile
+import threading
+import http.client
+import platform
+
+g_version = "1.0"
+
+# Command types we can benchmark, in the order reported
+COMMANDS = ['report', 'moveto', 'go-preset', 'jog', 'zoom-jog', 'slew']
+
+# Two positions we move between
+POSITIONS = [{"pan": 200, "tilt": 50, "zoom": 1000},
+             {"pan": -200, "tilt": 0, "zoom": 2000}]
+
+#==============================================================================
+# HTTP client for one benchmark thread, keeping its connection open if the
+# server allows
+class Client:
+    def __init__(self, a_server):
+        host, _, port = a_server.partition(':')
+        self.connection = http.client.HTTPConnection(host, int(port or 8080), timeout=60)
+
+    #===========================================================================
+    # POST a command, returning the response dict
+    def post(self, a_request):
+        body = json.dumps(a_request)
+        self.connection.request('POST', '/server', body,
+                                {'Content-Type': 'application/json'})
+        response = self.connection.getresponse()
+        data = response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+        if response.status != 200:
+            return {'status': 'fail', 'errors': [f'HTTP {response.status}']}
+        return json.loads(data)
+
+#==============================================================================
+# Build the request(s) for iteration a_index of a command type.
+# Most are one request; a slew is a start and a stop.
+def requests_for(a_command, a_camera, a_index):
+    position = POSITIONS[a_index % 2]
+    if a_command == 'report':
+        return [{"command": "report", "camera": a_camera}]
+    if a_command == 'moveto':
+        return [dict(position, command="moveto", camera=a_camera, speed=24)]
+    if a_command == 'go-preset':
+        return [{"command": "go-preset", "camera": a_camera, "value": 1 + a_index % 2}]
+    if a_command == 'jog':
+        return [{"command": "pan", "camera": a_camera,
+                 "value": 10 if a_index % 2 else -10, "speed": 10}]
+    if a_command == 'zoom-jog':
+        return [{"command": "zoom", "camera": a_camera,
+                 "value": 50 if a_index % 2 else -50}]
+    if a_command == 'slew':
+        direction = 'left' if a_index % 2 else 'right'
+        return [{"command": "slew", "camera": a_camera,
+                 "pan-value": direction, "pan-speed": 10,
+                 "tilt-value": "stop", "tilt-speed": 0},
+                {"command": "slew", "camera": a_camera,
+                 "pan-value": "stop", "pan-speed": 0,
+                 "tilt-value": "stop", "tilt-speed": 0}]
+    raise ValueError(a_command)
+
+#==============================================================================
+# Program presets 1 and 2, so go-preset has somewhere to go
+def setup_presets(a_server, a_camera):
+    client = Client(a_server)
+    for ix, position in enumerate(POSITIONS):
+        client.post(dict(position, command="moveto", camera=a_camera, speed=24))
+        time.sleep(1.5)
+        client.post({"command": "set-preset", "camera": a_camera, "value": ix + 1})
+
+#==============================================================================
+# Value at percentile a_pct of sorted list a_values, by nearest rank
+def percentile(a_values, a_pct):
+    if not a_values:
+        return None
+    rank = max(1, int(round(a_pct / 100.0 * len(a_values))))
+    return a_values[min(rank, len(a_values)) - 1]
+
+#==============================================================================
+# Run a_count iterations of a_command on a_clients threads.
+# Return a result dict with latency statistics in milliseconds.
+def run_command(a_server, a_camera, a_command, a_count, a_clients):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    next_index = [0]
+
+    def worker():
+        client = Client(a_server)
+        while True:
+            with lock:
+                index = next_index[0]
+                if index >= a_count:
+                    return
+                next_index[0] += 1
+            started = time.perf_counter()
+            ok = True
+            for request in requests_for(a_command, a_camera, index):
+                try:
+                    response = client.post(request)
+                    ok = ok and (response.get('status') == 'ok')
+                except Exception:
+                    ok = False
+                    client = Client(a_server)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed * 1000.0)
+                if not ok:
+                    errors.append(index)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(a_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    result = {}
+    result['command']  = a_command
+    result['camera']   = a_camera
+    result['count']    = len(latencies)
+    result['clients']  = a_clients
+    result['errors']   = len(errors)
+    result['p50_ms']   = round(percentile(latencies, 50), 2)
+    result['p95_ms']   = round(percentile(latencies, 95), 2)
+    result['p99_ms']   = round(percentile(latencies, 99), 2)
+    result['mean_ms']  = round(sum(latencies) / len(latencies), 2)
+    result['max_ms']   = round(latencies[-1], 2)
+    result['throughput_per_sec'] = round(len(latencies) / wall, 2)
+    return result
+
+#==============================================================================
+# Run all selected commands against one server and camera
+def run_suite(a_server, a_camera, a_options, a_labels):
+    results = []
+    if 'go-preset' in a_options.commands:
+        setup_presets(a_server, a_camera)
+
+    for command in COMMANDS:
+        if command not in a_options.commands:
+            continue
+        result = run_command(a_server, a_camera, command, a_options.count, a_options.clients)
+        result.update(a_labels)
+        results.append(result)
+        print_result(result)
+    return results
+
+#==============================================================================
+def print_header():
+    print(f'{"transport":10} {"baud":>7} {"command":10} {"count":>5} {"err":>4} '
+          f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8} {"per sec":>8}')
+
+def print_result(a_result):
+    baud = a_result.get('baud') or '-'
+    print(f'{a_result.get("transport", "-"):10} {baud:>7} {a_result["command"]:10} '
+          f'{a_result["count"]:>5} {a_result["errors"]:>4} '
+          f'{a_result["p50_ms"]:>8} {a_result["p95_ms"]:>8} {a_result["p99_ms"]:>8} '
+          f'{a_result["max_ms"]:>8} {a_result["throughput_per_sec"]:>8}')
+
+#==============================================================================
+# Get the server's "about" response, waiting up to a_timeout for it to start.
+# If we started the server as a_process, stop waiting if it exits.
+# Throws RuntimeError, with the server's error output, if it doesn't start
+def get_about(a_server, a_timeout=10, a_process=None):
+    deadline = time.monotonic() + a_timeout
+    while True:
+        try:
+            return Client(a_server).post({"command": "about"})
+        except OSError as exc:
+            exited = (a_process is not None) and (a_process.poll() is not None)
+            if exited or (time.monotonic() > deadline):
+                if a_process is None:
+                    raise
+                a_process.log.seek(0)
+                raise RuntimeError(f'visca-server.py did not start ({exc}):\n' +
+                                   a_process.log.read().decode(errors='replace'))
+            time.sleep(0.2)
+
+#==============================================================================
+# Start visca-sim.py and visca-server.py for one transport and baud rate.
+# Return the processes and the camera address to use.
+def spawn(a_transport, a_baud, a_options):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sim_args = [sys.executable, os.path.join(here, 'visca-sim.py'),
+                '--baud', str(a_baud or 9600)] + a_options.sim_args.split()
+    if a_transport == 'serial':
+        sim_args += ['--serial', '1']
+    else:
+        sim_args += ['--' + a_transport, a_options.sim_ip]
+
+    sim = subprocess.Popen(sim_args, stdout=subprocess.PIPE, text=True)
+    port = 'UDP'
+    camera = a_options.sim_ip
+    # Wait for the simulator to say where its cameras are
+    while True:
+        line = sim.stdout.readline()
+        if not line:
+            raise RuntimeError('visca-sim.py failed to start')
+        if line.startswith('Serial cameras'):
+            port = line.split(' on ')[1].split()[0]
+            camera = '1'
+            break
+        if line.startswith(('UDP camera', 'TCP camera', 'Raw UDP camera')):
+            break
+
+    server_port = a_options.server.partition(':')[2] or '8080'
+    server_args = [sys.executable, os.path.join(here, 'visca-server.py'),
+                   port, str(a_baud or 9600), server_port]
+    if a_transport != 'serial':
+        # The server calls Sony VISCA over IP "visca-ip"
+        server_args += ['--ip-transport', {'udp': 'visca-ip'}.get(a_transport, a_transport)]
+
+    # The server's output goes to a file, for get_about to show if it
+    # doesn't start. (A pipe nobody reads could fill and stall the server.)
+    log = tempfile.TemporaryFile()
+    server = subprocess.Popen(server_args, stdout=log, stderr=subprocess.STDOUT)
+    server.log = log
+    return sim, server, camera
+
+#==============================================================================
+# Print the change from an earlier run, matching results by
+# transport, baud, command and camera
+def compare(a_results, a_filename):
+    with open(a_filename, encoding='utf-8') as f:
+        old = json.load(f)
+
+    def key(a_result):
+        return (a_result.get('transport'), a_result.get('baud'),
+                a_result['command'], a_result['camera'])
+
+    old_results = {key(r): r for r in old['results']}
+    print(f'\nCompared with {a_filename} (server {old.get("server", {}).get("version")})')
+    print(f'{"transport":10} {"baud":>7} {"command":10} {"p50 change":>11} {"p95 change":>11}')
+    for result in a_results:
+        before = old_results.get(key(result))
+        if before is None:
+            continue
+        changes = []
+        for field in ('p50_ms', 'p95_ms'):
+            if before[field]:
+                changes.append(f'{100.0 * (result[field] - before[field]) / before[field]:+10.1f}%')
+            else:
+                changes.append(f'{"-":>11}')
+        baud = result.get('baud') or '-'
+        print(f'{result.get("transport", "-"):10} {baud:>7} {result["command"]:10} '
+              f'{changes[0]:>11} {changes[1]:>11}')
+
+#==============================================================================
+# argparse type for a count that must be at least 1
+def positive_int(a_value):
+    try:
+        value = int(a_value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid int value: {a_value!r}')
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, not {value}')
+    return value
+
+#==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description='Latency benchmark for visca-server.py.')
+    parser.add_argument('--server', default='127.0.0.1:8080',
+                        help='server host:port. Default 127.0.0.1:8080')
+    parser.add_argument('--camera', action='append',
+                        help='camera address to benchmark; may be repeated. Default 1')
+    parser.add_argument('--commands', nargs='*', default=COMMANDS, choices=COMMANDS,
+                        help='command types to benchmark. Default all')
+    parser.add_argument('--count', type=positive_int, default=50,
+                        help='iterations of each command. Default 50')
+    parser.add_argument('--clients', type=positive_int, default=1,
+                        help='concurrent clients. Default 1')
+    parser.add_argument('--spawn', action='store_true',
+                        help='start visca-sim.py and visca-server.py for each transport and baud')
+    parser.add_argument('--transports', nargs='*', default=['serial', 'udp'],
+                        choices=['serial', 'udp', 'tcp', 'raw-udp'],
+                        help='with --spawn: transports to benchmark: serial, udp (Sony VISCA '
+                             'over IP), tcp or raw-udp. Default serial udp')
+    parser.add_argument('--bauds', nargs='*', type=int, default=[9600],
+                        help='with --spawn: serial baud rates. Default 9600')
+    parser.add_argument('--sim-ip', default='127.0.0.2',
+                        help='with --spawn: IP address for the IP camera. Default 127.0.0.2')
+    parser.add_argument('--sim-args', default='',
+                        help='with --spawn: extra arguments for visca-sim.py, '
+                             'such as "--late-completion preset"')
+    parser.add_argument('--label', default=None,
+                        help='transport label for results without --spawn')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write results to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare results with an earlier --json FILE')
+    options = parser.parse_args()
+
+    print(f'visca-bench version {g_version}')
+    results = []
+    about = None
+    print_header()
+    if options.spawn:
+        for transport in options.transports:
+            bauds = options.bauds if transport == 'serial' else [None]
+            for baud in bauds:
+                sim, server, camera = spawn(transport, baud, options)
+                try:
+                    about = get_about(options.server, a_process=server)
+                    results += run_suite(options.server, camera, options,
+                                         {'transport': transport, 'baud': baud})
+                finally:
+                    server.terminate()
+                    sim.terminate()
+                    server.wait()
+                    sim.wait()
+                    server.log.close()
+    else:
+        about = get_about(options.server)
+        for camera in options.camera or ['1']:
+            transport = options.label or ('udp' if len(camera) > 3 else 'serial')
+            baud = about.get('baud_rate') if transport == 'serial' else None
+            results += run_suite(options.server, camera, options,
+                                 {'transport': transport, 'baud': baud})
+
+    if options.json:
+        output = {}
+        output['benchmark_version'] = g_version
+        output['time']     = datetime.datetime.now().isoformat(timespec='seconds')
+        output['platform'] = platform.platform()
+        output['python']   = platform.python_version()
+        output['server']   = about
+        output['results']  = results
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=4)
+        print(f'Results written to {options.json}')
+
+    if options.compare:
+        compare(results, options.compare)
+
+#==============================================================================
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# Replay a capture made by visca-server.py --capture
+#
+# Sends each VISCA message in the capture to a camera again, at its original
+# timing or faster, and compares the replies and latency with the original.
+# Use it to turn a misbehaving camera's traffic into a repeatable test,
+# against visca-sim.py or a real camera.
+#
+# List a capture:
+#   python visca-replay.py capture.vcap --list
+# Replay serial traffic on a port, and UDP traffic to the original cameras:
+#   python visca-replay.py capture.vcap --serial COM3 --baud 9600
+# Replay IP traffic to a simulated camera, four times as fast:
+#   python visca-replay.py capture.vcap --udp-target 127.0.0.2 --speed 4
+# TCP and raw UDP traffic goes to the port it was captured on.
+#
+# Exchanges are replayed one at a time, in the order they started, so
+# commands that overlapped in the original (such as to two cameras on one
+# serial chain) are sent one after the other.
+
+import sys
+import time
+import argparse
+import socket
+import serial
+import visca_codec
+import visca_capture
+
+g_version = "1.0"
+
+#==============================================================================
+# Sends serial messages and collects replies
+class SerialTarget:
+    def __init__(self, a_port, a_baud):
+        self.port = serial.Serial(a_port, a_baud, timeout=0.05, write_timeout=2)
+        self.buffer = bytearray()
+
+    #===========================================================================
+    # Send a_sent, and return the replies within a_timeout seconds, stopping
+    # once there are a_count from its camera
+    def exchange(self, a_sent, a_count, a_timeout):
+        # Replies come from the camera's address + 8
+        reply_address = ((a_sent[0] & 0x0F) + 8) << 4
+        self.port.reset_input_buffer()
+        self.buffer.clear()
+        self.port.write(a_sent)
+
+        replies = []
+        deadline = time.perf_counter() + a_timeout
+        while (len(replies) < a_count) and (time.perf_counter() < deadline):
+            self.buffer += self.port.read(max(1, self.port.in_waiting))
+            while 0xFF in self.buffer:
+                end = self.buffer.index(0xFF) + 1
+                packet = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                if packet[0] == reply_address:
+                    replies.append(packet)
+        return replies
+
+    #===========================================================================
+    def close(self):
+        self.port.close()
+
+#==============================================================================
+# Sends VISCA-over-IP messages and collects replies, with a socket for each
+# camera address
+class UdpTarget:
+    def __init__(self, a_ip, a_port):
+        self.ip = a_ip
+        self.port = a_port
+        self.sockets = {}
+        self.sequence = 0
+
+    #===========================================================================
+    # Send a_sent to a_address (or our own IP, if set), and return the
+    # replies within a_timeout seconds, stopping once there are a_count.
+    # The address may give a port, such as 192.168.0.20:52382.
+    def exchange(self, a_address, a_sent, a_count, a_timeout):
+        ip, _, port = a_address.partition(':')
+        ip = self.ip or ip
+        port = int(port) if port else self.port
+        sock = self.sockets.get((ip, port))
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect((ip, port))
+            self.sockets[(ip, port)] = sock
+
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        sock.send(bytes([0x01, 0x00]) + len(a_sent).to_bytes(2, 'big') +
+                  self.sequence.to_bytes(4, 'big') + a_sent)
+
+        replies = []
+        deadline = time.perf_counter() + a_timeout
+        while len(replies) < a_count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(1024)
+            except socket.timeout:
+                break
+            except OSError:
+                # Such as ICMP port unreachable
+                break
+            # Ignore late replies to earlier messages
+            if (len(data) > 8) and (int.from_bytes(data[4:8], 'big') == self.sequence):
+                replies.append(data[8:])
+        return replies
+
+    #===========================================================================
+    def close(self):
+        for sock in self.sockets.values():
+            sock.close()
+
+#==============================================================================
+# Sends bare VISCA messages to cameras over TCP or in UDP datagrams, with a
+# socket for each camera address (IP:port) of type a_type
+class RawIpTarget:
+    def __init__(self, a_ip, a_type):
+        self.ip = a_ip
+        self.type = a_type
+        self.sockets = {}
+        self.buffer = bytearray()
+
+    #===========================================================================
+    # Send a_sent to a_address, with its IP replaced by our own if set, and
+    # return the replies within a_timeout seconds, stopping once there are a_count
+    def exchange(self, a_address, a_sent, a_count, a_timeout):
+        ip, _, port = a_address.rpartition(':')
+        ip = self.ip or ip
+        sock = self.sockets.get((ip, port))
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, self.type)
+            sock.settimeout(max(a_timeout, 1.0))
+            sock.connect((ip, int(port)))
+            self.sockets[(ip, port)] = sock
+
+        # Discard late replies to earlier messages
+        self.buffer.clear()
+        sock.setblocking(False)
+        try:
+            while sock.recv(1024):
+                pass
+        except OSError:
+            pass
+        sock.send(a_sent)
+
+        replies = []
+        deadline = time.perf_counter() + a_timeout
+        while len(replies) < a_count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(1024)
+            except socket.timeout:
+                break
+            except OSError:
+                # Such as ICMP port unreachable
+                break
+            if not data:
+                break
+            self.buffer += data
+            while 0xFF in self.buffer:
+                end = self.buffer.index(0xFF) + 1
+                replies.append(bytes(self.buffer[:end]))
+                del self.buffer[:end]
+        return replies
+
+    #===========================================================================
+    def close(self):
+        for sock in self.sockets.values():
+            sock.close()
+
+#==============================================================================
+# What kind of reply each of a_packets is: ack, completion, error, or the
+# length of an inquiry reply. Compared instead of the bytes, since positions
+# in replies change from one run to the next.
+def reply_kinds(a_packets):
+    kinds = []
+    for packet in a_packets:
+        if len(packet) < 3:
+            kinds.append('short')
+            continue
+        kind = visca_codec.decode_header(packet).kind
+        if kind == visca_codec.ACK:
+            kinds.append('ack')
+        elif kind == visca_codec.ERROR:
+            kinds.append(visca_codec.describe_error(packet) or 'error')
+        elif len(packet) == 3:
+            kinds.append('completion')
+        else:
+            kinds.append(f'reply {len(packet)}')
+    return kinds
+
+#==============================================================================
+# Value at percentile a_pct of sorted list a_values, by nearest rank
+def percentile(a_values, a_pct):
+    if not a_values:
+        return None
+    rank = max(1, int(round(a_pct / 100.0 * len(a_values))))
+    return a_values[min(rank, len(a_values)) - 1]
+
+#==============================================================================
+# Print each exchange in a capture
+def list_capture(a_exchanges):
+    start = a_exchanges[0].time if a_exchanges else 0
+    for exchange in a_exchanges:
+        print(f'{exchange.time - start:10.3f} '
+              f'{visca_capture.TRANSPORT_NAMES.get(exchange.transport, "?"):9} '
+              f'{exchange.address:15} {exchange.latency * 1000:8.1f} ms  '
+              f'{exchange.sent.hex(" ")}  ->  {exchange.received.hex(" ")}')
+
+#==============================================================================
+# Replay a_exchanges, printing a line for each that differs (or for every
+# one, with a_options.verbose), then a summary
+def replay(a_exchanges, a_options):
+    serial_target = None
+    if a_options.serial:
+        serial_target = SerialTarget(a_options.serial, a_options.baud)
+    udp_target = UdpTarget(a_options.udp_target, a_options.udp_port)
+    raw_targets = {visca_capture.TCP: RawIpTarget(a_options.udp_target, socket.SOCK_STREAM),
+                   visca_capture.RAW_UDP: RawIpTarget(a_options.udp_target, socket.SOCK_DGRAM)}
+
+    original = []
+    replayed = []
+    differ = 0
+    skipped = 0
+    started = time.perf_counter()
+    first = a_exchanges[0].time if a_exchanges else 0
+    try:
+        for ix, exchange in enumerate(a_exchanges):
+            if a_options.speed > 0:
+                delay = started + (exchange.time - first) / a_options.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            expected = visca_capture.split_packets(exchange.received)
+            # Allow for a slower camera, but don't wait for a reply that
+            # never came in the original
+            timeout = max(a_options.timeout, 2 * exchange.latency)
+            if not expected:
+                timeout = 0.05 if exchange.transport != visca_capture.BROADCAST else 0
+
+            sent_at = time.perf_counter()
+            if exchange.transport == visca_capture.UDP:
+                replies = udp_target.exchange(exchange.address, exchange.sent,
+                                              len(expected), timeout)
+            elif exchange.transport in raw_targets:
+                replies = raw_targets[exchange.transport].exchange(
+                    exchange.address, exchange.sent, len(expected), timeout)
+            elif serial_target is not None:
+                replies = serial_target.exchange(exchange.sent, len(expected), timeout)
+            else:
+                skipped += 1
+                continue
+            latency = time.perf_counter() - sent_at
+
+            original.append(exchange.latency * 1000)
+            replayed.append(latency * 1000)
+            same = reply_kinds(replies) == reply_kinds(expected)
+            if not same:
+                differ += 1
+            if a_options.verbose or not same:
+                print(f'{ix:5} {exchange.address:15} {exchange.sent.hex(" ")}: '
+                      f'{exchange.latency * 1000:.1f} -> {latency * 1000:.1f} ms'
+                      + ('' if same else
+                         f'  expected {reply_kinds(expected)}, got {reply_kinds(replies)}'))
+    finally:
+        udp_target.close()
+        for target in raw_targets.values():
+            target.close()
+        if serial_target is not None:
+            serial_target.close()
+
+    print(f'Replayed {len(replayed)} exchanges in {time.perf_counter() - started:.1f} sec: '
+          f'{differ} with different replies')
+    if skipped:
+        print(f'Skipped {skipped} serial exchanges: no --serial port')
+    if replayed:
+        original.sort()
+        replayed.sort()
+        print(f'{"latency ms":12} {"p50":>8} {"p95":>8} {"max":>8}')
+        for name, values in (('original', original), ('replay', replayed)):
+            print(f'{name:12} {percentile(values, 50):8.1f} {percentile(values, 95):8.1f} '
+                  f'{values[-1]:8.1f}')
+    return differ
+
+#==============================================================================
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay VISCA traffic captured by visca-server.py --capture.')
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument('--list', action='store_true',
+                        help='print the exchanges in the capture, and exit')
+    parser.add_argument('--serial',
+                        help='serial port for serial and broadcast exchanges. '
+                             'Without it, they are skipped')
+    parser.add_argument('--baud', type=int, default=9600,
+                        help='serial baud rate. Default 9600')
+    parser.add_argument('--udp-target',
+                        help='send all IP exchanges (UDP, TCP and raw UDP) to this IP '
+                             'address, rather than to the cameras they were captured from')
+    parser.add_argument('--udp-port', type=int, default=52381,
+                        help='UDP port. Default 52381')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='timing relative to the capture: 2 is twice as fast, '
+                             '0 as fast as possible. Default 1')
+    parser.add_argument('--timeout', type=float, default=1.0,
+                        help='least seconds to wait for replies; twice the captured '
+                             'latency if longer. Default 1')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print every exchange, not just those with different replies')
+    options = parser.parse_args()
+
+    try:
+        with open(options.capture, 'rb') as file:
+            exchanges = sorted(visca_capture.read(file), key=lambda e: e.time)
+    except (OSError, ValueError) as exc:
+        print(f'Cannot read {options.capture}: {exc}')
+        sys.exit(1)
+
+    if options.list:
+        list_capture(exchanges)
+        return
+
+    print(f'visca-replay version {g_version}')
+    try:
+        differ = replay(exchanges, options)
+    except (OSError, serial.SerialException) as exc:
+        print(f'Replay failed: {exc}')
+        sys.exit(1)
+    sys.exit(1 if differ else 0)
+
+#==============================================================================
+if __name__ == "__main__":
+    main()
@@ -10,15 +10,27 @@
 # - "in" is increasing Camera zoom
 
 import sys
+import os
 import time
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import urllib.parse
 import json
 import serial
 import socket
 import select
-
-g_version = "2.2"
+import threading
+import queue
+import collections
+import heapq
+import math
+import atexit
+import logging
+import logging.handlers
+import visca_codec
+import visca_capture
+
+g_version = "2.3"
 
 # Default configuration values overrideable by commandline parameters.
 #
@@ -32,15 +44,149 @@ g_serialBaudRate = 9600
 # and the 6-byte response another 6.25 msec.
 # so we may want to try faster baud rates to improe performance.
 
-# UDP port and sequence number for Sony-standard VISCA over IP.
+# Baud rates tried by "auto", fastest first. The rate is set on the camera,
+# by switch or menu. All VISCA cameras support 9600, many 38400 as well.
+g_probe_baud_rates = [115200, 38400, 19200, 9600]
+
+# Version inquiries sent to camera 1 at each rate when probing
+g_probe_count = 5
+
+# Results of the baud rate probe, for "about"
+g_baud_probe = None
+
+# Transports for cameras over IP, and the default port for each:
+#   visca-ip  Sony-standard VISCA over IP: UDP, with an 8-byte header
+#   tcp       VISCA packets on a TCP connection (PTZOptics, Vaddio and others)
+#   raw-udp   VISCA packets in UDP datagrams, without a header
+# Cameras named by IP address use g_ip_transport; cameras in the --config
+# file may choose their own.
 g_visca_udp_port = 52381
-g_sequence_number = 0
+g_visca_tcp_port = 5678
+g_visca_raw_udp_port = 1259
+g_ip_transport = 'visca-ip'
+
+# Seconds to wait for a TCP connection to a camera
+g_tcp_connect_timeout = 2.0
+
+# Camera name for the VISCA broadcast address, to send a command to every
+# camera on the serial chain at once.
+g_broadcast_camera = "all"
+
+# Seconds that a camera's cached position and zoom may be used for a jog
+# instead of asking the camera. 0 to always ask.
+g_state_max_age = 5.0
+
+# Seconds between camera polls for clients of the /events stream
+g_poll_interval = 0.5
+
+# Velocity control for joystick moves: speed updates per second, and
+# acceleration in full speeds per second (2.0 ramps 0 to full in 0.5 sec).
+# Braking is twice as fast. Velocities below the deadband count as stopped.
+g_control_rate  = 10
+g_acceleration  = 2.0
+g_deadband      = 0.05
+
+# Seconds without a velocity update before a moving camera is stopped,
+# in case its client has gone away. 0 to never stop.
+g_velocity_timeout = 3.0
+
+# Move prediction. Camera speeds are learned from successive inquiry
+# replies no more than g_learn_max_gap seconds apart. g_move_overhead is
+# added to each predicted move for starting and settling.
+g_learn_max_gap = 2.0
+g_move_overhead = 0.3
+
+# File where the server keeps each camera's preset positions
+g_preset_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'visca-presets.json')
+
+# File where the server keeps the vendor and model of each camera it has
+# found, so their capabilities are known as soon as it restarts
+g_camera_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'visca-cameras.json')
+
+# Capabilities of camera models, chosen by the vendor and model IDs of the
+# version inquiry reply. The first entry that matches is used; a vendor or
+# model of None matches any. More may be added with --models.
+#   reply_timeout:      seconds to wait for an Ack or inquiry reply
+#   completion_timeout: seconds to wait for Completion after the Ack. Sony
+#                       and the Vaddio HD-20 may send it only when a move is
+#                       done; a camera that always answers at once can use
+#                       a short timeout, so a lost Completion fails quickly.
+#   pan_speed_max, tilt_speed_max, zoom_speed_max: highest speed accepted.
+#                       Speeds above are reduced to these.
+g_camera_models = [
+    {'vendor': 0x0001, 'model': None, 'name': 'Sony',
+     'reply_timeout': 1.0, 'completion_timeout': 20.0,
+     'pan_speed_max': 0x18, 'tilt_speed_max': 0x14, 'zoom_speed_max': 7},
+    {'vendor': None, 'model': None, 'name': 'unknown',
+     'reply_timeout': 1.0, 'completion_timeout': 20.0,
+     'pan_speed_max': 0x18, 'tilt_speed_max': 0x14, 'zoom_speed_max': 7},
+]
+
+# While capturing or restoring presets: seconds between polls to see if a
+# camera has stopped moving, minimum seconds to wait for it to start, and
+# maximum seconds for a move
+g_settle_interval = 0.2
+g_settle_min_time = 0.5
+g_settle_timeout  = 30.0
+
+# Admission control: at most g_queue_limit commands wait for each camera.
+# When a queue is full, "drop-oldest" drops the oldest waiting interactive
+# motion command (jog, or a slew or zoom that isn't a stop) to make room, and
+# "reject" refuses the new command. Stop commands are never dropped or refused,
+# and batch and scheduled commands are always queued.
+g_queue_limit = 8
+g_drop_policies = ('drop-oldest', 'reject')
+g_drop_policy = 'drop-oldest'
+
+# A command that gets no reply at all (a timeout, or a lost connection) is
+# sent again up to g_retry_count times, g_retry_delay seconds later, doubling
+# each time. Commands from send_raw are never retried, since we don't know
+# what they do.
+g_retry_count = 2
+g_retry_delay = 0.1
+
+# Circuit breaker: after g_breaker_failures commands in a row get no reply,
+# even when retried, a camera is offline and its commands fail at once, so
+# they don't each wait for a timeout. It is probed in the background with a
+# version inquiry every g_probe_interval seconds, doubling up to
+# g_probe_max_interval, until it answers. 0 to never fail fast.
+g_breaker_failures = 3
+g_probe_interval = 2.0
+g_probe_max_interval = 30.0
+
+# A serial port that fails (such as an unplugged USB adapter) is reopened
+# after g_reopen_interval seconds, doubling up to g_reopen_max_interval
+g_reopen_interval = 1.0
+g_reopen_max_interval = 30.0
+
+# Logging. Messages are queued to a background thread, which writes them to
+# the console and, with --log-file, to a file rotated at g_log_max_bytes,
+# keeping g_log_backups old files. VISCA traffic is logged at DEBUG, so at
+# the default INFO level a command does no console output.
+g_log = logging.getLogger('visca-server')
+g_log_levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+g_log_level = 'INFO'
+g_log_file = None
+g_log_max_bytes = 1000000
+g_log_backups = 5
+g_log_listener = None
 
 g_viscaTalker = None
 
-# Status counters
+# JSON file naming cameras, with --config:
+#   {"cameras": {"Cam1": {"ip": "192.168.0.20"},
+#                "Cam2": {"serial": "COM3", "address": 1},
+#                "Cam3": {"serial": "COM4", "address": 1, "baud": 38400}}}
+g_config_file = None
+
+# visca_capture.CaptureWriter recording every VISCA exchange, with --capture
+g_recorder = None
+
+# Status counters. HTTP requests are handled on multiple threads,
+# so update them only while holding g_counter_lock
 g_post_count = 0
 g_error_count = 0
+g_counter_lock = threading.Lock()
 
 #==============================================================================
 # Error reporting exception
@@ -48,7 +194,8 @@ class ErrorEx(Exception):
     def __init__(self, a_error):
         global g_error_count
         self.errors = [a_error]
-        g_error_count += 1
+        with g_counter_lock:
+            g_error_count += 1
 
     def add(self, a_error):
         self.errors.append(a_error)
@@ -56,183 +203,1181 @@ class ErrorEx(Exception):
     def get_errors(self):
         return self.errors
 
+#==============================================================================
+# Error for want of a reply: a timeout or lost connection, which may succeed
+# if tried again. a_answered is True if the camera replied to the command
+# before it failed, so it is there but slow.
+class TransientErrorEx(ErrorEx):
+    def __init__(self, a_error, a_answered=False):
+        super().__init__(a_error)
+        self.answered = a_answered
+
+#==============================================================================
+# Bytes shown as hex in a log message, converted only if the message is logged:
+#   g_log.debug('Sent %s', LazyHex(data))
+class LazyHex:
+    __slots__ = ('data',)
+
+    def __init__(self, a_data):
+        self.data = a_data
+
+    def __str__(self):
+        return self.data.hex(' ')
+
+#==============================================================================
+# Counters and latency histograms, reported on /metrics in Prometheus text
+# format. Each metric has a name and a dict of labels such as camera and
+# command.
+class Metrics:
+    # Histogram bucket upper bounds in seconds. Completion may take 20.
+    BUCKETS = (0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+    HELP = {
+        'visca_posts_total': ('counter', 'POST requests received'),
+        'visca_errors_total': ('counter', 'Errors raised while handling commands, including retried ones'),
+        'visca_requests_total': ('counter', 'Commands handled, by command, camera and status'),
+        'visca_request_seconds': ('histogram', 'Time from receiving a POST to sending its response'),
+        'visca_phase_seconds': ('histogram',
+            'Time in each phase of a command: http_parse, queue (waiting for the '
+            'camera worker), port_wait (waiting for the shared serial port), transmit, '
+            'ack, completion, and reply (to an inquiry)'),
+        'visca_dropped_total': ('counter',
+            'Commands not run: dropped from a full camera queue for a newer '
+            'command, rejected when submitted to a full queue, or stopped by '
+            'a later stop'),
+        'visca_retries_total': ('counter', 'Commands sent again after getting no reply'),
+        'visca_offline_total': ('counter',
+            'Times a camera was taken offline by the circuit breaker'),
+        'visca_fast_failed_total': ('counter',
+            'Commands failed at once because their camera was offline'),
+        'visca_reconnects_total': ('counter', 'Serial ports reopened after failing'),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    #===========================================================================
+    def count(self, a_name, a_labels, a_amount=1):
+        key = (a_name, tuple(sorted(a_labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + a_amount
+
+    #===========================================================================
+    def observe(self, a_name, a_labels, a_seconds):
+        key = (a_name, tuple(sorted(a_labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Count per bucket, then sum and count
+                histogram = [0] * (len(self.BUCKETS) + 2)
+                self.histograms[key] = histogram
+            for ix, bound in enumerate(self.BUCKETS):
+                if a_seconds <= bound:
+                    histogram[ix] += 1
+                    break
+            histogram[-2] += a_seconds
+            histogram[-1] += 1
+
+    #===========================================================================
+    # Return all metrics as Prometheus text
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        # Server-wide counters
+        described = set()
+        self.describe(lines, described, 'visca_posts_total')
+        lines.append(f'visca_posts_total {g_post_count}')
+        self.describe(lines, described, 'visca_errors_total')
+        lines.append(f'visca_errors_total {g_error_count}')
+
+        for (name, labels), value in counters:
+            self.describe(lines, described, name)
+            lines.append(f'{name}{{{self.label_text(labels)}}} {value}')
+
+        for (name, labels), histogram in histograms:
+            self.describe(lines, described, name)
+            text = self.label_text(labels)
+            separator = ',' if text else ''
+            cumulative = 0
+            for ix, bound in enumerate(self.BUCKETS):
+                cumulative += histogram[ix]
+                lines.append(f'{name}_bucket{{{text}{separator}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{text}{separator}le="+Inf"}} {histogram[-1]}')
+            lines.append(f'{name}_sum{{{text}}} {histogram[-2]:.6f}')
+            lines.append(f'{name}_count{{{text}}} {histogram[-1]}')
+
+        return '\n'.join(lines) + '\n'
+
+    #===========================================================================
+    # Add HELP and TYPE lines before the first sample of a metric
+    def describe(self, a_lines, a_described, a_name):
+        if a_name not in a_described:
+            a_described.add(a_name)
+            kind, text = self.HELP.get(a_name, ('untyped', a_name))
+            a_lines.append(f'# HELP {a_name} {text}')
+            a_lines.append(f'# TYPE {a_name} {kind}')
+
+    #===========================================================================
+    def label_text(self, a_labels):
+        parts = []
+        for name, value in a_labels:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{name}="{value}"')
+        return ','.join(parts)
+
+g_metrics = Metrics()
+
+# The command being run on this thread, for labelling phase metrics
+g_metrics_context = threading.local()
+
+#==============================================================================
+# Record the time taken by one phase of the current command
+def observe_phase(a_phase, a_camera, a_seconds):
+    command = getattr(g_metrics_context, 'command', 'none')
+    g_metrics.observe('visca_phase_seconds',
+                      {'phase': a_phase, 'command': command, 'camera': str(a_camera)},
+                      a_seconds)
+
+#==============================================================================
+# One outstanding VISCA command, waiting for its replies.
+# The channel's receiver puts each reply routed to us on our queue,
+# or None if the connection fails.
+class ViscaRequest:
+    def __init__(self, a_camera, a_address, a_sequence, a_rxExpected):
+        self.camera = a_camera      # As named by the client
+        self.address = a_address    # VISCA address 1 to 7, or IP address for VISCA over IP
+        self.sequence = a_sequence  # VISCA-over-IP only
+        self.rx_expected = a_rxExpected
+        self.ack_socket = None      # VISCA socket number from our Ack
+        self.replies = queue.Queue()
+        self.received = bytearray() # All replies, for g_recorder
+
+    #===========================================================================
+    # Wait for the next reply
+    # Throws TransientErrorEx on timeout or failure
+    def wait_reply(self, a_timeout):
+        try:
+            data = self.replies.get(timeout=a_timeout)
+        except queue.Empty:
+            raise TransientErrorEx(f'Timeout waiting for reply from {self.camera}',
+                                   len(self.received) > 0)
+        if data is None:
+            raise TransientErrorEx(f'Connection to {self.camera} failed',
+                                   len(self.received) > 0)
+        self.received += data
+        return data
+
+#==============================================================================
+# Transports
+#
+# Each way of reaching cameras is a channel class with the same interface,
+# used by ViscaTalker.send_visca_once:
+#   start(a_camera, a_address, a_bytes, a_rxExpected) sends a_bytes, whose
+#       header byte is already set, and returns a ViscaRequest to wait on
+#   finish(a_request) forgets the request once its exchange is done
+#   header(a_address) is the first byte of a message to the camera
+#   capture_address(a_address) names the camera in a --capture file
+#   close()
+# with class attributes NAME, the transport's name in a --config entry,
+# and CAPTURE, its visca_capture transport.
+
+#==============================================================================
+# Connection to one camera by Sony's VISCA over IP: UDP, with an 8-byte
+# header on each message.
+#
+# Uses a single connected UDP socket. A receiver thread reads every datagram
+# and hands it to the outstanding request with the same sequence number, so a
+# late Completion for an earlier command can't be taken as the reply to the
+# current one. Several commands may be outstanding at once.
+class ViscaIpChannel:
+    NAME = 'visca-ip'
+    CAPTURE = visca_capture.UDP
+
+    def __init__(self, a_ip, a_port):
+        self.ip = a_ip
+        self.port = a_port
+        self.lock = threading.Lock()
+        self.sequence_number = 0
+        self.pending = {}
+        # Recently finished sequence numbers, to recognize stale replies
+        self.finished = collections.deque(maxlen=64)
+        # Whether the camera echoes our sequence numbers: None until its
+        # first reply tells us
+        self.echoes = None
+        self.closed = False
+        self.sock = None
+        self.receiver = None
+
+    #===========================================================================
+    # Messages are always to address 1
+    def header(self, a_address):
+        return 0x81
+
+    #===========================================================================
+    def capture_address(self, a_address):
+        if self.port == g_visca_udp_port:
+            return self.ip
+        return f'{self.ip}:{self.port}'
+
+    #===========================================================================
+    # Open the socket and start the receiver if needed. Caller holds lock.
+    def open(self):
+        if self.sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.connect((self.ip, self.port))
+            except OSError as exc:
+                sock.close()
+                raise TransientErrorEx(f'Cannot connect to {self.ip}: {exc}')
+            # Timeout lets the receiver notice when we are closed
+            sock.settimeout(0.5)
+            self.sock = sock
+            self.receiver = threading.Thread(target=self.receive, args=(sock,),
+                                             daemon=True, name=f'receive {self.ip}')
+            self.receiver.start()
+
+    #===========================================================================
+    # Close the socket. The receiver exits at its next timeout.
+    # Outstanding requests will time out.
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.drop_socket()
+
+    #===========================================================================
+    # Close the socket after an error; it will be reopened on next use.
+    # Caller holds lock.
+    def drop_socket(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    #===========================================================================
+    # Send a_bytes to a_camera as a new request, returning a ViscaRequest to wait on
+    # Throws ErrorEx on failure
+    def start(self, a_camera, a_address, a_bytes, a_rxExpected):
+        with self.lock:
+            if self.closed:
+                raise ErrorEx('Server is shutting down')
+            self.open()
+            self.sequence_number = (self.sequence_number + 1) & 0xFFFFFFFF
+            request = ViscaRequest(a_camera, self.ip, self.sequence_number, a_rxExpected)
+            self.pending[request.sequence] = request
+
+            # Prepend an 8-byte VISCA-over-IP header to the message
+            # Second byte is supposed to be 0x00 for a command, 0x10 for an inquiry
+            # according to both Aver and Sony documents.
+            # But my Aver VC520 PRO won't respond if the second byte isn't 0x00
+            buf = bytearray(2)
+            buf[0] = 0x01
+            buf[1] = 0x00 # if a_rxExpected == 0 else 0x10
+            buf.extend(len(a_bytes).to_bytes(2, byteorder='big'))  # Payload length
+            buf.extend(request.sequence.to_bytes(4, byteorder='big'))
+            buf.extend(a_bytes)
+
+            g_log.debug('Sending to %s seq %d: %d bytes: %s',
+                        self.ip, request.sequence, len(a_bytes), LazyHex(a_bytes))
+            try:
+                started = time.perf_counter()
+                self.sock.send(buf)
+                observe_phase('transmit', a_camera, time.perf_counter() - started)
+            except OSError as exc:
+                del self.pending[request.sequence]
+                self.drop_socket()
+                raise TransientErrorEx(f'Send to {self.ip} failed: {exc}')
+        return request
+
+    #===========================================================================
+    # Forget a_request once its exchange is done, successful or not
+    def finish(self, a_request):
+        with self.lock:
+            self.pending.pop(a_request.sequence, None)
+            self.finished.append(a_request.sequence)
+
+    #===========================================================================
+    # Receiver thread: read datagrams and route them to their requests
+    def receive(self, a_socket):
+        while True:
+            try:
+                data = a_socket.recv(1024)
+            except socket.timeout:
+                if a_socket is not self.sock:
+                    return
+                continue
+            except OSError as exc:
+                # Closed, or ICMP port unreachable from a missing camera
+                with self.lock:
+                    if a_socket is self.sock:
+                        g_log.warning('Receive from %s failed: %s', self.ip, exc)
+                        self.drop_socket()
+                        # Fail outstanding requests now rather than at timeout
+                        for request in self.pending.values():
+                            request.replies.put(None)
+                return
+
+            if len(data) < 9:
+                g_log.warning('Discarding short datagram from %s: %s', self.ip, LazyHex(data))
+                continue
+
+            # For Aver VC520 Pro, rxLen in the header is always 1, so ignore it.
+            seq = int.from_bytes(data[4:8], byteorder='big')
+            payload = data[8:]
+            with self.lock:
+                request = self.find_request(seq, payload)
+            if request is None:
+                g_log.info('Discarding stale reply from %s seq %d: %s', self.ip, seq, LazyHex(payload))
+            else:
+                request.replies.put(payload)
+
+    #===========================================================================
+    # Find the request for a reply with sequence number a_seq. Caller holds lock.
+    # Once the camera has echoed a sequence number, a reply with one we don't
+    # know is stale, so we return None. Only a camera seen not to echo them
+    # has its replies matched some other way.
+    def find_request(self, a_seq, a_payload):
+        request = self.pending.get(a_seq)
+        if (request is not None) or (a_seq in self.finished):
+            if self.echoes is None:
+                self.echoes = True
+            return request
+        if self.echoes or not self.pending:
+            return None
+        if self.echoes is None:
+            g_log.info('%s does not echo sequence numbers; matching replies by socket', self.ip)
+            self.echoes = False
+
+        # Match a Completion or Error by VISCA socket number, anything else
+        # to the oldest outstanding request.
+        if (len(a_payload) >= 2) and \
+           ((a_payload[1] & 0xF0) in (visca_codec.COMPLETION, visca_codec.ERROR)):
+            socket_number = a_payload[1] & 0x0F
+            for request in self.pending.values():
+                if request.ack_socket == socket_number:
+                    return request
+        return next(iter(self.pending.values()))
+
+#==============================================================================
+# Base for transports that carry bare VISCA packets, as on a serial line:
+# serial ports, TCP connections and raw UDP.
+#
+# A reader thread frames packets on the FF terminator and routes each Ack,
+# Completion, Error or inquiry reply to the command waiting for it, by
+# camera address and VISCA socket number, since there are no sequence
+# numbers. Writes take turns, but a command may be sent while an earlier one
+# awaits its Completion, as VISCA's two command sockets allow.
+#
+# Over UDP a Completion may arrive before its Ack. It is held, by camera
+# address and socket number, and delivered after the Ack for that socket.
+class ViscaPacketChannel:
+    def __init__(self, a_name):
+        self.name = a_name
+        self.lock = threading.Lock()        # Guards pending and early
+        self.write_lock = threading.Lock()  # Guards the connection
+        self.pending = []                   # ViscaRequests, in the order sent
+        self.early = {}                     # Completions before their Ack, by (address, socket)
+        self.closed = False
+
+    #===========================================================================
+    # Messages over IP are to address 1
+    def header(self, a_address):
+        return 0x81
+
+    #===========================================================================
+    def capture_address(self, a_address):
+        return self.name
+
+    #===========================================================================
+    # Send a_bytes to a_camera at a_address, returning a ViscaRequest to wait on
+    # Throws ErrorEx on failure
+    def start(self, a_camera, a_address, a_bytes, a_rxExpected):
+        request = ViscaRequest(a_camera, a_bytes[0] & 0x07, None, a_rxExpected)
+        started = time.perf_counter()
+        with self.write_lock:
+            observe_phase('port_wait', a_camera, time.perf_counter() - started)
+            if self.closed:
+                raise ErrorEx('Server is shutting down')
+            self.connect()
+
+            # Register before sending, so we can't miss a quick reply
+            with self.lock:
+                self.pending.append(request)
+
+            try:
+                self.write(a_camera, a_bytes)
+            except ErrorEx:
+                self.finish(request)
+                raise
+        return request
+
+    #===========================================================================
+    # Get ready to write, if need be. Caller holds write_lock.
+    # Throws TransientErrorEx if we can't
+    def connect(self):
+        pass
+
+    #===========================================================================
+    # Write a_bytes for a_camera. Caller holds write_lock.
+    # Throws TransientErrorEx on failure
+    def write(self, a_camera, a_bytes):
+        g_log.debug('Sending to %s %d bytes: %s', self.name, len(a_bytes), LazyHex(a_bytes))
+        started = time.perf_counter()
+        self.transmit(a_bytes)
+        observe_phase('transmit', a_camera, time.perf_counter() - started)
+
+    #===========================================================================
+    # Forget a_request once its exchange is done, successful or not
+    def finish(self, a_request):
+        with self.lock:
+            if a_request in self.pending:
+                self.pending.remove(a_request)
+            # Early Completions are for commands not yet acknowledged; once
+            # there are none, any left are stale
+            if not self.unacknowledged(a_request.address):
+                for key in [key for key in self.early if key[0] == a_request.address]:
+                    del self.early[key]
+
+    #===========================================================================
+    # Commands to a_address awaiting their Ack. Caller holds lock.
+    def unacknowledged(self, a_address):
+        return [r for r in self.pending
+                if (r.address == a_address) and (r.rx_expected == 0) and (r.ack_socket is None)]
+
+    #===========================================================================
+    # Fail outstanding requests now rather than at timeout
+    def fail_pending(self):
+        with self.lock:
+            for request in self.pending:
+                request.replies.put(None)
+
+    #===========================================================================
+    # Add a_data to a_buf and route each complete packet in it
+    def frame(self, a_buf, a_data):
+        a_buf.extend(a_data)
+        while 0xFF in a_buf:
+            end = a_buf.index(0xFF) + 1
+            self.route(bytes(a_buf[:end]))
+            del a_buf[:end]
+
+        # VISCA packets are at most 16 bytes
+        if len(a_buf) > 16:
+            g_log.warning('Discarding unframed input from %s: %s', self.name, LazyHex(a_buf))
+            a_buf.clear()
+
+    #===========================================================================
+    # Hand a_packet to the request waiting for it
+    def route(self, a_packet):
+        if len(a_packet) < 3:
+            g_log.warning('Discarding short packet from %s: %s', self.name, LazyHex(a_packet))
+            return
+
+        address, kind, socket_number = visca_codec.decode_header(a_packet)
+        request = None
+        early = None
+        with self.lock:
+            mine = [r for r in self.pending if r.address == address]
+            if kind == visca_codec.ACK:
+                # Ack: the oldest command not yet acknowledged, and its
+                # Completion if that came first
+                request = next(iter(self.unacknowledged(address)), None)
+                if request is not None:
+                    request.ack_socket = socket_number
+                    early = self.early.pop((address, socket_number), None)
+            elif (kind == visca_codec.COMPLETION) and (len(a_packet) == 3):
+                # Completion: the command that was given this socket
+                request = next((r for r in mine if r.ack_socket == socket_number), None)
+                if (request is None) and self.unacknowledged(address):
+                    # Before its Ack: hold it until the Ack comes
+                    self.early[(address, socket_number)] = a_packet
+                    return
+            elif kind == visca_codec.COMPLETION:
+                # Inquiry reply: the oldest inquiry
+                request = next((r for r in mine if r.rx_expected != 0), None)
+            elif kind == visca_codec.ERROR:
+                # Error: for a socket, or for a command not yet acknowledged
+                if socket_number != 0:
+                    request = next((r for r in mine if r.ack_socket == socket_number), None)
+                if request is None:
+                    request = next((r for r in mine if r.ack_socket is None), None)
+
+        if request is None:
+            g_log.info('Discarding stale reply from %s: %s', self.name, LazyHex(a_packet))
+        else:
+            request.replies.put(a_packet)
+            if early is not None:
+                request.replies.put(early)
+
+#==============================================================================
+# Serial port shared by daisy-chained VISCA cameras.
+#
+# If the port fails, such as when a USB adapter is unplugged, the reader
+# fails the outstanding commands and reopens the port, retrying with backoff.
+# Commands fail at once while the port is broken.
+class ViscaSerialChannel(ViscaPacketChannel):
+    NAME = 'serial'
+    CAPTURE = visca_capture.SERIAL
+
+    def __init__(self, a_port):
+        super().__init__(a_port.port)
+        self.port = a_port
+        self.broken = False                 # Guarded by write_lock
+        self.reader = threading.Thread(target=self.receive, daemon=True,
+                                       name=f'receive {self.name}')
+        self.reader.start()
+
+    #===========================================================================
+    def header(self, a_address):
+        return 0x80 + int(a_address)
+
+    #===========================================================================
+    def capture_address(self, a_address):
+        return f'{self.name}:{a_address}'
+
+    #===========================================================================
+    # Send a_bytes to every camera on the chain.
+    # Cameras don't reply to broadcast commands, so there is nothing to wait for.
+    # Throws ErrorEx on failure
+    def broadcast(self, a_bytes):
+        started = time.perf_counter()
+        with self.write_lock:
+            observe_phase('port_wait', g_broadcast_camera, time.perf_counter() - started)
+            if self.closed:
+                raise ErrorEx('Server is shutting down')
+            self.connect()
+            self.write(g_broadcast_camera, a_bytes)
+
+    #===========================================================================
+    def connect(self):
+        if self.broken:
+            raise TransientErrorEx(f'Serial port {self.name} is disconnected')
+
+    #===========================================================================
+    def transmit(self, a_bytes):
+        try:
+            self.port.write(a_bytes)
+            self.port.flush()
+        except serial.SerialException as exc:
+            raise TransientErrorEx(f'Serial write failed: {exc}')
+
+    #===========================================================================
+    def close(self):
+        with self.write_lock:
+            self.closed = True
+            self.port.close()
+
+    #===========================================================================
+    # Reader thread: frame packets and route them to their requests
+    def receive(self):
+        buf = bytearray()
+        while True:
+            try:
+                data = self.port.read(self.port.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as exc:
+                # TypeError and friends if the port was closed under us
+                if not self.closed:
+                    g_log.error('Serial read on %s failed: %s', self.name, exc)
+                with self.write_lock:
+                    self.broken = True
+                self.fail_pending()
+                if self.closed or not self.reopen():
+                    return
+                buf.clear()
+                continue
+
+            self.frame(buf, data)
+
+    #===========================================================================
+    # Reopen the port after it failed, trying every g_reopen_interval seconds,
+    # doubling up to g_reopen_max_interval. Return False if we were closed.
+    def reopen(self):
+        baud_rate = self.port.baudrate
+        try:
+            self.port.close()
+        except (serial.SerialException, OSError):
+            pass
+
+        interval = g_reopen_interval
+        while True:
+            time.sleep(interval)
+            try:
+                port = serial.Serial(self.name, baud_rate, timeout=0.5, write_timeout=2)
+            except serial.SerialException as exc:
+                g_log.debug('Cannot reopen %s: %s', self.name, exc)
+                interval = min(interval * 2, g_reopen_max_interval)
+                if self.closed:
+                    return False
+                continue
+
+            with self.write_lock:
+                if self.closed:
+                    port.close()
+                    return False
+                self.port = port
+                self.broken = False
+            g_log.warning('Reopened serial port %s', self.name)
+            g_metrics.count('visca_reconnects_total', {'port': self.name})
+            return True
+
+#==============================================================================
+# Base for bare VISCA packets to one camera over IP, on a socket of type
+# SOCKET_TYPE. The socket is opened on first use and kept open; after an
+# error it is closed, failing outstanding commands, and opened again for the
+# next command.
+class ViscaRawIpChannel(ViscaPacketChannel):
+    def __init__(self, a_ip, a_port):
+        super().__init__(f'{a_ip}:{a_port}')
+        self.ip = a_ip
+        self.port = a_port
+        self.sock = None                    # Guarded by write_lock
+
+    #===========================================================================
+    # Open the socket and start its receiver if need be. Caller holds write_lock.
+    # Throws TransientErrorEx on failure
+    def connect(self):
+        if self.sock is not None:
+            return
+        sock = socket.socket(socket.AF_INET, self.SOCKET_TYPE)
+        try:
+            sock.settimeout(g_tcp_connect_timeout)
+            sock.connect((self.ip, self.port))
+        except OSError as exc:
+            sock.close()
+            raise TransientErrorEx(f'Cannot connect to {self.name}: {exc}')
+        self.setup(sock)
+        # Timeout lets the receiver notice when we are closed
+        sock.settimeout(0.5)
+        self.sock = sock
+        threading.Thread(target=self.receive, args=(sock,), daemon=True,
+                         name=f'receive {self.name}').start()
+
+    #===========================================================================
+    # Set socket options for a new socket
+    def setup(self, a_socket):
+        pass
+
+    #===========================================================================
+    def transmit(self, a_bytes):
+        try:
+            self.sock.sendall(a_bytes)
+        except OSError as exc:
+            self.drop_socket(self.sock)
+            raise TransientErrorEx(f'Send to {self.name} failed: {exc}')
+
+    #===========================================================================
+    # Close a_socket after an error, if it is still ours; the next command
+    # opens another.
+    def drop_socket(self, a_socket):
+        if self.sock is a_socket:
+            self.sock = None
+        a_socket.close()
+
+    #===========================================================================
+    def close(self):
+        with self.write_lock:
+            self.closed = True
+            if self.sock is not None:
+                self.drop_socket(self.sock)
+
+    #===========================================================================
+    # Receiver thread: read from a_socket and route packets to their requests
+    def receive(self, a_socket):
+        buf = bytearray()
+        while True:
+            try:
+                data = a_socket.recv(1024)
+                if not data and (self.SOCKET_TYPE == socket.SOCK_STREAM):
+                    raise OSError('connection closed by camera')
+            except socket.timeout:
+                if a_socket is not self.sock:
+                    return
+                continue
+            except OSError as exc:
+                # Closed by us or the camera, or ICMP port unreachable
+                with self.write_lock:
+                    if a_socket is not self.sock:
+                        return
+                    g_log.warning('Receive from %s failed: %s', self.name, exc)
+                    self.drop_socket(a_socket)
+                self.fail_pending()
+                return
+
+            self.receive_data(buf, data)
+
+#==============================================================================
+# VISCA packets on a long-lived TCP connection, as PTZOptics, Vaddio and
+# other cameras accept, usually on port 5678. Nagle's algorithm is off, so
+# each message goes at once.
+class ViscaTcpChannel(ViscaRawIpChannel):
+    NAME = 'tcp'
+    CAPTURE = visca_capture.TCP
+    SOCKET_TYPE = socket.SOCK_STREAM
+
+    #===========================================================================
+    def setup(self, a_socket):
+        a_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        a_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    #===========================================================================
+    # A packet may be split across reads
+    def receive_data(self, a_buf, a_data):
+        self.frame(a_buf, a_data)
+
+#==============================================================================
+# VISCA packets in UDP datagrams, without Sony's 8-byte header, as some
+# cameras accept (PTZOptics on port 1259)
+class ViscaRawUdpChannel(ViscaRawIpChannel):
+    NAME = 'raw-udp'
+    CAPTURE = visca_capture.RAW_UDP
+    SOCKET_TYPE = socket.SOCK_DGRAM
+
+    #===========================================================================
+    # Each datagram holds whole packets
+    def receive_data(self, a_buf, a_data):
+        a_buf.clear()
+        self.frame(a_buf, a_data)
+
+#==============================================================================
+# Channels to cameras over IP by transport, IP address and port, created on
+# first use
+class ViscaIpChannels:
+    TRANSPORTS = {channel.NAME: channel
+                  for channel in (ViscaIpChannel, ViscaTcpChannel, ViscaRawUdpChannel)}
+
+    def __init__(self):
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    #===========================================================================
+    # The channel for a_transport (a TRANSPORTS name) to a_ip and a_port
+    def get(self, a_transport, a_ip, a_port):
+        key = (a_transport, a_ip, a_port)
+        with self.lock:
+            channel = self.channels.get(key)
+            if channel is None:
+                channel = self.TRANSPORTS[a_transport](a_ip, a_port)
+                self.channels[key] = channel
+            return channel
+
+    #===========================================================================
+    def close(self):
+        with self.lock:
+            for channel in self.channels.values():
+                channel.close()
+
+#==============================================================================
+# Last known position and zoom of a camera, with the time each was learned.
+# None if unknown.
+class CameraState:
+    def __init__(self):
+        self.pan = None
+        self.tilt = None
+        self.position_time = 0
+        self.zoom = None
+        self.zoom_time = 0
+
+        # For move predictions, learned from inquiry replies:
+        # last reply as (value, time) and full speed in units/second by axis,
+        # and where each preset is, as a dict by axis.
+        self.samples = {}
+        self.speeds = {}
+        self.preset_positions = {}
+        # Preset being recalled, when, axes not yet seen to settle there,
+        # and axes seen moving
+        self.heading_preset = None
+        self.heading_time = 0
+        self.heading_axes = set()
+        self.heading_moved = set()
+
+#==============================================================================
+# Circuit breaker for each camera. Commands that get no reply after all
+# their retries are counted, and after g_breaker_failures in a row the camera
+# is offline: its commands fail at once, and a thread probes it until it
+# answers. Any reply, even an Error, clears the count.
+class CameraHealth:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = {}          # Commands in a row with no reply, by camera
+        self.offline = {}           # Time each offline camera went offline
+
+    #===========================================================================
+    # Throws ErrorEx if a_camera is offline
+    def check(self, a_camera):
+        with self.lock:
+            if a_camera not in self.offline:
+                return
+        g_metrics.count('visca_fast_failed_total', {'camera': a_camera})
+        raise ErrorEx(f'Camera {a_camera} is offline')
+
+    #===========================================================================
+    def is_offline(self, a_camera):
+        with self.lock:
+            return a_camera in self.offline
+
+    #===========================================================================
+    def succeeded(self, a_camera):
+        with self.lock:
+            self.failures.pop(a_camera, None)
+
+    #===========================================================================
+    # Count a command with no reply, taking a_camera offline after too many
+    def failed(self, a_camera):
+        with self.lock:
+            if a_camera in self.offline:
+                return
+            failures = self.failures.get(a_camera, 0) + 1
+            self.failures[a_camera] = failures
+            if (g_breaker_failures <= 0) or (failures < g_breaker_failures):
+                return
+            self.offline[a_camera] = time.time()
+
+        g_log.warning('Camera %s is offline after %d commands with no reply', a_camera, failures)
+        g_metrics.count('visca_offline_total', {'camera': a_camera})
+        threading.Thread(target=self.probe, args=(a_camera,), daemon=True,
+                         name=f'probe {a_camera}').start()
+
+    #===========================================================================
+    # Probe thread: ask a_camera for its version every g_probe_interval
+    # seconds, doubling up to g_probe_max_interval, until it answers
+    def probe(self, a_camera):
+        interval = g_probe_interval
+        while True:
+            time.sleep(interval)
+            try:
+                route = g_viscaTalker.get_route(a_camera)
+                g_viscaTalker.send_visca_once(a_camera, route, visca_codec.version_inquiry(),
+                                              visca_codec.VERSION_REPLY_LENGTH)
+            except TransientErrorEx as ex:
+                if not ex.answered:
+                    interval = min(interval * 2, g_probe_max_interval)
+                    continue
+            except ErrorEx:
+                # An unexpected reply is still a reply
+                pass
+            break
+
+        with self.lock:
+            went = self.offline.pop(a_camera, time.time())
+            self.failures.pop(a_camera, None)
+        g_log.warning('Camera %s is back online after %.0f sec', a_camera, time.time() - went)
+
+    #===========================================================================
+    # Offline cameras, as a dict of camera -> time it went offline
+    def get_offline(self):
+        with self.lock:
+            return dict(self.offline)
+
+g_camera_health = CameraHealth()
+
+#==============================================================================
+# How to reach a camera: kind is the NAME of its channel's transport, such as
+# 'serial' or 'tcp'. For serial, channel is its ViscaSerialChannel (None to
+# simulate) and address is 1 to 7; over IP, address is the IP address.
+CameraRoute = collections.namedtuple('CameraRoute', 'kind channel address')
+
 #==============================================================================
 # Low-level VISCA functions
+#
+# Cameras are named by the client. A name in a_cameras (from the --config
+# file) gives the camera's serial port and address, or IP address and
+# transport; otherwise the name is the address itself: 1 to 7 on the command
+# line's serial port, or an IP address reached by g_ip_transport. Each serial
+# port and IP camera has its own channel and reader thread, so cameras work
+# in parallel.
 class ViscaTalker:
-    def __init__(self, a_serialPort, a_serialBaudRate):
+    def __init__(self, a_serialPort, a_serialBaudRate, a_cameras=None):
+        if a_cameras is None:
+            a_cameras = {}
         self.serial_port = None
+        self.serial_channel = None
+        self.serial_channels = {}           # By port name
         if a_serialPort == 'SIM':
-            print(f'Using simulated serial port')
+            g_log.info('Using simulated serial port')
         elif a_serialPort != 'UDP':
-            try:
-                self.serial_port = serial.Serial(a_serialPort, a_serialBaudRate,
-                                                 timeout=1, write_timeout=2)
-                print(f'Opened serial port {a_serialPort} at {a_serialBaudRate} baud')
-            except serial.SerialException as exc:
-                raise ErrorEx(str(exc))
+            self.serial_channel = self.open_serial(a_serialPort, a_serialBaudRate)
+            self.serial_port = self.serial_channel.port
 
-        print(f'Enabled Visca over UDP')
+        self.ip_channels = ViscaIpChannels()
+        g_log.info('Enabled Visca over IP by %s', g_ip_transport)
 
-        # Byte arrays with message templates
-        # Some bytes are overwritten by functions which use them, so be careful
-        #                                            0  1  2  3  4  5  6  7  8  9  10 11 12 13 14
-        self.visca_get_position = bytearray.fromhex('80 09 06 12 FF')
-        self.visca_set_position = bytearray.fromhex('80 01 06 02 00 00 00 00 00 00 00 00 00 00 FF')
-        self.visca_get_zoom     = bytearray.fromhex('80 09 04 47 FF')
-        self.visca_set_zoom     = bytearray.fromhex('80 01 04 47 00 00 00 00 FF')
-        self.visca_slew         = bytearray.fromhex('80 01 06 01 00 00 03 03 FF')
-        self.visca_zoom         = bytearray.fromhex('80 01 04 07 20 FF')
-        self.visca_goto_preset  = bytearray.fromhex('80 01 04 3F 02 00 FF')
-        self.visca_set_preset   = bytearray.fromhex('80 01 04 3F 01 00 FF')
-        self.visca_version_inq  = bytearray.fromhex('80 09 00 02 FF')
+        # CameraRoute by camera name, for cameras in a_cameras
+        self.routes = {}
+        try:
+            for name, entry in a_cameras.items():
+                self.routes[str(name)] = self.make_route(entry, a_serialBaudRate)
+        except ErrorEx as ex:
+            self.close()
+            ex.add(f'Invalid camera {name}')
+            raise
+
+        # CameraState by address, updated by inquiries and absolute moves,
+        # and invalidated by slews and preset recalls.
+        self.states = {}
+        self.state_lock = threading.Lock()
 
-        self.visca_ack_complete = bytearray.fromhex('90 41 FF 90 51 FF')
+        # Messages are built by visca_codec, a new buffer for each call,
+        # since several threads may be building messages at the same time.
 
     #===========================================================================
-    # Send the message a_bytes to the specified a_address
-    # return a bytearrary with the reply if a_rxExpected is non-zero
+    # Open serial port a_port, returning its ViscaSerialChannel
     # Throws ErrorEx on failure
-    def send_visca(self, a_address, a_bytes, a_rxExpected):
-        if len(str(a_address)) > 3:
-            return self.send_visca_udp(a_address, a_bytes, a_rxExpected)
+    def open_serial(self, a_port, a_baud_rate):
+        try:
+            # Short read timeout just lets the reader notice when we close
+            port = serial.Serial(a_port, a_baud_rate, timeout=0.5, write_timeout=2)
+            g_log.info('Opened serial port %s at %s baud', a_port, a_baud_rate)
+        except serial.SerialException as exc:
+            raise ErrorEx(str(exc))
+        channel = ViscaSerialChannel(port)
+        self.serial_channels[a_port] = channel
+        return channel
+
+    #===========================================================================
+    # CameraRoute for a --config camera entry, such as
+    #   {"serial": "COM3", "address": 1, "baud": 38400} or
+    #   {"ip": "192.168.0.20", "transport": "tcp", "port": 5678}
+    # opening its serial port if need be. Baud defaults to a_baud_rate,
+    # transport to g_ip_transport, and port to the transport's usual one.
+    # Throws ErrorEx if invalid
+    def make_route(self, a_entry, a_baud_rate):
+        if 'ip' in a_entry:
+            transport = a_entry.get('transport', g_ip_transport)
+            if transport not in ViscaIpChannels.TRANSPORTS:
+                raise ErrorEx('Transport must be one of ' + ', '.join(ViscaIpChannels.TRANSPORTS))
+            port = a_entry.get('port', self.default_port(transport))
+            if (not isinstance(port, int)) or (port < 1) or (port > 65535):
+                raise ErrorEx('Port must be 1 to 65535')
+            return self.ip_route(transport, str(a_entry['ip']), port)
+
+        if 'serial' not in a_entry:
+            raise ErrorEx('Expected "serial" or "ip"')
+        address = a_entry.get('address', 1)
+        if (not isinstance(address, int)) or (address < 1) or (address > 7):
+            raise ErrorEx('Serial address must be 1 to 7')
+        port = a_entry['serial']
+        channel = self.serial_channels.get(port)
+        if channel is None:
+            channel = self.open_serial(port, a_entry.get('baud', a_baud_rate))
+        elif a_entry.get('baud', channel.port.baudrate) != channel.port.baudrate:
+            raise ErrorEx(f'Port {port} is already open at {channel.port.baudrate} baud')
+        return CameraRoute('serial', channel, address)
 
-        a_bytes[0] = int(a_address) + 0x80
-        if self.serial_port is None:
-            print(f'Simulate sending {len(a_bytes)} bytes: {a_bytes.hex(" ")}')
+    #===========================================================================
+    # How to reach camera a_camera, or None if it isn't known
+    def find_route(self, a_camera):
+        route = self.routes.get(a_camera)
+        if route is not None:
+            return route
+        if len(a_camera) > 3:
+            return self.ip_route(g_ip_transport, a_camera, self.default_port(g_ip_transport))
+        try:
+            return CameraRoute('serial', self.serial_channel, int(a_camera))
+        except ValueError:
+            return None
+
+    #===========================================================================
+    # CameraRoute to a_ip and a_port by a_transport
+    def ip_route(self, a_transport, a_ip, a_port):
+        return CameraRoute(a_transport, self.ip_channels.get(a_transport, a_ip, a_port), a_ip)
+
+    #===========================================================================
+    # Usual port for a_transport
+    def default_port(self, a_transport):
+        return {'visca-ip': g_visca_udp_port,
+                'tcp': g_visca_tcp_port,
+                'raw-udp': g_visca_raw_udp_port}[a_transport]
+
+    #===========================================================================
+    # How to reach camera a_camera
+    # Throws ErrorEx if it isn't known
+    def get_route(self, a_camera):
+        route = self.find_route(a_camera)
+        if route is None:
+            raise ErrorEx(f'Unknown camera {a_camera}')
+        return route
+
+    #===========================================================================
+    # Close the serial ports and any IP connections
+    def close(self):
+        self.ip_channels.close()
+        for channel in self.serial_channels.values():
+            channel.close()
+
+    #===========================================================================
+    # Send the message a_bytes to the specified a_address (a camera name)
+    # return a bytearrary with the reply if a_rxExpected is non-zero.
+    # If the camera doesn't reply, send it again up to g_retry_count times
+    # unless a_retry is False. Fails at once if the camera is offline.
+    # Throws ErrorEx on failure
+    def send_visca(self, a_address, a_bytes, a_rxExpected, a_retry=True):
+        camera = str(a_address)
+        if camera == g_broadcast_camera:
+            return self.send_visca_broadcast(a_bytes, a_rxExpected)
+        route = self.get_route(camera)
+        g_camera_health.check(camera)
+
+        retries = g_retry_count if a_retry else 0
+        delay = g_retry_delay
+        while True:
+            try:
+                reply = self.send_visca_once(camera, route, a_bytes, a_rxExpected)
+            except TransientErrorEx as ex:
+                if ex.answered:
+                    # There, but slow: don't repeat what it has started
+                    g_camera_health.succeeded(camera)
+                    raise
+                # Stop early if another command found the camera offline
+                if (retries <= 0) or g_camera_health.is_offline(camera):
+                    g_camera_health.failed(camera)
+                    raise
+            except ErrorEx:
+                # Such as an Error reply: the camera is there
+                g_camera_health.succeeded(camera)
+                raise
+            else:
+                g_camera_health.succeeded(camera)
+                return reply
+
+            retries -= 1
+            g_log.info('No reply from camera %s, retrying in %.1f sec', camera, delay)
+            g_metrics.count('visca_retries_total', {'camera': camera})
+            time.sleep(delay)
+            delay *= 2
+
+    #===========================================================================
+    # Send the message a_bytes to a_camera by a_route, once
+    # return a bytearrary with the reply if a_rxExpected is non-zero
+    # Throws ErrorEx on failure, TransientErrorEx if there was no reply
+    def send_visca_once(self, a_camera, a_route, a_bytes, a_rxExpected):
+        channel = a_route.channel
+        if channel is None:
+            a_bytes[0] = a_route.address + 0x80
+            g_log.debug('Simulate sending %d bytes: %s', len(a_bytes), LazyHex(a_bytes))
             if a_rxExpected != 0:
                 # Reply data expected
                 s = bytearray(a_rxExpected)
-                print(f'Simulate receiving {a_rxExpected} bytes: {s.hex(" ")}')
+                g_log.debug('Simulate receiving %d bytes: %s', a_rxExpected, LazyHex(s))
                 return s
+            return None
 
-        else:
-            # Discard any stale input before we send
-            self.serial_port.reset_input_buffer()
-            print(f'Sending {len(a_bytes)} bytes: {a_bytes.hex(" ")}')
-            self.serial_port.write(a_bytes)
+        a_bytes[0] = channel.header(a_route.address)
+        started = time.perf_counter()
+        request = channel.start(a_camera, a_route.address, a_bytes, a_rxExpected)
+        try:
+            # Reply address is the remote address | 8
+            return self.receive_visca_reply(request, ((a_bytes[0] & 0x07) | 8) << 4)
+        finally:
+            channel.finish(request)
+            self.record(channel.CAPTURE, channel.capture_address(a_route.address),
+                        a_bytes, request.received, started)
 
-            s = self.serial_port.timeout = 1    # 1-second normal timeout
-            if a_rxExpected != 0:
-                # Reply data expected
-                s = self.serial_port.read(a_rxExpected)
-                print(f'Received {len(s)} bytes: {s.hex(" ")}')
-                if len(s) != a_rxExpected:
-                    raise ErrorEx('Incorrect serial response: ' + s.hex(' '))
-                return s
-            else:
-                # No data reply: should get Ack, Completion
-                #   0  1  2   3  4  5
-                #   X0 4s FF  X0 5s FF
-                # where "X" is the remote address | 8 and s is the socket number.
-                s = self.serial_port.read(6)
-                got = len(s)
-                print(f'Received Ack/Comp {got} bytes: {s.hex(" ")}')
-                repAddr = (int(a_address) | 8) << 4
-                if (got < 3) or (s[0] != repAddr) or ((s[1] & 0xF0) != 0x40):
-                    raise ErrorEx('Expected Ack, got ' + s.hex(' '))
-
-                # Aver VC520+ returns Completion immediately for all commands.
-                # Vaddio HD-20 may delay Completion until the command is done,
-                # which could be 10 seconds for a long pan at slow speed.
-                # (Oddly, HD-20 delays Completion for goto-preset, but NOT for
-                # move-absolute, which may take just as long.)
-                if got < 6:
-                    # Try to read the remaining bytes using a long timeout.
-                    # (Timeout is reset before the next read)
-                    self.serial_port.timeout = 20
-                    s = s + self.serial_port.read(6 - got)
-                    print(f'  Then received {len(s)} bytes: {s.hex(" ")}')
-
-                if (len(s) < 6) or (s[3] != repAddr) or ((s[4] & 0xF0) != 0x50):
-                    raise ErrorEx('Expected Completion, got ' + s.hex(" "))
-
-    #===========================================================================
-    # Send the message a_bytes to the specified a_address via UDP
-    # return a bytearrary with the reply if a_rxExpected is non-zero
+    #===========================================================================
+    # Send the message a_bytes to all serial cameras on every port, using
+    # address 8. There are no replies, so inquiries can't be broadcast.
     # Throws ErrorEx on failure
-    def send_visca_udp(self, a_address, a_bytes, a_rxExpected):
-        global g_sequence_number
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-        # Discard any stale input before we send
-        while True:
-            readable, _, _ = select.select([sock], [], [], 0)
-            if not readable:
-                break
-            data = sock.recv(1024)
-            print(f'Discarding {len(data)} bytes: {data.hex(" ")}')
-
-        # Prepend an 8-byte VISCA-over-IP header to the message
-        # Second byte is supposed to be 0x00 for a command, 0x10 for an inquiry
-        # according to both Aver and Sony documents.
-        # But my Aver VC520 PRO won't respond if the second byte isn't 0x00
-        buf = bytearray(2)
-        buf[0] = 0x01
-        buf[1] = 0x00 # if a_rxExpected == 0 else 0x10
-        buf.extend(len(a_bytes).to_bytes(2, byteorder='big'))  # Payload length
-        g_sequence_number += 1
-        buf.extend(g_sequence_number.to_bytes(4, byteorder='big'))
-
-        # Always specify address 1 within the packet
-        a_bytes[0] = 0x81
-        buf.extend(a_bytes)
-
-        print(f'Sending to {a_address}: {len(a_bytes)} bytes: {a_bytes.hex(" ")}')
-        sock.sendto( buf, (a_address, g_visca_udp_port) )
-
-        sock.settimeout(1.0)    # 1-second normal timeout
+    def send_visca_broadcast(self, a_bytes, a_rxExpected):
         if a_rxExpected != 0:
+            raise ErrorEx('Inquiries cannot be broadcast')
+
+        a_bytes[0] = 0x88
+        if not self.serial_channels:
+            g_log.debug('Simulate broadcasting %d bytes: %s', len(a_bytes), LazyHex(a_bytes))
+        for channel in self.serial_channels.values():
+            started = time.perf_counter()
+            channel.broadcast(a_bytes)
+            self.record(visca_capture.BROADCAST, f'{channel.name}:{g_broadcast_camera}',
+                        a_bytes, b'', started)
+        return None
+
+    #===========================================================================
+    # Add an exchange that started at a_started (from time.perf_counter())
+    # to the capture file, if there is one
+    def record(self, a_transport, a_address, a_bytes, a_received, a_started):
+        if g_recorder is not None:
+            latency = time.perf_counter() - a_started
+            g_recorder.record(a_transport, a_address, a_bytes, a_received,
+                              time.time() - latency, latency)
+
+    #===========================================================================
+    # Wait for the replies to a_request, which come from a_repAddr
+    # return a bytearrary with the reply if one is expected
+    # Throws ErrorEx on failure
+    def receive_visca_reply(self, a_request, a_repAddr):
+        capabilities = g_camera_directory.get(a_request.camera)
+        # Normally a 1-second timeout
+        started = time.perf_counter()
+        data = a_request.wait_reply(capabilities['reply_timeout'])
+        now = time.perf_counter()
+        observe_phase('reply' if a_request.rx_expected else 'ack', a_request.camera, now - started)
+        started = now
+        if a_request.rx_expected != 0:
             # Reply data expected
-            data = self.receive_visca_ip_datagram( sock )
-            print(f'Received {len(data)} bytes: {data.hex(" ")}')
-            if len(data) != a_rxExpected:
-                raise ErrorEx('Incorrect serial response: ' + data.hex(' '))
+            g_log.debug('Received %d bytes: %s', len(data), LazyHex(data))
+            if len(data) != a_request.rx_expected:
+                raise ErrorEx('Incorrect serial response: ' + self.describe_reply(data))
             return data
         else:
             # No data reply: should get Ack, Completion
-            #   (8-byte header) 0  1  2   (8-byte header) 0  1  2
-            #                   81 4s FF                  X0 5s FF
-            # s is the socket number.
+            #   0  1  2   0  1  2
+            #   X0 4s FF  X0 5s FF
+            # where "X" is the remote address | 8 and s is the socket number.
+            # (For VISCA over IP, each has an 8-byte header, already removed.)
             #
             # Aver VC520 PRO returns Completion immediately for all commands,
             # but as a separate UDP packet
-            data = self.receive_visca_ip_datagram( sock )
             got = len(data)
-            print(f'Received Ack/Comp {got} bytes: {data.hex(" ")}')
-
-            # Address in VISCA over IP reply always 0x80 + 1
-            repAddr = 0x90
-            if (got < 3) or (data[0] != repAddr) or ((data[1] & 0xF0) != 0x40):
-                raise ErrorEx('Expected Ack, got ' + data.hex(' '))
-
+            g_log.debug('Received Ack/Comp %d bytes: %s', got, LazyHex(data))
+
+            repAddr = a_repAddr
+            if (got == 3) and (data[0] == repAddr) and ((data[1] & 0xF0) == visca_codec.COMPLETION):
+                # UDP may deliver the Completion before its Ack
+                ack = a_request.wait_reply(capabilities['reply_timeout'])
+                g_log.debug('  Then received Ack %d bytes: %s', len(ack), LazyHex(ack))
+                data = ack + data
+                got = len(data)
+
+            if (got < 3) or (data[0] != repAddr) or ((data[1] & 0xF0) != visca_codec.ACK):
+                raise ErrorEx('Expected Ack, got ' + self.describe_reply(data))
+            a_request.ack_socket = data[1] & 0x0F
+
+            # Aver VC520+ returns Completion immediately for all commands.
+            # Vaddio HD-20 may delay Completion until the command is done,
+            # which could be 10 seconds for a long pan at slow speed.
+            # (Oddly, HD-20 delays Completion for goto-preset, but NOT for
+            # move-absolute, which may take just as long.)
             if got < 6:
-                # Try to read the remaining bytes using a long timeout.
-                # (Timeout is reset before the next read)
-                sock.settimeout(20.0)
-                data2 = self.receive_visca_ip_datagram( sock )
-                print(f'  Then received {len(data2)} bytes: {data2.hex(" ")}')
+                # Wait for the Completion, using a long timeout unless the
+                # model is known to answer at once. Meanwhile the camera's
+                # next command may go out, on its other socket.
+                release_camera_worker()
+                data2 = a_request.wait_reply(capabilities['completion_timeout'])
+                observe_phase('completion', a_request.camera, time.perf_counter() - started)
+                g_log.debug('  Then received %d bytes: %s', len(data2), LazyHex(data2))
                 data += data2
 
-            if (len(data) < 6) or (data[3] != repAddr) or ((data[4] & 0xF0) != 0x50):
-                raise ErrorEx('Expected Completion, got ' + data.hex(' '))
+            if (len(data) < 6) or (data[3] != repAddr) or ((data[4] & 0xF0) != visca_codec.COMPLETION):
+                raise ErrorEx('Expected Completion, got ' + self.describe_reply(data))
 
     #===========================================================================
-    # Try to receive a VISCA-IP datagram.
-    # Validate, return the VISCA portion
-    # Throw ErrorEx if not
-    def receive_visca_ip_datagram(self, a_socket):
-        data = a_socket.recv(1024)
-        #print('UDP Received', len(data), 'bytes:', data.hex(' '))
+    # Reply bytes as hex, with the meaning of a trailing Error reply
+    def describe_reply(self, a_data):
+        text = a_data.hex(' ')
+        error = visca_codec.describe_error(a_data[-4:])
+        if error is not None:
+            text += f' ({error})'
+        return text
 
-        # For Aver VC520 Pro, rxLen in the header is always 1, so ignore it.
-        # TODO: should we verify the sequence number?
-        rxLen = int.from_bytes( data[2:4], byteorder='big')
-        seq   = int.from_bytes( data[4:8], byteorder='big')
-
-        # print('VISCA Received', len(data), 'bytes with sequence', seq)
-
-        # Return the data after the VISCA-IP header
-        return data[8:]
+    #===========================================================================
+    # Build a message with visca_codec function a_encoder
+    # Throws ErrorEx if a parameter doesn't fit
+    def encode(self, a_encoder, *a_args):
+        try:
+            return a_encoder(*a_args)
+        except ValueError:
+            raise ErrorEx('Parameter value out of range')
 
     #===========================================================================
     # Validate a string or integer parameter value as an integer
@@ -245,82 +1390,136 @@ class ViscaTalker:
             raise ErrorEx('Expected integer value')
 
     #===========================================================================
-    # Convert a 16-bit unsigned integer from a VISCA response into a signed value
-    def as_signed(self, a_value):
-        if a_value >= 0x8000:
-            return -(0x10000 - a_value)
-        return a_value
+    # A speed parameter as an integer, no more than the camera's a_limit
+    # capability. Throw ErrorEx if not an integer.
+    def limit_speed(self, a_address, a_limit, a_value):
+        return min(self.parm_as_int(a_value), g_camera_directory.get(a_address)[a_limit])
+
+    #===========================================================================
+    # Get the CameraState for a_address. Caller holds state_lock.
+    def get_state(self, a_address):
+        key = str(a_address)
+        state = self.states.get(key)
+        if state is None:
+            state = CameraState()
+            self.states[key] = state
+        return state
 
     #===========================================================================
-    # Convert a signed parameter value into a 16-bit value for a VISCA buffer
-    def signed_parm_as_unsigned(self, a_value):
-        val = self.parm_as_int(a_value)
-        if val < 0:
-            return (0x10000 + val)
-        return val
+    # Record a new position and/or zoom for a_address.
+    # Values of None are unchanged.
+    def update_state(self, a_address, a_pan=None, a_tilt=None, a_zoom=None):
+        if str(a_address) == g_broadcast_camera:
+            # Sent without Completion, so we don't know when they get there
+            self.invalidate_state(a_address, (a_pan is not None), (a_zoom is not None))
+            return
+
+        now = time.monotonic()
+        with self.state_lock:
+            state = self.get_state(a_address)
+            if (a_pan is not None) and (a_tilt is not None):
+                state.pan = a_pan
+                state.tilt = a_tilt
+                state.position_time = now
+            if a_zoom is not None:
+                state.zoom = a_zoom
+                state.zoom_time = now
+
+    #===========================================================================
+    # Forget the position and/or zoom for a_address, when the camera
+    # may be moving, or has moved to a position we don't know
+    # A broadcast affects every serial camera. A preset being recalled is
+    # forgotten too, since the camera is no longer headed there.
+    def invalidate_state(self, a_address, a_position=True, a_zoom=True):
+        with self.state_lock:
+            if str(a_address) == g_broadcast_camera:
+                states = [state for key, state in self.states.items()
+                          if self.is_serial(key)]
+            else:
+                states = [self.get_state(a_address)]
+            for state in states:
+                if a_position:
+                    state.pan = None
+                    state.tilt = None
+                if a_zoom:
+                    state.zoom = None
+                state.heading_preset = None
+                state.heading_axes = set()
+
+    #===========================================================================
+    # True if camera a_camera is reached by serial port
+    def is_serial(self, a_camera):
+        route = self.find_route(a_camera)
+        return (route is not None) and (route.kind == 'serial')
 
     #===========================================================================
     # Get the current pan and tilt
+    # If a_max_age is non-zero, a cached position up to a_max_age seconds old
+    # may be returned instead of asking the camera.
     # Throws ErrorEx on failure
-    def get_position(self, a_address):
-        # Expect a position reply:
-        # 0  1  2  3  4  5  6  7  8  9  10
-        # y0 50 0Y 0Y 0Y 0Y 0V 0V 0V 0V FF
+    def get_position(self, a_address, a_max_age=0):
+        if a_max_age > 0:
+            with self.state_lock:
+                state = self.get_state(a_address)
+                if (state.pan is not None) and \
+                   (time.monotonic() - state.position_time <= a_max_age):
+                    return state.pan, state.tilt
+
         try:
-            ry = self.send_visca(a_address, self.visca_get_position, 11)
+            ry = self.send_visca(a_address, visca_codec.get_position(),
+                                 visca_codec.POSITION_REPLY_LENGTH)
         except ErrorEx as ex:
             ex.add('get_position failed')
             raise
 
-        pan  = self.as_signed( (ry[2] << 12) | (ry[3] << 8) | (ry[4] << 4) | ry[5] )
-        tilt = self.as_signed( (ry[6] << 12) | (ry[7] << 8) | (ry[8] << 4) | ry[9] )
+        pan, tilt = visca_codec.decode_position(ry)
+        self.update_state(a_address, a_pan=pan, a_tilt=tilt)
+        self.learn_motion(a_address, {'pan': pan, 'tilt': tilt})
         return pan, tilt
 
     #===========================================================================
     # Set the pan and tilt
     # Throws ErrorEx on failure
     def set_position(self, a_address, a_pan, a_tilt, a_speed):
-        # Sony docs say [4] is pan speed, [5] is tilt speed; range 01 to 18 or 32
-        #    if [5] is 0, use [4] for both pan and tilt
-        # Aver docs show [4] and [5] both 0
-        # Vaddio HD-20 docs say pan-speed is [5], tilt-speed [4], but
-        # test with HD-20 actually uses [4]
-        self.visca_set_position[4] = self.parm_as_int(a_speed)
-        self.visca_set_position[5] = self.parm_as_int(a_speed)
-
-        val = self.signed_parm_as_unsigned(a_pan)
-        self.visca_set_position[6] = (val >> 12) & 0x0F
-        self.visca_set_position[7] = (val >> 8)  & 0x0F
-        self.visca_set_position[8] = (val >> 4)  & 0x0F
-        self.visca_set_position[9] = (val)       & 0x0F
-
-        val = self.signed_parm_as_unsigned(a_tilt)
-        self.visca_set_position[10] = (val >> 12) & 0x0F
-        self.visca_set_position[11] = (val >> 8)  & 0x0F
-        self.visca_set_position[12] = (val >> 4)  & 0x0F
-        self.visca_set_position[13] = (val)       & 0x0F
+        pan  = self.parm_as_int(a_pan)
+        tilt = self.parm_as_int(a_tilt)
+        speed = self.limit_speed(a_address, 'pan_speed_max', a_speed)
+        msg = self.encode(visca_codec.set_position, pan, tilt, speed)
 
         # Expect Ack, Complete
+        self.invalidate_state(a_address, a_zoom=False)
         try:
-            self.send_visca(a_address, self.visca_set_position, 0)
+            self.send_visca(a_address, msg, 0)
         except ErrorEx as ex:
             ex.add('set_position failed')
             raise
 
+        # Remember where the camera is headed, so a following jog needn't ask
+        self.update_state(a_address, a_pan=pan, a_tilt=tilt)
+
     #===========================================================================
     # Get the current zoom setting
+    # If a_max_age is non-zero, a cached zoom up to a_max_age seconds old
+    # may be returned instead of asking the camera.
     # Throws ErrorEx on failure
-    def get_zoom(self, a_address):
-        # Expect a zoom reply:
-        # 0  1  2  3  4  5  6
-        # y0 50 0Y 0Y 0Y 0Y FF
+    def get_zoom(self, a_address, a_max_age=0):
+        if a_max_age > 0:
+            with self.state_lock:
+                state = self.get_state(a_address)
+                if (state.zoom is not None) and \
+                   (time.monotonic() - state.zoom_time <= a_max_age):
+                    return state.zoom
+
         try:
-            ry = self.send_visca(a_address, self.visca_get_zoom, 7)
+            ry = self.send_visca(a_address, visca_codec.get_zoom(),
+                                 visca_codec.ZOOM_REPLY_LENGTH)
         except ErrorEx as ex:
             ex.add('get_zoom failed')
             raise
 
-        zoom = (ry[2] << 12) | (ry[3] << 8) | (ry[4] << 4) | ry[5]
+        zoom = visca_codec.decode_zoom(ry)
+        self.update_state(a_address, a_zoom=zoom)
+        self.learn_motion(a_address, {'zoom': zoom})
         return zoom
 
     #===========================================================================
@@ -329,47 +1528,34 @@ class ViscaTalker:
     def set_zoom(self, a_address, a_zoom):
         try:
             val = self.parm_as_int(a_zoom)
-            self.visca_set_zoom[4] = (val >> 12) & 0x0F
-            self.visca_set_zoom[5] = (val >> 8)  & 0x0F
-            self.visca_set_zoom[6] = (val >> 4)  & 0x0F
-            self.visca_set_zoom[7] = (val)       & 0x0F
-            self.send_visca(a_address, self.visca_set_zoom, 0)
+            self.invalidate_state(a_address, a_position=False)
+            self.send_visca(a_address, visca_codec.set_zoom(val), 0)
         except ErrorEx as ex:
             ex.add('set_zoom failed')
             raise
 
+        self.update_state(a_address, a_zoom=val)
+
     #===========================================================================
     # Start or stop pan and/or tilt: direction is up/down/left/right/stop. Speed as desired
     # Throws ErrorEx on failure
     def do_slew(self, a_address, a_pan_direction, a_pan_speed, a_tilt_direction, a_tilt_speed):
         try:
-            # Sony and Aver docs say [4] is pan speed, [5] is tilt; range 01 to 18 or 32
-            # (though Aver VC520+ seems to ignore speed)
             # Vaddio HD-20 docs say pan-speed is [5], tilt-speed [4], but
             # test with HD-20 actually uses [4]
-            self.visca_slew[4] = self.parm_as_int(a_pan_speed)
-            if a_pan_direction == 'left':
-                self.visca_slew[6] = 0x01
-            elif a_pan_direction == 'right':
-                self.visca_slew[6] = 0x02
-            elif a_pan_direction == 'stop':
-                self.visca_slew[6] = 0x03
-                self.visca_slew[4] = 0
-            else:
+            pan_direction = visca_codec.PAN_DIRECTIONS.get(a_pan_direction)
+            if pan_direction is None:
                 raise ErrorEx('Invalid pan direction')
-
-            self.visca_slew[5] = self.parm_as_int(a_tilt_speed)
-            if a_tilt_direction == 'up':
-                self.visca_slew[7] = 0x01
-            elif a_tilt_direction == 'down':
-                self.visca_slew[7] = 0x02
-            elif a_tilt_direction == 'stop':
-                self.visca_slew[7] = 0x03
-                self.visca_slew[5] = 0
-            else:
+            tilt_direction = visca_codec.TILT_DIRECTIONS.get(a_tilt_direction)
+            if tilt_direction is None:
                 raise ErrorEx('Invalid tilt direction')
+            msg = self.encode(visca_codec.slew,
+                              pan_direction, self.limit_speed(a_address, 'pan_speed_max', a_pan_speed),
+                              tilt_direction, self.limit_speed(a_address, 'tilt_speed_max', a_tilt_speed))
 
-            self.send_visca(a_address, self.visca_slew, 0)
+            # Position is unknown once the camera starts (or stops) moving
+            self.invalidate_state(a_address, a_zoom=False)
+            self.send_visca(a_address, msg, 0)
         except ErrorEx as ex:
             ex.add('do_slew failed')
             raise
@@ -378,19 +1564,15 @@ class ViscaTalker:
     # Start or stop zoom: "in", "out", or "stop"
     # Throws ErrorEx on failure
     def do_zoom(self, a_address, a_direction, a_speed):
-        # Sony and Vaddio HD-20 docs show speed range 0 to 7
-        # Aver says speed not supported. Verified on VC520 + and PRO
-        try:
-            if a_direction == 'in':
-                self.visca_zoom[4] = 0x20 + (int(a_speed) & 0x0F)
-            elif a_direction == 'out':
-                self.visca_zoom[4] = 0x30 + (int(a_speed) & 0x0F)
-            elif a_direction == 'stop':
-                self.visca_zoom[4] = 0x00
-            else:
+        try:
+            direction = visca_codec.ZOOM_DIRECTIONS.get(a_direction)
+            if direction is None:
                 raise ErrorEx('Invalid zoom direction')
+            msg = self.encode(visca_codec.zoom, direction,
+                              self.limit_speed(a_address, 'zoom_speed_max', a_speed))
 
-            self.send_visca(a_address, self.visca_zoom, 0)
+            self.invalidate_state(a_address, a_position=False)
+            self.send_visca(a_address, msg, 0)
         except ErrorEx as ex:
             ex.add('do_zoom failed')
             raise
@@ -400,11 +1582,23 @@ class ViscaTalker:
     # Throws ErrorEx on failure
     def goto_preset(self, a_address, a_preset):
         try:
-            val = self.parm_as_int(a_preset)
-            self.visca_goto_preset[5] = val
-            self.send_visca(a_address, self.visca_goto_preset, 0)
+            preset = self.parm_as_int(a_preset)
+            msg = self.encode(visca_codec.goto_preset, preset)
+            self.invalidate_state(a_address)
+
+            # Learn where the preset is when the camera settles, unless
+            # another command moves it first
+            with self.state_lock:
+                state = self.get_state(a_address)
+                state.heading_preset = preset
+                state.heading_time = time.monotonic()
+                state.heading_axes = {'pan', 'tilt', 'zoom'}
+                state.heading_moved = set()
+
+            self.send_visca(a_address, msg, 0)
 
         except ErrorEx as ex:
+            self.invalidate_state(a_address)
             ex.add('goto_preset failed')
             raise
 
@@ -413,48 +1607,1070 @@ class ViscaTalker:
     # Throws ErrorEx on failure
     def set_preset(self, a_address, a_preset):
         try:
-            val = self.parm_as_int(a_preset)
-            self.visca_set_preset[5] = val
-            self.send_visca(a_address, self.visca_set_preset, 0)
+            preset = self.parm_as_int(a_preset)
+            msg = self.encode(visca_codec.set_preset, preset)
+            self.send_visca(a_address, msg, 0)
         except ErrorEx as ex:
             ex.add('set_preset failed')
             raise
 
+        # The preset is wherever the camera is, if we know
+        now = time.monotonic()
+        with self.state_lock:
+            state = self.get_state(a_address)
+            position = {}
+            if (state.pan is not None) and (now - state.position_time <= g_state_max_age):
+                position['pan'] = state.pan
+                position['tilt'] = state.tilt
+            if (state.zoom is not None) and (now - state.zoom_time <= g_state_max_age):
+                position['zoom'] = state.zoom
+            state.preset_positions[preset] = position
+
+        if len(position) == 3:
+            g_preset_store.put(a_address, preset, position)
+
     #===========================================================================
-    # Get the current pan and tilt
+    # Wait for the camera to stop moving, and return its position and zoom.
+    # Waits at least g_settle_min_time, in case a move hasn't started yet.
+    # Throws ErrorEx on failure, or if still moving after a_timeout seconds
+    def wait_until_settled(self, a_address, a_timeout):
+        started = time.monotonic()
+        last = None
+        while True:
+            pan, tilt = self.get_position(a_address)
+            zoom = self.get_zoom(a_address)
+            position = {'pan': pan, 'tilt': tilt, 'zoom': zoom}
+            now = time.monotonic()
+            if (position == last) and (now - started >= g_settle_min_time):
+                return position
+            if now - started > a_timeout:
+                raise ErrorEx(f'Camera {a_address} still moving after {a_timeout} seconds')
+            last = position
+            time.sleep(g_settle_interval)
+
+    #===========================================================================
+    # Learn from a_values, an inquiry reply by axis: how fast the camera
+    # moves, and where a preset being recalled ends up.
+    def learn_motion(self, a_address, a_values):
+        now = time.monotonic()
+        with self.state_lock:
+            state = self.get_state(a_address)
+            for axis, value in a_values.items():
+                last = state.samples.get(axis)
+                state.samples[axis] = (value, now)
+                if (last is None) or (now - last[1] > g_learn_max_gap):
+                    continue
+
+                if value == last[0]:
+                    # Not moving. If recalling a preset, it's here once the
+                    # axis has moved, or had time to start.
+                    if (axis in state.heading_axes) and \
+                       ((axis in state.heading_moved) or (now - state.heading_time > 1.0)):
+                        state.heading_axes.discard(axis)
+                        state.preset_positions.setdefault(state.heading_preset, {})[axis] = value
+                    continue
+
+                state.heading_moved.add(axis)
+
+                # Moving. Samples taken while speeding up or slowing down are
+                # slower than full speed, so ignore those well below it.
+                speed = abs(value - last[0]) / (now - last[1])
+                known = state.speeds.get(axis)
+                if known is None:
+                    state.speeds[axis] = speed
+                elif speed >= known / 2:
+                    state.speeds[axis] = known + 0.25 * (speed - known)
+
+            if not state.heading_axes:
+                state.heading_preset = None
+
+    #===========================================================================
+    # Position of a_preset by axis, as far as we know it
+    # Throws ErrorEx if not known
+    def get_preset_position(self, a_address, a_preset):
+        preset = self.parm_as_int(a_preset)
+        with self.state_lock:
+            position = self.get_state(a_address).preset_positions.get(preset)
+        if not position:
+            position = g_preset_store.get(a_address, preset)
+        if not position:
+            raise ErrorEx(f'Position of preset {preset} not yet known')
+        return dict(position)
+
+    #===========================================================================
+    # Predict how long a move from a_from to a_to will take.
+    # Each is a dict with any of pan, tilt and zoom. Axes move at once,
+    # so the slowest decides.
+    # Throws ErrorEx if an axis's speed hasn't been learned
+    def predict_move(self, a_address, a_from, a_to):
+        response = {}
+        seconds = 0.0
+        with self.state_lock:
+            speeds = dict(self.get_state(a_address).speeds)
+        for axis in ('pan', 'tilt', 'zoom'):
+            if (axis not in a_from) or (axis not in a_to):
+                continue
+            distance = abs(self.parm_as_int(a_to[axis]) - self.parm_as_int(a_from[axis]))
+            if distance == 0:
+                axis_seconds = 0.0
+            elif speeds.get(axis):
+                axis_seconds = distance / speeds[axis]
+            else:
+                raise ErrorEx(f'Camera {a_address} {axis} speed not yet learned')
+            response[axis + '_seconds'] = round(axis_seconds, 3)
+            seconds = max(seconds, axis_seconds)
+
+        response['seconds'] = round(seconds + g_move_overhead, 3)
+        response['speeds'] = {axis: round(speed, 1) for axis, speed in speeds.items()}
+        return response
+
+    #===========================================================================
+    # Get the vendor, model, ROM version and number of sockets
     # Throws ErrorEx on failure
     def get_version_info(self, a_address):
-        # Expect a position reply:
-        # 0  1  2  3  4  5  6  7  8  9
-        # y0 50 GG GG HH HH JJ JJ KK FF
         try:
-            ry = self.send_visca(a_address, self.visca_version_inq, 10)
+            ry = self.send_visca(a_address, visca_codec.version_inquiry(),
+                                 visca_codec.VERSION_REPLY_LENGTH)
         except ErrorEx as ex:
             ex.add('get_version_info failed')
             raise
 
-        vendor  = (ry[2] << 8) | ry[3]
-        model   = (ry[4] << 8) | ry[5]
-        version = (ry[6] << 8) | ry[7]
-        socket  = ry[8]
-        return vendor, model, version, socket
+        return visca_codec.decode_version(ry)
+
+#==============================================================================
+# One unit of work for a CameraWorker: a function returning a response dict
+#
+# Jobs with the same a_merge_key supersede one another: if a job is submitted
+# while an earlier job with the same key is still waiting in the queue, the
+# earlier job runs the newer function instead, and both submitters get its
+# response. Used so that a burst of slew/stop requests only sends the latest.
+#
+# A droppable job is an interactive motion command that a later one makes
+# stale, so it may be dropped when its camera's queue is full, or when a stop
+# with the same merge key arrives. A stop job is always queued, and so is a
+# job that isn't limited (from a batch or the scheduler), since later
+# commands may depend on it.
+class CameraJob:
+    def __init__(self, a_function, a_merge_key=None):
+        self.function = a_function
+        self.merge_key = a_merge_key
+        self.response = None
+        self.done = threading.Event()
+        self.droppable = False
+        self.is_stop = False
+        self.limited = True
+        # True if the camera's next job may start once this job's command is
+        # Acked, while it waits for the Completion. Only for jobs that send a
+        # single command, so their commands stay in order.
+        self.overlap = False
+        # HTTP status for the response, and seconds to wait before retrying
+        # if the job was refused
+        self.http_status = 200
+        self.retry_after = None
+        # For metrics: the command name, and when the job was queued
+        self.command = 'none'
+        self.queued_time = None
+
+    #===========================================================================
+    # Make a job that is already done, with response a_response
+    @classmethod
+    def completed(cls, a_response):
+        job = cls(None)
+        job.response = a_response
+        job.done.set()
+        return job
+
+    #===========================================================================
+    # Make a job that has already failed, with a list of error strings
+    @classmethod
+    def failed(cls, a_errors):
+        return cls.completed({'status': 'fail', 'errors': a_errors})
+
+    #===========================================================================
+    # Finish the job without running it, because its camera is too busy
+    def refuse(self, a_http_status, a_error, a_retry_after):
+        self.http_status = a_http_status
+        self.retry_after = a_retry_after
+        self.response = {'status': 'fail', 'errors': [a_error]}
+        if a_retry_after is not None:
+            self.response['retry_after'] = a_retry_after
+        self.done.set()
+
+    #===========================================================================
+    # Try to absorb a_job, which was submitted after this one.
+    # Called only while this job is waiting in the queue.
+    # Return True if merged, so a_job needn't be run.
+    def merge(self, a_job):
+        if (self.merge_key is None) or (self.merge_key != a_job.merge_key):
+            return False
+        self.function = a_job.function
+        self.droppable = a_job.droppable
+        self.is_stop = a_job.is_stop
+        return True
+
+    #===========================================================================
+    # Called on the worker thread
+    def run(self):
+        global g_error_count
+        g_metrics_context.command = self.command
+        try:
+            self.response = self.function()
+        except Exception as exc:
+            # Don't let a surprise (such as a socket timeout) kill the worker
+            self.response = {'status': 'fail', 'errors': [f'{type(exc).__name__}: {exc}']}
+            with g_counter_lock:
+                g_error_count += 1
+        self.done.set()
+
+    #===========================================================================
+    # Wait for the job to be run, and return its response
+    def wait(self):
+        self.done.wait()
+        return self.response
+
+#==============================================================================
+# The same command for a list of cameras.
+#
+# Each camera's job is queued on its own worker, so the cameras move at the
+# same time: serial cameras on one chain overlap their commands, rather than
+# each waiting for the previous camera's Completion.
+class GroupJob:
+    def __init__(self, a_cameras, a_jobs):
+        self.cameras = a_cameras
+        self.jobs = a_jobs
+        # A camera that refuses its job is reported in the results
+        self.http_status = 200
+        self.retry_after = None
+
+    #===========================================================================
+    # Wait for every camera, and return a response with a result for each
+    def wait(self):
+        response = {}
+        response['results'] = [job.wait() for job in self.jobs]
+
+        errors = []
+        for camera, result in zip(self.cameras, response['results']):
+            if result.get('status') != 'ok':
+                errors.append(f'camera {camera} failed')
+        if errors:
+            response['status'] = 'fail'
+            response['errors'] = errors
+        else:
+            response['status'] = 'ok'
+
+        return response
+
+#==============================================================================
+# Job to jog pan, tilt and/or zoom relative to the current position.
+#
+# The dock's jog timer may send jogs faster than the camera completes them.
+# Jogs that queue up behind one another are merged into a single move by
+# summing their offsets, so the camera follows the operator's hand rather
+# than replaying a backlog seconds late.
+class JogJob(CameraJob):
+    def __init__(self, a_camera, a_pan, a_tilt, a_zoom, a_speed):
+        super().__init__(self.jog, 'jog')
+        self.droppable = True
+        self.camera = a_camera
+        self.pan    = a_pan
+        self.tilt   = a_tilt
+        self.zoom   = a_zoom
+        self.speed  = a_speed
+
+    #===========================================================================
+    def merge(self, a_job):
+        if not isinstance(a_job, JogJob):
+            return False
+        self.pan  += a_job.pan
+        self.tilt += a_job.tilt
+        self.zoom += a_job.zoom
+        self.droppable = self.droppable and a_job.droppable
+        if a_job.pan or a_job.tilt:
+            self.speed = a_job.speed
+        return True
+
+    #===========================================================================
+    def jog(self):
+        response = {}
+        response['status'] = 'fail'
+
+        try:
+            if self.pan or self.tilt:
+                # Read current position
+                pan_now, tilt_now = g_viscaTalker.get_position( self.camera, g_state_max_age )
+                # Set updated position
+                g_viscaTalker.set_position( self.camera, pan_now + self.pan,
+                                            tilt_now + self.tilt, self.speed )
+            if self.zoom:
+                # Read current zoom
+                zoom_now = g_viscaTalker.get_zoom( self.camera, g_state_max_age )
+                # Set updated zoom
+                g_viscaTalker.set_zoom( self.camera, zoom_now + self.zoom )
+
+            response['status'] = 'ok'
+
+        except ErrorEx as ex:
+            response['errors'] = ex.get_errors()
+
+        return response
+
+#==============================================================================
+# Thread to run jobs for one camera in the order they were submitted.
+# Commands to different cameras run in parallel, so one camera waiting for
+# a slow Completion doesn't stall the others, but commands to the same
+# camera stay ordered.
+#
+# The queue holds at most g_queue_limit limited jobs, so a client sending
+# faster than the camera can follow gets a quick refusal instead of seconds
+# of lag. A stop drops the queued slews or zooms it makes stale.
+#
+# An overlap job (go-preset) releases the worker once its command is Acked:
+# a new thread takes over the queue while the job's thread waits for the
+# Completion, so a stop needn't wait for a long preset recall to finish.
+# Only one job is released at a time, since a camera has two command
+# sockets.
+class CameraWorker:
+    def __init__(self, a_camera):
+        self.camera = a_camera
+        self.jobs = collections.deque()
+        # Average seconds to run a job, for the retry hint of a refusal
+        self.run_time = 0.1
+        self.condition = threading.Condition()
+        self.released = None        # Job waiting for its Completion
+        self.thread = None          # Thread running the queue
+        self.start_thread()
+
+    #===========================================================================
+    # Start a thread to run the queue. Caller holds condition, or is __init__.
+    def start_thread(self):
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name=f'camera {self.camera}')
+        self.thread.start()
+
+    #===========================================================================
+    # Called on the thread running a_job once its command has been Acked.
+    # If a_job may overlap, hand the queue to a new thread.
+    def release(self, a_job):
+        with self.condition:
+            if (not a_job.overlap) or (self.released is not None) or \
+               (self.thread is not threading.current_thread()):
+                return
+            self.released = a_job
+            self.start_thread()
+
+    #===========================================================================
+    # Queue a_job to be run, returning the CameraJob to wait on.
+    # That may be an earlier queued job that a_job was merged into.
+    def submit(self, a_job):
+        with self.condition:
+            if a_job.is_stop:
+                self.drop_stale(a_job)
+            # Only the last queued job may absorb a_job, so merging never
+            # moves a command ahead of a different one submitted before it
+            if self.jobs and self.jobs[-1].merge(a_job):
+                return self.jobs[-1]
+            if a_job.limited and (len(self.jobs) >= g_queue_limit) and \
+               not self.make_room(a_job):
+                return a_job
+            a_job.queued_time = time.perf_counter()
+            self.jobs.append(a_job)
+            self.condition.notify()
+            return a_job
+
+    #===========================================================================
+    # The queue is full: drop the oldest droppable job to make room for a_job,
+    # if the policy allows. Otherwise refuse a_job, unless it is a stop.
+    # Return True if a_job may be queued. Caller holds condition.
+    def make_room(self, a_job):
+        retry_after = max(1, math.ceil(self.run_time * len(self.jobs)))
+        if g_drop_policy == 'drop-oldest':
+            for job in self.jobs:
+                if job.droppable:
+                    self.jobs.remove(job)
+                    job.refuse(503, f'dropped: camera {self.camera} queue full', retry_after)
+                    self.count_dropped(job, 'dropped')
+                    return True
+
+        if a_job.is_stop:
+            return True
+
+        a_job.refuse(429, f'camera {self.camera} busy: queue full', retry_after)
+        self.count_dropped(a_job, 'rejected')
+        return False
+
+    #===========================================================================
+    # Drop queued droppable jobs with the same merge key as a_stop, which
+    # makes them stale, so the stop doesn't wait behind them.
+    # Caller holds condition.
+    def drop_stale(self, a_stop):
+        for job in [job for job in self.jobs
+                    if job.droppable and (job.merge_key == a_stop.merge_key)]:
+            self.jobs.remove(job)
+            job.refuse(503, f'dropped: camera {self.camera} stopped', None)
+            self.count_dropped(job, 'stopped')
+
+    #===========================================================================
+    def count_dropped(self, a_job, a_reason):
+        g_metrics.count('visca_dropped_total',
+                        {'command': a_job.command, 'camera': self.camera, 'reason': a_reason})
+
+    #===========================================================================
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.jobs:
+                    self.condition.wait()
+                job = self.jobs.popleft()
+            started = time.perf_counter()
+            g_metrics.observe('visca_phase_seconds',
+                              {'phase': 'queue', 'command': job.command, 'camera': self.camera},
+                              started - job.queued_time)
+            g_worker_context.worker = self
+            g_worker_context.job = job
+            job.run()
+            g_worker_context.worker = None
+            self.run_time += 0.25 * ((time.perf_counter() - started) - self.run_time)
+
+            with self.condition:
+                if self.released is job:
+                    # Another thread has the queue now
+                    self.released = None
+                    return
+
+# Workers by camera address, created on first use
+g_camera_workers = {}
+g_camera_workers_lock = threading.Lock()
+
+# The CameraWorker and job being run on this thread, if any
+g_worker_context = threading.local()
+
+#==============================================================================
+# Let the camera's next job start, if the job being run on this thread
+# may overlap. Called once a command is Acked.
+def release_camera_worker():
+    worker = getattr(g_worker_context, 'worker', None)
+    if worker is not None:
+        worker.release(g_worker_context.job)
+
+#==============================================================================
+# Get (or create) the worker for a camera address
+def get_camera_worker(a_camera):
+    key = str(a_camera)
+    with g_camera_workers_lock:
+        worker = g_camera_workers.get(key)
+        if worker is None:
+            worker = CameraWorker(key)
+            g_camera_workers[key] = worker
+        return worker
+
+#==============================================================================
+# Read a camera's position and zoom, returning a response dict
+# Throws ErrorEx on failure
+def report_camera(a_camera):
+    # Read current position
+    pan_now, tilt_now = g_viscaTalker.get_position( a_camera )
+    # Read current zoom
+    zoom_now = g_viscaTalker.get_zoom( a_camera )
+
+    response = {}
+    response['status'] = "ok"
+    response['camera'] = a_camera
+    response['pan']    = pan_now
+    response['tilt']   = tilt_now
+    response['zoom']   = zoom_now
+    return response
+
+#==============================================================================
+# Client of the StatePoller: cameras of interest, and a queue of events
+class StateSubscriber:
+    def __init__(self, a_cameras):
+        self.cameras = set(str(camera) for camera in a_cameras)
+        self.events = queue.Queue(maxsize=20)
+
+    #===========================================================================
+    # Queue an event. If the client has fallen behind, drop its oldest event.
+    def put(self, a_event):
+        while True:
+            try:
+                self.events.put_nowait(a_event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                except queue.Empty:
+                    pass
+
+#==============================================================================
+# Thread that polls the state of cameras watched by /events clients, and
+# sends changes to every client watching that camera.
+# However many docks are watching, each camera is polled once per interval.
+class StatePoller:
+    def __init__(self, a_interval):
+        self.interval = a_interval
+        self.subscribers = []
+        self.last_state = {}
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True, name='state poller')
+        self.thread.start()
+
+    #===========================================================================
+    # Add a client for a_cameras, returning its StateSubscriber
+    def subscribe(self, a_cameras):
+        subscriber = StateSubscriber(a_cameras)
+        with self.condition:
+            self.subscribers.append(subscriber)
+            # Send the new client the latest state we have
+            for camera in subscriber.cameras:
+                if camera in self.last_state:
+                    subscriber.put(self.last_state[camera])
+            self.condition.notify()
+        return subscriber
+
+    #===========================================================================
+    def unsubscribe(self, a_subscriber):
+        with self.condition:
+            self.subscribers.remove(a_subscriber)
+
+    #===========================================================================
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.subscribers:
+                    self.condition.wait()
+                cameras = set()
+                for subscriber in self.subscribers:
+                    cameras |= subscriber.cameras
+
+            # Poll all cameras in parallel, on their workers so that polls
+            # stay in order with commands. Queued polls merge.
+            started = time.monotonic()
+            jobs = {}
+            for camera in cameras:
+                job = CameraJob(lambda camera=camera: self.poll(camera), 'poll')
+                job.command = 'poll'
+                jobs[camera] = get_camera_worker(camera).submit(job)
+
+            for camera, job in jobs.items():
+                event = job.wait()
+                with self.condition:
+                    if event != self.last_state.get(camera):
+                        self.last_state[camera] = event
+                        for subscriber in self.subscribers:
+                            if camera in subscriber.cameras:
+                                subscriber.put(event)
+
+            time.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    #===========================================================================
+    # Read one camera's state, returning a report-style dict
+    def poll(self, a_camera):
+        try:
+            return report_camera(a_camera)
+        except ErrorEx as ex:
+            return {'status': 'fail', 'camera': a_camera, 'errors': ex.get_errors()}
+
+g_state_poller = None
+
+#==============================================================================
+# Velocity of one camera, as steered by a joystick.
+# Velocities are -1 to +1 for each of pan, tilt and zoom:
+# positive is left, up and in.
+class Trajectory:
+    STOP_SLEW = ('stop', 0, 'stop', 0)
+    STOP_ZOOM = ('stop', 0)
+
+    def __init__(self, a_camera):
+        self.camera = a_camera
+        self.target = [0.0, 0.0, 0.0]
+        self.current = [0.0, 0.0, 0.0]
+        # VISCA speeds for a velocity of 1: the camera's maximums
+        capabilities = g_camera_directory.get(a_camera)
+        self.max_speed = [capabilities['pan_speed_max'], capabilities['tilt_speed_max'],
+                          capabilities['zoom_speed_max']]
+        self.updated = time.monotonic()
+
+        # Commands last queued for the camera, and last done by it
+        self.sent_slew = self.STOP_SLEW
+        self.sent_zoom = self.STOP_ZOOM
+        self.done_slew = self.STOP_SLEW
+        self.done_zoom = self.STOP_ZOOM
+        self.failures = 0
+
+    #===========================================================================
+    # Move the current velocity toward the target, over a_dt seconds
+    def step(self, a_dt):
+        for axis in range(3):
+            target = self.target[axis]
+            current = self.current[axis]
+            limit = g_acceleration * a_dt
+            if (abs(target) < abs(current)) or (target * current < 0):
+                limit *= 2
+            self.current[axis] = current + max(-limit, min(limit, target - current))
+
+    #===========================================================================
+    # VISCA speed for a_velocity on a_axis, from a_min to the axis maximum
+    def speed(self, a_axis, a_velocity, a_min):
+        return max(a_min, min(self.max_speed[a_axis],
+                              round(abs(a_velocity) * self.max_speed[a_axis])))
+
+    #===========================================================================
+    # do_slew() parameters for the current velocity
+    def slew_command(self):
+        pan, tilt, zoom = self.current
+        command = ['stop', 0, 'stop', 0]
+        if abs(pan) >= g_deadband:
+            command[0:2] = ['left' if pan > 0 else 'right', self.speed(0, pan, 1)]
+        if abs(tilt) >= g_deadband:
+            command[2:4] = ['up' if tilt > 0 else 'down', self.speed(1, tilt, 1)]
+        return tuple(command)
+
+    #===========================================================================
+    # do_zoom() parameters for the current velocity
+    def zoom_command(self):
+        zoom = self.current[2]
+        if abs(zoom) < g_deadband:
+            return self.STOP_ZOOM
+        return ('in' if zoom > 0 else 'out', self.speed(2, zoom, 0))
+
+    #===========================================================================
+    # True once the camera has been told to stop, and has
+    def is_stopped(self):
+        return (not any(self.target)) and (not any(self.current)) and \
+               (self.done_slew == self.STOP_SLEW) and (self.done_zoom == self.STOP_ZOOM)
+
+#==============================================================================
+# Thread that steers cameras at the velocities set by "velocity" commands.
+#
+# A client sends a new velocity only when the operator's intent changes.
+# At each control period the planner ramps each camera's velocity toward
+# its target and, when that changes the VISCA speed, queues a slew or zoom
+# command. Queued commands merge, so a slow camera gets the latest speed
+# rather than a backlog.
+class MotionPlanner:
+    def __init__(self, a_rate):
+        self.period = 1.0 / a_rate
+        self.trajectories = {}
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True, name='motion planner')
+        self.thread.start()
+
+    #===========================================================================
+    # Set the target velocity of a_camera. Values of None are unchanged.
+    # a_max_speeds are the VISCA pan, tilt and zoom speeds for a velocity of 1.
+    def set_velocity(self, a_camera, a_velocities, a_max_speeds):
+        with self.condition:
+            trajectory = self.trajectories.get(str(a_camera))
+            if trajectory is None:
+                trajectory = Trajectory(a_camera)
+                self.trajectories[str(a_camera)] = trajectory
+            for axis in range(3):
+                velocity = a_velocities[axis]
+                if velocity is not None:
+                    velocity = max(-1.0, min(1.0, velocity))
+                    trajectory.target[axis] = velocity if abs(velocity) >= g_deadband else 0.0
+                if a_max_speeds[axis] is not None:
+                    trajectory.max_speed[axis] = a_max_speeds[axis]
+            trajectory.updated = time.monotonic()
+            trajectory.failures = 0
+            self.condition.notify()
+
+    #===========================================================================
+    def run(self):
+        last = time.monotonic()
+        while True:
+            with self.condition:
+                while not self.trajectories:
+                    self.condition.wait()
+                    last = time.monotonic()
+
+            time.sleep(max(0, self.period - (time.monotonic() - last)))
+            now = time.monotonic()
+            dt = now - last
+            last = now
+
+            with self.condition:
+                for key, trajectory in list(self.trajectories.items()):
+                    if (g_velocity_timeout > 0) and any(trajectory.target) and \
+                       (now - trajectory.updated > g_velocity_timeout):
+                        g_log.warning('No velocity from client for camera %s: stopping', key)
+                        trajectory.target = [0.0, 0.0, 0.0]
+
+                    trajectory.step(dt)
+                    self.send(trajectory)
+                    if trajectory.is_stopped() or (trajectory.failures >= 3):
+                        del self.trajectories[key]
+
+    #===========================================================================
+    # Queue commands for any change in a_trajectory's VISCA speeds.
+    # Caller holds condition.
+    def send(self, a_trajectory):
+        slew = a_trajectory.slew_command()
+        if slew != a_trajectory.sent_slew:
+            a_trajectory.sent_slew = slew
+            self.submit(a_trajectory, 'velocity-slew', slew == Trajectory.STOP_SLEW,
+                        lambda: g_viscaTalker.do_slew(a_trajectory.camera, *slew),
+                        lambda: setattr(a_trajectory, 'done_slew', slew))
+
+        zoom = a_trajectory.zoom_command()
+        if zoom != a_trajectory.sent_zoom:
+            a_trajectory.sent_zoom = zoom
+            self.submit(a_trajectory, 'velocity-zoom', zoom == Trajectory.STOP_ZOOM,
+                        lambda: g_viscaTalker.do_zoom(a_trajectory.camera, *zoom),
+                        lambda: setattr(a_trajectory, 'done_zoom', zoom))
+
+    #===========================================================================
+    # Queue a_function on a_trajectory's camera, calling a_done if it succeeds.
+    # On failure, or if the camera's queue refuses it, the command is sent
+    # again at the next control period. A stop (a_is_stop) is never refused.
+    def submit(self, a_trajectory, a_merge_key, a_is_stop, a_function, a_done):
+        def run():
+            try:
+                a_function()
+            except ErrorEx as ex:
+                g_log.warning('Velocity command for camera %s failed: %s',
+                              a_trajectory.camera, ex.get_errors())
+                with self.condition:
+                    a_trajectory.failures += 1
+                    a_trajectory.sent_slew = None
+                    a_trajectory.sent_zoom = None
+                return {'status': 'fail', 'errors': ex.get_errors()}
+            with self.condition:
+                a_done()
+            return {'status': 'ok'}
+
+        job = CameraJob(run, a_merge_key)
+        job.command = 'velocity'
+        job.is_stop = a_is_stop
+        if get_camera_worker(a_trajectory.camera).submit(job).http_status != 200:
+            # Refused: send it again at the next control period
+            a_trajectory.sent_slew = None
+            a_trajectory.sent_zoom = None
+
+g_motion_planner = None
+
+#==============================================================================
+# Thread that starts commands at scheduled wall-clock times.
+# Each command is submitted with the function given when it was scheduled,
+# and runs on its camera's worker like any other command.
+class MoveScheduler:
+    def __init__(self):
+        self.queue = []             # Heap of (time, id)
+        self.entries = {}           # id -> (time, post body, submit function)
+        self.next_id = 1
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True, name='move scheduler')
+        self.thread.start()
+
+    #===========================================================================
+    # Schedule a_post_body to be run by a_submit at a_time (from time.time()).
+    # Return an id for cancel()
+    def add(self, a_time, a_post_body, a_submit):
+        with self.condition:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (a_time, a_post_body, a_submit)
+            heapq.heappush(self.queue, (a_time, entry_id))
+            self.condition.notify()
+        return entry_id
+
+    #===========================================================================
+    # Return False if a_id isn't waiting to run
+    def cancel(self, a_id):
+        with self.condition:
+            return self.entries.pop(a_id, None) is not None
+
+    #===========================================================================
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    # Skip cancelled entries
+                    while self.queue and (self.queue[0][1] not in self.entries):
+                        heapq.heappop(self.queue)
+                    if not self.queue:
+                        self.condition.wait()
+                        continue
+                    delay = self.queue[0][0] - time.time()
+                    if delay <= 0:
+                        entry_id = heapq.heappop(self.queue)[1]
+                        when, post_body, submit = self.entries.pop(entry_id)
+                        break
+                    self.condition.wait(delay)
+
+            g_log.info('Scheduled move %d starting %.3f sec late: %s',
+                       entry_id, time.time() - when, post_body.get('command'))
+            job = submit(post_body)
+            threading.Thread(target=self.report, args=(entry_id, job), daemon=True).start()
+
+    #===========================================================================
+    # Log a scheduled command that fails, since nobody is waiting for it
+    def report(self, a_id, a_job):
+        response = a_job.wait()
+        if response.get('status') != 'ok':
+            g_log.warning('Scheduled move %d failed: %s', a_id, response.get('errors'))
+
+g_move_scheduler = None
+
+#==============================================================================
+# Preset positions of each camera, kept in a JSON file:
+#   {"camera": {"preset": {"pan": n, "tilt": n, "zoom": n}, ...}, ...}
+# Updated by set-preset when the camera's position is known, and by
+# capture-presets. Used by restore-presets to reprogram a camera.
+class PresetStore:
+    def __init__(self, a_path):
+        self.path = a_path
+        self.lock = threading.Lock()
+        self.presets = {}
+        try:
+            with open(a_path) as file:
+                self.presets = json.load(file)
+            g_log.info('Loaded presets from %s', a_path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as exc:
+            g_log.warning('Ignoring preset file %s: %s', a_path, exc)
+
+    #===========================================================================
+    # Position of a_preset as a dict, or None if not stored
+    def get(self, a_camera, a_preset):
+        with self.lock:
+            position = self.presets.get(str(a_camera), {}).get(str(a_preset))
+            return dict(position) if position else None
+
+    #===========================================================================
+    # All presets of a_camera, as a list of dicts with preset, pan, tilt, zoom
+    def get_all(self, a_camera):
+        with self.lock:
+            presets = self.presets.get(str(a_camera), {})
+            return [dict(preset=int(preset), **position)
+                    for preset, position in sorted(presets.items(), key=lambda p: int(p[0]))]
+
+    #===========================================================================
+    # Store a_entries, dicts with preset, pan, tilt and zoom
+    def put_all(self, a_camera, a_entries):
+        with self.lock:
+            presets = self.presets.setdefault(str(a_camera), {})
+            for entry in a_entries:
+                presets[str(entry['preset'])] = {axis: entry[axis] for axis in ('pan', 'tilt', 'zoom')}
+            self.save()
+
+    #===========================================================================
+    def put(self, a_camera, a_preset, a_position):
+        self.put_all(a_camera, [dict(preset=a_preset, **a_position)])
+
+    #===========================================================================
+    # Write the file. Caller holds lock.
+    # Written to a new file and renamed, so a crash can't leave half a file.
+    def save(self):
+        temp_path = self.path + '.new'
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(self.presets, file, indent=4)
+            os.replace(temp_path, self.path)
+        except OSError as exc:
+            g_log.error('Failed to save presets to %s: %s', self.path, exc)
+
+g_preset_store = None
+
+# Flags to cancel the capture-presets or restore-presets running on a camera,
+# by camera. Checked between presets.
+g_preset_cancels = {}
+g_preset_cancels_lock = threading.Lock()
+
+#==============================================================================
+# Note that a capture or restore is running on a_camera, returning the
+# threading.Event that cancel-presets sets
+def start_preset_operation(a_camera):
+    cancel = threading.Event()
+    with g_preset_cancels_lock:
+        g_preset_cancels[str(a_camera)] = cancel
+    return cancel
+
+#==============================================================================
+# Note that the operation with flag a_cancel has finished on a_camera
+def end_preset_operation(a_camera, a_cancel):
+    with g_preset_cancels_lock:
+        if g_preset_cancels.get(str(a_camera)) is a_cancel:
+            del g_preset_cancels[str(a_camera)]
+
+#==============================================================================
+# What each camera is, from its version inquiry reply, kept in a JSON file:
+#   {"camera": {"vendor": n, "model": n, "rom": n, "max_socket": n}, ...}
+# Loaded at startup, so a camera's capabilities are known before it answers,
+# and updated by discovery and the version-info command.
+class CameraDirectory:
+    def __init__(self, a_path, a_models):
+        self.path = a_path
+        self.models = a_models
+        self.lock = threading.Lock()
+        self.cameras = {}
+        self.capabilities = {}      # camera -> model entry, looked up once
+        try:
+            with open(a_path) as file:
+                self.cameras = json.load(file)
+            g_log.info('Loaded cameras from %s', a_path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as exc:
+            g_log.warning('Ignoring camera file %s: %s', a_path, exc)
+
+    #===========================================================================
+    # The g_camera_models entry for a_camera (the last, if it is unknown)
+    def get(self, a_camera):
+        key = str(a_camera)
+        with self.lock:
+            capabilities = self.capabilities.get(key)
+            if capabilities is None:
+                capabilities = self.find_model(self.cameras.get(key, {}))
+                self.capabilities[key] = capabilities
+            return capabilities
+
+    #===========================================================================
+    # First model entry matching a_camera's vendor and model
+    def find_model(self, a_camera):
+        for entry in self.models:
+            if ((entry['vendor'] is None) or (entry['vendor'] == a_camera.get('vendor'))) and \
+               ((entry['model'] is None) or (entry['model'] == a_camera.get('model'))):
+                return entry
+        return self.models[-1]
+
+    #===========================================================================
+    # Record a camera's visca_codec.VersionInfo
+    def put(self, a_camera, a_version):
+        key = str(a_camera)
+        with self.lock:
+            entry = a_version._asdict()
+            if self.cameras.get(key) == entry:
+                return
+            self.cameras[key] = entry
+            self.capabilities.pop(key, None)
+            self.save()
+
+    #===========================================================================
+    # All known cameras, as a dict of camera -> dict with version and model name
+    def get_all(self):
+        with self.lock:
+            cameras = {key: dict(entry) for key, entry in self.cameras.items()}
+        for key, entry in cameras.items():
+            entry['model_name'] = self.get(key)['name']
+        return cameras
+
+    #===========================================================================
+    # Write the file. Caller holds lock.
+    def save(self):
+        temp_path = self.path + '.new'
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(self.cameras, file, indent=4)
+            os.replace(temp_path, self.path)
+        except OSError as exc:
+            g_log.error('Failed to save cameras to %s: %s', self.path, exc)
+
+g_camera_directory = None
+
+#==============================================================================
+# Read camera model entries from JSON file a_path, with vendor and model as
+# numbers or strings such as "0x0513", and any capabilities that differ
+# from the "unknown" model. Return a list for g_camera_models.
+# Throws ErrorEx if the file can't be read
+def load_camera_models(a_path):
+    try:
+        with open(a_path) as file:
+            entries = json.load(file)
+        models = []
+        for entry in entries:
+            model = dict(g_camera_models[-1])
+            model.update(entry)
+            for name in ('vendor', 'model'):
+                if isinstance(model[name], str):
+                    model[name] = int(model[name], 0)
+            models.append(model)
+        return models
+    except (OSError, ValueError, TypeError, AttributeError) as exc:
+        raise ErrorEx(f'Cannot read camera models from {a_path}: {exc}')
+
+#==============================================================================
+# Ask each of a_cameras for its version, on its worker so it doesn't get in
+# the way of other commands, and record the replies in g_camera_directory
+def discover_cameras(a_cameras):
+    def inquire(a_camera):
+        try:
+            version = g_viscaTalker.get_version_info(a_camera)
+        except ErrorEx as ex:
+            return {'status': 'fail', 'errors': ex.get_errors()}
+        g_camera_directory.put(a_camera, version)
+        return {'status': 'ok', 'version': version}
+
+    jobs = []
+    for camera in a_cameras:
+        job = CameraJob(lambda camera=camera: inquire(camera))
+        job.command = 'discover'
+        jobs.append(get_camera_worker(camera).submit(job))
+
+    for camera, job in zip(a_cameras, jobs):
+        response = job.wait()
+        if response['status'] == 'ok':
+            version = response['version']
+            g_log.info('Camera %s: %s, vendor %04x model %04x rom %04x', camera,
+                       g_camera_directory.get(camera)['name'], version.vendor, version.model, version.rom)
+        else:
+            g_log.warning('Camera %s did not answer: %s', camera, response['errors'])
+
+#==============================================================================
+# Count a command by its camera and status, for /metrics
+def count_request(a_command, a_camera, a_response):
+    g_metrics.count('visca_requests_total',
+                    {'command': a_command, 'camera': str(a_camera),
+                     'status': a_response.get('status', 'fail')})
 
 #==============================================================================
+# HTTP/1.1, so a dock keeps one connection open for its requests rather
+# than connecting for each jog. Every response must have a Content-Length,
+# except /events, which closes its connection when done.
 class MyServer(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately: without TCP_NODELAY, the
+    # body of a response on a kept-alive connection can wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    # Seconds an idle connection is kept open
+    timeout = 60
+
+    # Compact requests to /compact are one line of text:
+    #   command camera field...
+    # such as "pan 1 -100 5" or "velocity 2 0.5 _ _ 24 20". The fields of
+    # each command are given in this order; "_" or a missing field at the
+    # end is left out. The response is "ok", or "fail" and the errors
+    # separated by "; ".
+    # Being text/plain, a browser sends these without a CORS preflight.
+    COMPACT_FIELDS = {
+        'pan':      ('value', 'speed'),
+        'tilt':     ('value', 'speed'),
+        'zoom':     ('value', 'speed'),
+        'slew':     ('pan-value', 'pan-speed', 'tilt-value', 'tilt-speed'),
+        'velocity': ('pan', 'tilt', 'zoom', 'pan-max', 'tilt-max', 'zoom-max'),
+    }
 
     #===========================================================================
     def send_html(self, a_result_code, a_string):
-        self.send_response(a_result_code)
-        self.send_header("Content-type", "text/html")
-        self.end_headers()
-        self.wfile.write(bytes(a_string, "utf-8"))
+        self.send_body(a_result_code, "text/html", bytes(a_string, "utf-8"))
 
     #===========================================================================
     def send_post(self, a_result_code, a_string):
+        self.send_body(a_result_code, "text/html", bytes(a_string, "utf-8"))
+
+    #===========================================================================
+    # Send a response with body a_body (bytes), and any extra headers
+    # in dict a_headers
+    def send_body(self, a_result_code, a_content_type, a_body, a_headers={}):
         self.send_response(a_result_code)
-        self.send_header("Content-type", "text/html")
+        for name, value in a_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-type", a_content_type)
+        self.send_header("Content-Length", str(len(a_body)))
         self.end_headers()
-        self.wfile.write(bytes(a_string, "utf-8"))
+        self.wfile.write(a_body)
 
     #===========================================================================
     # Overridden to eliminate logging of GET/POST/OPTIONS,
@@ -464,6 +2680,11 @@ class MyServer(BaseHTTPRequestHandler):
         # print("Didn't log", code, size)
         return
 
+    #===========================================================================
+    # Log errors through g_log rather than directly to stderr
+    def log_message(self, format, *args):
+        g_log.warning('%s - %s', self.address_string(), format % args)
+
     #===========================================================================
     # Absolute set of pan and tilt, and/or zoom
     def do_cmd_moveto(self, a_post_body):
@@ -489,11 +2710,291 @@ class MyServer(BaseHTTPRequestHandler):
         return response
 
     #===========================================================================
-    # Slew (pan and tilt together)
-    def do_cmd_slew(self, a_post_body):
+    # A move's start or end for predict_move(): a preset number, a dict with
+    # any of pan, tilt and zoom, or None for where the camera is now.
+    # Throws ErrorEx on failure
+    def move_position(self, a_camera, a_where):
+        if a_where is None:
+            pan, tilt = g_viscaTalker.get_position(a_camera, g_state_max_age)
+            zoom = g_viscaTalker.get_zoom(a_camera, g_state_max_age)
+            return {'pan': pan, 'tilt': tilt, 'zoom': zoom}
+        if isinstance(a_where, dict):
+            return {axis: a_where[axis] for axis in ('pan', 'tilt', 'zoom') if axis in a_where}
+        return g_viscaTalker.get_preset_position(a_camera, a_where)
+
+    #===========================================================================
+    # Where a go-preset or moveto command a_post_body will take the camera
+    # Throws ErrorEx on failure
+    def move_destination(self, a_post_body):
+        command = a_post_body.get('command')
+        if command == 'go-preset':
+            return self.move_position(a_post_body.get('camera', '1'), a_post_body.get('value'))
+        if command == 'moveto':
+            return self.move_position(a_post_body.get('camera', '1'), a_post_body)
+        raise ErrorEx('Can only predict go-preset and moveto')
+
+    #===========================================================================
+    # Predict how long a camera will take to move "from" a position or preset
+    # (default where it is now) "to" another. Positions are dicts with any of
+    # pan, tilt and zoom. Speeds are learned from report and /events polls.
+    def do_cmd_predict(self, a_post_body):
+        response = {}
+        response['status'] = 'fail'
+
+        camera = a_post_body.get("camera", "1")
+        try:
+            if a_post_body.get("to") is None:
+                raise ErrorEx('missing "to" position or preset')
+            start = self.move_position(camera, a_post_body.get("from"))
+            end = self.move_position(camera, a_post_body.get("to"))
+            response.update(g_viscaTalker.predict_move(camera, start, end))
+            response['status'] = 'ok'
+
+        except ErrorEx as ex:
+            response['errors'] = ex.get_errors()
+
+        return response
+
+    #===========================================================================
+    # Schedule the command "move" to start "at" a time, or to arrive at its
+    # position by "arrive-at", using the predicted move time. Times are in
+    # seconds since the epoch. The move may have a "from", as for predict.
+    # Returns at once, with an id for cancel-schedule.
+    # With a list of cameras and "arrive-at", each camera's move is predicted
+    # and scheduled on its own, and the response has a result for each.
+    def do_cmd_schedule(self, a_post_body):
+        response = {}
+        response['status'] = 'fail'
+
+        camera = a_post_body.get("camera", "1")
+        move = a_post_body.get("move")
+        if (not isinstance(move, dict)) or (move.get('command') in ('batch', 'schedule')):
+            response['errors'] = ErrorEx('missing or invalid move command').get_errors()
+            return response
+        move = dict(move)
+        move.setdefault('camera', camera)
+
+        if isinstance(move['camera'], list) and (a_post_body.get("arrive-at") is not None):
+            response['results'] = []
+            errors = []
+            for camera in move['camera']:
+                result = self.schedule_move(a_post_body, dict(move, camera=camera))
+                result['camera'] = camera
+                response['results'].append(result)
+                if result['status'] != 'ok':
+                    errors.append(f'camera {camera} failed')
+            if errors:
+                response['errors'] = errors
+            else:
+                response['status'] = 'ok'
+            return response
+
+        return self.schedule_move(a_post_body, move)
+
+    #===========================================================================
+    # Schedule a_move, with its camera set, for do_cmd_schedule
+    def schedule_move(self, a_post_body, a_move):
+        response = {}
+        response['status'] = 'fail'
+
+        try:
+            if a_post_body.get("arrive-at") is not None:
+                arrive = float(a_post_body.get("arrive-at"))
+                start = self.move_position(a_move['camera'], a_post_body.get("from"))
+                prediction = g_viscaTalker.predict_move(a_move['camera'], start,
+                                                        self.move_destination(a_move))
+                response['seconds'] = prediction['seconds']
+                when = arrive - prediction['seconds']
+            elif a_post_body.get("at") is not None:
+                when = float(a_post_body.get("at"))
+            else:
+                raise ErrorEx('missing "at" or "arrive-at" time')
+
+        except (TypeError, ValueError):
+            response['errors'] = ErrorEx('invalid time').get_errors()
+            return response
+        except ErrorEx as ex:
+            response['errors'] = ex.get_errors()
+            return response
+
+        response['status'] = 'ok'
+        response['id'] = g_move_scheduler.add(
+            when, a_move, lambda a_body: self.submit_command(a_body, a_limited=False))
+        response['start'] = round(when, 3)
+        response['start_in'] = round(when - time.time(), 3)
+        return response
+
+    #===========================================================================
+    # Visit each preset from "first" to "last" (default 0 to 9), or in list
+    # "presets", and record its position in the preset store.
+    # Presets the camera rejects are listed as "skipped". cancel-presets stops
+    # it after the current preset, with "canceled" in the response. The camera
+    # is then put back where it was.
+    def do_cmd_capture_presets(self, a_post_body):
+        response = {}
+        response['status'] = 'fail'
+
+        camera = a_post_body.get("camera", "1")
+        try:
+            presets = a_post_body.get("presets")
+            if presets is None:
+                presets = range(int(a_post_body.get("first", 0)), int(a_post_body.get("last", 9)) + 1)
+            presets = [int(preset) for preset in presets]
+        except (TypeError, ValueError):
+            response['errors'] = ErrorEx('invalid preset numbers').get_errors()
+            return response
+
+        try:
+            home = g_viscaTalker.wait_until_settled(camera, g_settle_timeout)
+        except ErrorEx as ex:
+            response['errors'] = ex.get_errors()
+            return response
+
+        captured = []
+        skipped = []
+        cancel = start_preset_operation(camera)
+        try:
+            for preset in presets:
+                if cancel.is_set():
+                    break
+                try:
+                    g_viscaTalker.goto_preset(camera, preset)
+                    position = g_viscaTalker.wait_until_settled(camera, g_settle_timeout)
+                except ErrorEx as ex:
+                    g_log.warning('Camera %s preset %s skipped: %s', camera, preset, ex.get_errors())
+                    skipped.append(preset)
+                    continue
+                captured.append(dict(preset=preset, **position))
+        finally:
+            end_preset_operation(camera, cancel)
+        g_preset_store.put_all(camera, captured)
+
+        try:
+            speed = g_camera_directory.get(camera)['pan_speed_max']
+            g_viscaTalker.set_position(camera, home['pan'], home['tilt'], speed)
+            g_viscaTalker.set_zoom(camera, home['zoom'])
+        except ErrorEx as ex:
+            response['errors'] = ex.get_errors()
+            return response
+
+        response['camera'] = camera
+        response['presets'] = captured
+        response['skipped'] = skipped
+        response['canceled'] = cancel.is_set()
+        if captured or response['canceled']:
+            response['status'] = 'ok'
+        else:
+            response['errors'] = ['no presets captured']
+        return response
+
+    #===========================================================================
+    # Program the camera's presets from the preset store, or from "presets",
+    # a list of dicts with preset, pan, tilt and zoom, which are also stored.
+    # Presets are done one after another: move to the position at the
+    # camera's top pan speed, wait until it settles, then set the preset.
+    # cancel-presets stops it after the current preset, with "canceled" in
+    # the response. The camera is then put back where it was.
+    def do_cmd_restore_presets(self, a_post_body):
         response = {}
         response['status'] = 'fail'
 
+        camera = a_post_body.get("camera", "1")
+        entries = a_post_body.get("presets")
+        if entries is not None:
+            try:
+                entries = [{key: int(entry[key]) for key in ('preset', 'pan', 'tilt', 'zoom')}
+                           for entry in entries]
+            except (TypeError, ValueError, KeyError):
+                response['errors'] = ErrorEx('invalid presets').get_errors()
+                return response
+            g_preset_store.put_all(camera, entries)
+        else:
+            entries = g_preset_store.get_all(camera)
+        if not entries:
+            response['errors'] = ErrorEx(f'no presets stored for camera {camera}').get_errors()
+            return response
+
+        try:
+            pan, tilt = g_viscaTalker.get_position(camera)
+            zoom = g_viscaTalker.get_zoom(camera)
+        except ErrorEx as ex:
+            response['errors'] = ex.get_errors()
+            return response
+
+        speed = g_camera_directory.get(camera)['pan_speed_max']
+        restored = []
+        skipped = []
+        cancel = start_preset_operation(camera)
+        try:
+            for entry in entries:
+                if cancel.is_set():
+                    break
+                try:
+                    g_viscaTalker.set_position(camera, entry['pan'], entry['tilt'], speed)
+                    g_viscaTalker.set_zoom(camera, entry['zoom'])
+                    g_viscaTalker.wait_until_settled(camera, g_settle_timeout)
+                    g_viscaTalker.set_preset(camera, entry['preset'])
+                except ErrorEx as ex:
+                    g_log.warning('Camera %s preset %s skipped: %s', camera, entry['preset'], ex.get_errors())
+                    skipped.append(entry['preset'])
+                    continue
+                restored.append(entry['preset'])
+        finally:
+            end_preset_operation(camera, cancel)
+
+        try:
+            g_viscaTalker.set_position(camera, pan, tilt, speed)
+            g_viscaTalker.set_zoom(camera, zoom)
+        except ErrorEx as ex:
+            response['errors'] = ex.get_errors()
+            return response
+
+        response['camera'] = camera
+        response['restored'] = restored
+        response['skipped'] = skipped
+        response['canceled'] = cancel.is_set()
+        if restored or response['canceled']:
+            response['status'] = 'ok'
+        else:
+            response['errors'] = ['no presets restored']
+        return response
+
+    #===========================================================================
+    # Stop the capture-presets or restore-presets running on a camera after
+    # its current preset. "canceled" is false if none is running.
+    def do_cmd_cancel_presets(self, a_post_body):
+        camera = a_post_body.get("camera", "1")
+        with g_preset_cancels_lock:
+            cancel = g_preset_cancels.get(str(camera))
+        if cancel is not None:
+            cancel.set()
+        return {'status': 'ok', 'camera': camera, 'canceled': cancel is not None}
+
+    #===========================================================================
+    # The stored presets of a camera
+    def do_cmd_get_presets(self, a_post_body):
+        camera = a_post_body.get("camera", "1")
+        return {'status': 'ok', 'camera': camera, 'presets': g_preset_store.get_all(camera)}
+
+    #===========================================================================
+    # Report every camera found by discovery or version-info
+    def do_cmd_get_cameras(self, a_post_body):
+        return {'status': 'ok', 'cameras': g_camera_directory.get_all()}
+
+    #===========================================================================
+    # Cancel a scheduled move by id
+    def do_cmd_cancel_schedule(self, a_post_body):
+        try:
+            entry_id = int(a_post_body.get("id"))
+        except (TypeError, ValueError):
+            return {'status': 'fail', 'errors': ['invalid id']}
+        if not g_move_scheduler.cancel(entry_id):
+            return {'status': 'fail', 'errors': ['no such scheduled move']}
+        return {'status': 'ok'}
+
+    #===========================================================================
+    # Slew (pan and tilt together)
+    def job_for_slew(self, a_post_body):
         camera      = a_post_body.get("camera", "1")
         pan         = a_post_body.get("pan-value")
         tilt        = a_post_body.get("tilt-value")
@@ -501,23 +3002,34 @@ class MyServer(BaseHTTPRequestHandler):
         tilt_speed  = a_post_body.get("tilt-speed", 0)
 
         if (pan is None) and (tilt is None):
-            response['errors'] = ["missing pan or tilt direction"]
-        else:
+            return CameraJob.failed(["missing pan or tilt direction"])
+
+        return self.slew_job(camera, pan, pan_speed, tilt, tilt_speed)
+
+    #===========================================================================
+    # Make a job to start or stop pan and tilt.
+    # A queued slew is superseded by a later one, since only the latest matters.
+    def slew_job(self, a_camera, a_pan, a_pan_speed, a_tilt, a_tilt_speed):
+        def slew():
+            response = {}
+            response['status'] = 'fail'
             try:
-                g_viscaTalker.do_slew(camera, pan, pan_speed, tilt, tilt_speed)
+                g_viscaTalker.do_slew(a_camera, a_pan, a_pan_speed, a_tilt, a_tilt_speed)
                 response['status'] = 'ok'
 
             except ErrorEx as ex:
                 response['errors'] = ex.get_errors()
 
-        return response
+            return response
+
+        job = CameraJob(slew, 'slew')
+        job.is_stop = (a_pan == 'stop') and (a_tilt == 'stop')
+        job.droppable = not job.is_stop
+        return job
 
     #===========================================================================
     # Pan: slew or jog
-    def do_cmd_pan(self, a_post_body):
-        response = {}
-        response['status'] = 'fail'
-
+    def job_for_pan(self, a_post_body):
         camera = a_post_body.get("camera", "1")
         pan    = a_post_body.get("value")
         speed  = a_post_body.get("speed", 0)
@@ -525,100 +3037,77 @@ class MyServer(BaseHTTPRequestHandler):
         # pan may be left, right, or stop for slew operation
         # pan may be +N or -N for jog (relative to current position)
         if pan is None:
-            response['errors'] = ["missing pan value"]
-        else:
-            try:
-                if (pan == 'left') or (pan == 'right') or (pan == 'stop'):
-                    g_viscaTalker.do_slew(camera, pan, speed, 'stop', 0)
-                else:
-                    try:
-                        pan_num = int(pan)
-                    except:
-                        raise ErrorEx('invalid pan value')
-
-                    # Read current position
-                    pan_now, tilt_now = g_viscaTalker.get_position( camera )
-                    # Set updated position
-                    g_viscaTalker.set_position( camera, pan_now + pan_num, tilt_now, speed )
+            return CameraJob.failed(["missing pan value"])
 
-                response['status'] = 'ok'
+        if (pan == 'left') or (pan == 'right') or (pan == 'stop'):
+            return self.slew_job(camera, pan, speed, 'stop', 0)
 
-            except ErrorEx as ex:
-                response['errors'] = ex.get_errors()
+        try:
+            pan_num = int(pan)
+        except:
+            return CameraJob.failed(ErrorEx('invalid pan value').get_errors())
 
-        return response
+        return JogJob(camera, pan_num, 0, 0, speed)
 
     #===========================================================================
     # Tilt: slew or jog
-    def do_cmd_tilt(self, a_post_body):
-        response = {}
-        response['status'] = 'fail'
-
+    def job_for_tilt(self, a_post_body):
         camera = a_post_body.get("camera", "1")
         tilt   = a_post_body.get("value")
         speed  = a_post_body.get("speed", 0)
-        
+
         # tilt may be up, down, or stop for slew operation
         # tilt may be +N or -N for jog (relative to current position)
         if tilt is None:
-            response['errors'] = ["missing tilt value"]
-        else:
-            try:
-                if (tilt == 'up') or (tilt == 'down') or (tilt == 'stop'):
-                    g_viscaTalker.do_slew( camera, 'stop', 0, tilt, speed )
-                else:
-                    try:
-                        tilt_num = int(tilt)
-                    except:
-                        raise ErrorEx('invalid tilt value')
-
-                    # Read current position
-                    pan_now, tilt_now = g_viscaTalker.get_position( camera )
-                    # Set updated position
-                    g_viscaTalker.set_position( camera, pan_now, tilt_now + tilt_num, speed )
+            return CameraJob.failed(["missing tilt value"])
 
-                response['status'] = 'ok'
+        if (tilt == 'up') or (tilt == 'down') or (tilt == 'stop'):
+            return self.slew_job(camera, 'stop', 0, tilt, speed)
 
-            except ErrorEx as ex:
-                response['errors'] = ex.get_errors()
+        try:
+            tilt_num = int(tilt)
+        except:
+            return CameraJob.failed(ErrorEx('invalid tilt value').get_errors())
 
-        return response
+        return JogJob(camera, 0, tilt_num, 0, speed)
 
     #===========================================================================
     # Zoom: slew or jog
-    def do_cmd_zoom(self, a_post_body):
-        response = {}
-        response['status'] = 'fail'
-
+    def job_for_zoom(self, a_post_body):
         camera = a_post_body.get("camera", "1")
         zoom   = a_post_body.get("value")
         speed  = a_post_body.get("speed",  "0")
 
         # zoom may be in, out, or stop for slew operation
         # zoom may be +N or -N for jog (relative to current position)
-        try:
-            if zoom is None:
-                raise ErrorEx('missing zoom value')
+        if zoom is None:
+            return CameraJob.failed(ErrorEx('missing zoom value').get_errors())
 
-            if (zoom == 'in') or (zoom == 'out') or (zoom == 'stop'):
-                g_viscaTalker.do_zoom( camera, zoom, speed )
-            else:
+        if (zoom == 'in') or (zoom == 'out') or (zoom == 'stop'):
+            def zoom_slew():
+                response = {}
+                response['status'] = 'fail'
                 try:
-                    zoom_num = int(zoom)
-                except:
-                    raise ErrorEx('invalid zoom value')
+                    g_viscaTalker.do_zoom( camera, zoom, speed )
+                    response['status'] = 'ok'
 
-                # Read current zoom
-                zoom_now = g_viscaTalker.get_zoom( camera )
-                # Set updated position
-                g_viscaTalker.set_zoom( camera, zoom_now + zoom_num )
+                except ErrorEx as ex:
+                    response['errors'] = ex.get_errors()
 
-            response['status'] = 'ok'
+                return response
 
-        except ErrorEx as ex:
-            response['errors'] = ex.get_errors()
+            # A queued zoom slew is superseded by a later one
+            job = CameraJob(zoom_slew, 'zoom')
+            job.is_stop = zoom == 'stop'
+            job.droppable = not job.is_stop
+            return job
 
-        return response
+        try:
+            zoom_num = int(zoom)
+        except:
+            return CameraJob.failed(ErrorEx('invalid zoom value').get_errors())
+
+        return JogJob(camera, 0, 0, zoom_num, speed)
 
     #===========================================================================
     # Goto preset
@@ -668,15 +3157,7 @@ class MyServer(BaseHTTPRequestHandler):
         camera = a_post_body.get("camera", "1")
 
         try:
-            # Read current position
-            pan_now, tilt_now = g_viscaTalker.get_position( camera )
-            # Read current zoom
-            zoom_now = g_viscaTalker.get_zoom( camera )
-            response['status'] = "ok"
-            response['camera'] = camera
-            response['pan']    = pan_now
-            response['tilt']   = tilt_now
-            response['zoom']   = zoom_now
+            response = report_camera( camera )
 
         except ErrorEx as ex:
             response['errors'] = ex.get_errors()
@@ -691,36 +3172,144 @@ class MyServer(BaseHTTPRequestHandler):
         camera = a_post_body.get("camera", "1")
 
         try:
-            vendor, model, version, max_socket = g_viscaTalker.get_version_info(camera)
+            info = g_viscaTalker.get_version_info(camera)
+            g_camera_directory.put(camera, info)
+            vendor, model, version, max_socket = info
             response['status']     = "ok"
             response['camera']     = camera
             response['vendor']     = vendor
             response['model']      = model
             response['version']    = version
             response['max_socket'] = max_socket
+            response['model_name'] = g_camera_directory.get(camera)['name']
         except ErrorEx as ex:
             response['errors'] = ex.get_errors()
 
         return response
 
+    #===========================================================================
+    # Set the pan, tilt and zoom velocity of a camera, from -1 to +1.
+    # Positive is left, up and in. Axes not given are unchanged.
+    # Optional pan-max, tilt-max and zoom-max are the VISCA speeds for 1.
+    # The camera is steered by g_motion_planner, so this returns at once.
+    def do_cmd_velocity(self, a_post_body):
+        response = {}
+        response['status'] = 'fail'
+
+        camera = a_post_body.get("camera", "1")
+        try:
+            velocities = []
+            for name in ('pan', 'tilt', 'zoom'):
+                value = a_post_body.get(name)
+                velocities.append(None if value is None else float(value))
+            max_speeds = []
+            for name in ('pan-max', 'tilt-max', 'zoom-max'):
+                value = a_post_body.get(name)
+                max_speeds.append(None if value is None else int(value))
+        except (TypeError, ValueError):
+            response['errors'] = ErrorEx('invalid velocity value').get_errors()
+            return response
+
+        if all(velocity is None for velocity in velocities):
+            response['errors'] = ErrorEx('missing pan, tilt or zoom velocity').get_errors()
+            return response
+
+        g_motion_planner.set_velocity(camera, velocities, max_speeds)
+        response['status'] = 'ok'
+        return response
+
+    #===========================================================================
+    # Wait a number of seconds before the camera's next command.
+    # Useful in a batch, to let a camera finish moving before setting a preset.
+    def do_cmd_wait(self, a_post_body):
+        response = {}
+        response['status'] = 'fail'
+
+        try:
+            seconds = float(a_post_body.get("value", 0))
+        except (TypeError, ValueError):
+            response['errors'] = ErrorEx('invalid wait value').get_errors()
+            return response
+
+        if (seconds < 0) or (seconds > 60):
+            response['errors'] = ErrorEx('wait value must be 0 to 60 seconds').get_errors()
+        else:
+            time.sleep(seconds)
+            response['status'] = 'ok'
+
+        return response
+
+    #===========================================================================
+    # Run a list of commands, returning a list of their responses.
+    # Commands for each camera run in the order given, while commands for
+    # different cameras run in parallel. Commands without a "camera" use the
+    # batch's "camera", if any.
+    def do_cmd_batch(self, a_post_body):
+        response = {}
+        response['status'] = 'fail'
+
+        commands = a_post_body.get("commands")
+        if not isinstance(commands, list):
+            response['errors'] = ["missing list of commands"]
+            return response
+
+        camera = a_post_body.get("camera", "1")
+        jobs = []
+        for command in commands:
+            if (not isinstance(command, dict)) or (command.get('command') == 'batch'):
+                jobs.append(CameraJob.failed(['invalid batch command']))
+            else:
+                command = dict(command)
+                command.setdefault('camera', camera)
+                jobs.append(self.submit_command(command, a_limited=False))
+
+        # Jobs for all cameras are queued, so just wait for each in turn
+        response['results'] = [job.wait() for job in jobs]
+        for command, result in zip(commands, response['results']):
+            if isinstance(command, dict):
+                count_request(command.get('command', '?'), command.get('camera', camera), result)
+
+        errors = []
+        for ix, result in enumerate(response['results']):
+            if result.get('status') != 'ok':
+                errors.append(f'command {ix} failed')
+        if errors:
+            response['errors'] = errors
+        else:
+            response['status'] = 'ok'
+
+        return response
+
     #===========================================================================
     # Report basic server information
     def do_cmd_about(self, a_post_body):
         global g_version
         global g_serialPort
         global g_serialBaudRate
+        global g_baud_probe
         global g_visca_udp_port
         global g_post_count
         global g_error_count
+        global g_control_rate
 
         response = {}
         response['status']    = 'ok'
         response['version']   = g_version
         response['port']      = g_serialPort
         response['baud_rate'] = g_serialBaudRate
+        if g_baud_probe is not None:
+            response['baud_probe'] = g_baud_probe
         response['visca_udp_port'] = g_visca_udp_port
+        response['ip_transport']   = g_ip_transport
+        if g_config_file is not None:
+            response['config'] = g_config_file
+            response['serial_ports'] = list(g_viscaTalker.serial_channels)
+        response['state_max_age']  = g_state_max_age
+        response['poll_interval']  = g_poll_interval
+        response['control_rate']   = g_control_rate
         response['post_count']     = g_post_count
         response['error_count']    = g_error_count
+        response['offline']        = sorted(g_camera_health.get_offline())
 
         return response
 
@@ -731,7 +3320,7 @@ class MyServer(BaseHTTPRequestHandler):
         response['status'] = 'fail'
         camera = a_post_body.get("camera", "1")
         data = a_post_body.get("bytes-to-send")
-        print(data)
+        g_log.debug('send_raw to camera %s: %s', camera, data)
         bytes_to_send = bytearray.fromhex(data)
         bytes_to_send.insert(0,0)   # space for the address
         expected_reply = int(a_post_body.get("reply-length", 0))
@@ -739,11 +3328,14 @@ class MyServer(BaseHTTPRequestHandler):
             if bytes_to_send == None:
                 raise ErrorEx('missing bytes to send')
 
+            # We don't know what this does to the camera
+            g_viscaTalker.invalidate_state(camera)
+
             if expected_reply == 0:
-                g_viscaTalker.send_visca(camera, bytes_to_send, expected_reply)
+                g_viscaTalker.send_visca(camera, bytes_to_send, expected_reply, a_retry=False)
                 response['response-bytes'] = ''
             else:
-                s = g_viscaTalker.send_visca(camera, bytes_to_send, expected_reply)
+                s = g_viscaTalker.send_visca(camera, bytes_to_send, expected_reply, a_retry=False)
                 response['response-bytes'] = s.hex(' ')
 
             response['status'] = "ok"
@@ -766,14 +3358,22 @@ class MyServer(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Allow', 'OPTIONS, GET, POST')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     #==============================================================================
     def do_GET(self):
-        # For now, ignore the path and just send a generic page
-        self.send_response(200)
-        self.send_header("Content-type", "text/html")
-        self.end_headers()
+        url = urllib.parse.urlparse(self.path)
+        if url.path == '/events':
+            self.send_events(url)
+            return
+
+        if url.path == '/metrics':
+            self.send_body(200, "text/plain; version=0.0.4",
+                           bytes(g_metrics.render(), "utf-8"))
+            return
+
+        # For now, ignore other paths and just send a generic page
         val = "<html><head><title>Visca Server</title></head><body>" +\
               "<p>This is the Cabrini Visca server.</p>" +\
               "<p>Version: " + g_version + "</p>"
@@ -784,65 +3384,327 @@ class MyServer(BaseHTTPRequestHandler):
                "<p>Total POSTS: " + str(g_post_count) +"</p>" +\
                "<p>Total errors: " + str(g_error_count) +"</p>" +\
                "</body></html>"
-        self.wfile.write(bytes(val, "utf-8"))
+        self.send_html(200, val)
 
     #==============================================================================
-    def do_POST(self):
-        global g_post_count
+    # Stream camera state to the client as Server-Sent Events, such as
+    #   GET /events?camera=1&camera=192.168.0.20
+    # Each event is JSON in the same form as a report response, sent when
+    # the camera's state changes.
+    def send_events(self, a_url):
+        cameras = urllib.parse.parse_qs(a_url.query).get('camera', ['1'])
+
+        # The stream has no length, so it ends by closing the connection
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
 
-        url = urllib.parse.urlparse(self.path)
-        #print("POST to path", url.path)
-        if url.path != '/server':
-            self.send_html(404, 'not found')
-            return
+        subscriber = g_state_poller.subscribe(cameras)
+        try:
+            while True:
+                try:
+                    event = subscriber.events.get(timeout=15)
+                    self.wfile.write(bytes('data: ' + json.dumps(event, separators=(',', ':')) + '\n\n', "utf-8"))
+                except queue.Empty:
+                    # Comment line, to detect clients that have gone away
+                    self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            g_state_poller.unsubscribe(subscriber)
 
-        # Get the body of the request
-        # TODO: if no Content-length, read all?
-        content_len = int(self.headers.get('Content-Length'))
-        #print('Received POST with ' + str(content_len) + ' bytes')
-        post_body = json.loads(self.rfile.read(content_len))
-        #print(json.dumps(post_body, indent=4))
-        
-        command = post_body.get('command', '?')
+    #==============================================================================
+    # Queue a command on its camera's worker thread.
+    # Return the CameraJob to wait on for the response.
+    # Commands from a batch or the scheduler pass a_limited=False: they are
+    # queued even when the camera's queue is full, and never dropped.
+    def submit_command(self, a_post_body, a_limited=True):
+        command = a_post_body.get('command', '?')
+        cameras = a_post_body.get('camera')
+        if isinstance(cameras, list):
+            # Fan out to each camera
+            if not cameras:
+                return CameraJob.failed(['empty list of cameras'])
+            jobs = [self.submit_command(dict(a_post_body, camera=camera), a_limited)
+                    for camera in cameras]
+            return GroupJob(cameras, jobs)
+
+        job = None
+        action = None
         if command == 'pan':
-            response = self.do_cmd_pan(post_body)
+            job = self.job_for_pan(a_post_body)
         elif command == 'tilt':
-            response = self.do_cmd_tilt(post_body)
+            job = self.job_for_tilt(a_post_body)
         elif command == 'slew':
-            response = self.do_cmd_slew(post_body)
+            job = self.job_for_slew(a_post_body)
         elif command == 'zoom':
-            response = self.do_cmd_zoom(post_body)
+            job = self.job_for_zoom(a_post_body)
         elif command == 'moveto':
-            response = self.do_cmd_moveto(post_body)
+            action = self.do_cmd_moveto
 
         elif command == 'go-preset':
-            response = self.do_cmd_go_preset(post_body)
+            action = self.do_cmd_go_preset
         elif command == 'set-preset':
-            response = self.do_cmd_set_preset(post_body)
+            action = self.do_cmd_set_preset
 
         elif command == 'report':
-            response = self.do_cmd_report(post_body)
+            action = self.do_cmd_report
         elif command == 'version-info':
-            response = self.do_cmd_version_info(post_body)
-        elif command == 'about':
-            response = self.do_cmd_about(post_body)
+            action = self.do_cmd_version_info
         elif command == 'send_raw':
-            response = self.do_cmd_send_raw(post_body)
+            action = self.do_cmd_send_raw
+        elif command == 'wait':
+            action = self.do_cmd_wait
+        elif command == 'predict':
+            action = self.do_cmd_predict
+        elif command == 'schedule':
+            action = self.do_cmd_schedule
+        elif command == 'capture-presets':
+            action = self.do_cmd_capture_presets
+        elif command == 'restore-presets':
+            action = self.do_cmd_restore_presets
+
+        if action is not None:
+            job = CameraJob(lambda: action(a_post_body))
+
+        if command == 'about':
+            # Doesn't talk to a camera, so answer immediately
+            job = CameraJob.completed(self.do_cmd_about(a_post_body))
+        elif command == 'velocity':
+            # Handed to the motion planner, which queues camera commands
+            job = CameraJob.completed(self.do_cmd_velocity(a_post_body))
+        elif command == 'cancel-schedule':
+            job = CameraJob.completed(self.do_cmd_cancel_schedule(a_post_body))
+        elif command == 'cancel-presets':
+            # Answered at once, since the capture or restore holds the worker
+            job = CameraJob.completed(self.do_cmd_cancel_presets(a_post_body))
+        elif command == 'get-presets':
+            job = CameraJob.completed(self.do_cmd_get_presets(a_post_body))
+        elif command == 'get-cameras':
+            job = CameraJob.completed(self.do_cmd_get_cameras(a_post_body))
+        elif job is None:
+            job = CameraJob.completed({"status":"fail", "errors":"unknown command"})
+        elif not job.done.is_set():
+            # Run the command on the camera's worker thread
+            camera = a_post_body.get("camera", "1")
+            job.command = command
+            if not a_limited:
+                job.limited = False
+                job.droppable = False
+            else:
+                # A long preset recall shouldn't hold up the next command
+                job.overlap = command == 'go-preset'
+            job = get_camera_worker(camera).submit(job)
 
-        else:
-            response = {"status":"fail", "errors":"unknown command"}
+        return job
 
-        response_string = json.dumps(response, indent=4)
+    #==============================================================================
+    def do_POST(self):
+        global g_post_count
+
+        started = time.perf_counter()
+        url = urllib.parse.urlparse(self.path)
+        #print("POST to path", url.path)
+
+        # Get the body of the request. Read it even if the path is wrong,
+        # so the next request on the connection starts in the right place.
+        # TODO: if no Content-length, read all?
+        content_len = int(self.headers.get('Content-Length'))
+        #print('Received POST with ' + str(content_len) + ' bytes')
+        body = self.rfile.read(content_len)
+        if url.path == '/server':
+            post_body = json.loads(body)
+        elif url.path == '/compact':
+            post_body = self.parse_compact(body)
+            if post_body is None:
+                self.send_body(400, "text/plain", b'fail invalid compact request')
+                return
+        else:
+            self.send_html(404, 'not found')
+            return
+        #print(json.dumps(post_body, indent=4))
+        command = post_body.get('command', '?')
+        camera = post_body.get('camera', '1')
+        if isinstance(camera, list):
+            camera = ','.join(str(c) for c in camera)
+        camera = str(camera)
+        g_metrics.observe('visca_phase_seconds',
+                          {'phase': 'http_parse', 'command': command, 'camera': camera},
+                          time.perf_counter() - started)
+
+        http_status = 200
+        headers = {}
+        if command == 'batch':
+            response = self.do_cmd_batch(post_body)
+        else:
+            job = self.submit_command(post_body)
+            response = job.wait()
+            http_status = job.http_status
+            if job.retry_after is not None:
+                headers['Retry-After'] = str(job.retry_after)
+            count_request(command, camera, response)
 
         #print('Send response')
-        #print(response_string)
+        #print(response)
 
-        self.send_response(200)
-        self.send_header("Content-type", "application/json")
-        self.send_header("Content-Length", str(len(response_string)))
-        self.end_headers()
-        self.wfile.write(bytes(response_string, "utf-8"))
-        g_post_count += 1
+        if url.path == '/compact':
+            self.send_body(http_status, "text/plain",
+                           bytes(self.compact_response(response), "utf-8"), headers)
+        else:
+            self.send_body(http_status, "application/json",
+                           bytes(json.dumps(response, separators=(',', ':')), "utf-8"),
+                           headers)
+        with g_counter_lock:
+            g_post_count += 1
+        g_metrics.observe('visca_request_seconds', {'command': command, 'camera': camera},
+                          time.perf_counter() - started)
+
+    #==============================================================================
+    # Convert a compact request (bytes) to the same dict as a JSON request.
+    # Return None if it isn't valid.
+    def parse_compact(self, a_body):
+        try:
+            words = a_body.decode('utf-8').split()
+        except UnicodeDecodeError:
+            return None
+        if len(words) < 2:
+            return None
+        fields = self.COMPACT_FIELDS.get(words[0])
+        if (fields is None) or (len(words) - 2 > len(fields)):
+            return None
+
+        post_body = {'command': words[0], 'camera': words[1]}
+        for name, value in zip(fields, words[2:]):
+            if value != '_':
+                post_body[name] = value
+        return post_body
+
+    #==============================================================================
+    # Text of the response to a compact request
+    def compact_response(self, a_response):
+        if a_response.get('status') == 'ok':
+            return 'ok'
+        errors = a_response.get('errors', [])
+        if isinstance(errors, str):
+            errors = [errors]
+        return 'fail ' + '; '.join(str(error) for error in errors)
+
+#==============================================================================
+# HTTP server that reports errors in request handlers through g_log, rather
+# than printing them to stderr
+class ViscaHttpServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        exc = sys.exc_info()[1]
+        if isinstance(exc, ConnectionError):
+            # A client closing a kept-alive connection: no traceback needed
+            g_log.info('Connection from %s closed: %s', client_address[0], exc)
+        else:
+            g_log.exception('Error handling request from %s', client_address[0])
+
+#==============================================================================
+# Find the baud rates at which camera 1 on serial port a_port answers,
+# by sending g_probe_count version inquiries at each of a_rates.
+# Return a list with a result for each rate, fastest rate first.
+# Throws ErrorEx if the port can't be opened
+def probe_baud_rates(a_port, a_rates):
+    inquiry = visca_codec.version_inquiry()
+    try:
+        port = serial.Serial(a_port, a_rates[0], timeout=0.25, write_timeout=2)
+    except serial.SerialException as exc:
+        raise ErrorEx(str(exc))
+
+    results = []
+    with port:
+        for rate in sorted(a_rates, reverse=True):
+            port.baudrate = rate
+            time.sleep(0.05)
+            port.reset_input_buffer()
+            times = []
+            for ix in range(g_probe_count):
+                started = time.perf_counter()
+                port.write(inquiry)
+                port.flush()
+                # Expect y0 50 GG GG HH HH JJ JJ KK FF
+                reply = port.read_until(b'\xff', 16)
+                if (len(reply) == visca_codec.VERSION_REPLY_LENGTH) and \
+                   (reply[0] == 0x90) and (reply[1] == visca_codec.COMPLETION):
+                    times.append(time.perf_counter() - started)
+                else:
+                    # Let any garbage arrive, then discard it
+                    time.sleep(0.1)
+                    port.reset_input_buffer()
+                    if (ix >= 1) and not times:
+                        # Nothing at this rate; don't wait for the rest
+                        break
+
+            result = {}
+            result['baud_rate'] = rate
+            result['replies'] = len(times)
+            result['errors'] = g_probe_count - len(times)
+            result['mean_ms'] = round(1000 * sum(times) / len(times), 1) if times else None
+            result['max_ms'] = round(1000 * max(times), 1) if times else None
+            results.append(result)
+            g_log.info('  %6d baud: %d/%d replies%s', rate, len(times), g_probe_count,
+                       f', mean {result["mean_ms"]} ms, max {result["max_ms"]} ms' if times else '')
+
+    return results
+
+#==============================================================================
+# Read the --config file a_path, returning its contents as a dict
+# Throws ErrorEx if it can't be read
+def load_config(a_path):
+    try:
+        with open(a_path) as file:
+            config = json.load(file)
+    except (OSError, ValueError) as exc:
+        raise ErrorEx(f'Cannot read config file {a_path}: {exc}')
+    if (not isinstance(config, dict)) or (not isinstance(config.get('cameras', {}), dict)):
+        raise ErrorEx(f'Config file {a_path} should have a "cameras" object')
+    return config
+
+#==============================================================================
+# Send g_log messages at a_level and above to the console and, if a_file is
+# given, to a rotating log file, both written on a background thread
+def setup_logging(a_level, a_file):
+    global g_log_listener
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('%(message)s'))
+    handlers = [console]
+    if a_file:
+        try:
+            log_file = logging.handlers.RotatingFileHandler(
+                a_file, maxBytes=g_log_max_bytes, backupCount=g_log_backups)
+        except OSError as exc:
+            raise ErrorEx(f'Cannot open log file {a_file}: {exc}')
+        log_file.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s [%(threadName)s] %(message)s'))
+        handlers.append(log_file)
+
+    # The QueueHandler formats each message on the thread that logs it,
+    # then only queues it; the listener does the writing
+    log_queue = queue.SimpleQueue()
+    g_log.addHandler(logging.handlers.QueueHandler(log_queue))
+    g_log.setLevel(a_level)
+    g_log.propagate = False
+    g_log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+    g_log_listener.start()
+    # Write whatever is queued before exiting
+    atexit.register(g_log_listener.stop)
+
+#==============================================================================
+# Convert a baud_rate argument, which may be "auto"
+def baud_rate_arg(a_value):
+    if a_value == 'auto':
+        return a_value
+    try:
+        return int(a_value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a number or "auto"')
 
 #==============================================================================
 def main():
@@ -850,30 +3712,182 @@ def main():
     global g_serialPort
     global g_serialBaudRate
     global g_serverPort
+    global g_state_max_age
+    global g_poll_interval
     global g_viscaTalker
-
+    global g_state_poller
+    global g_baud_probe
+    global g_control_rate
+    global g_acceleration
+    global g_velocity_timeout
+    global g_motion_planner
+    global g_move_scheduler
+    global g_preset_file
+    global g_preset_store
+    global g_queue_limit
+    global g_drop_policy
+    global g_camera_file
+    global g_camera_models
+    global g_camera_directory
+    global g_log_level
+    global g_log_file
+    global g_recorder
+    global g_config_file
+    global g_retry_count
+    global g_breaker_failures
+    global g_ip_transport
+
+    parser = argparse.ArgumentParser(
+        description='Web server to send VISCA messages to PTZ cameras.',
+        epilog='Parameters are optional.')
+    parser.add_argument('serial_port', nargs='?', default=g_serialPort,
+                        help='serial port for VISCA. Default COM1. '
+                             'Specify SIM for simulated serial operation. '
+                             'Specify UDP for IP-only operation without a serial port.')
+    parser.add_argument('baud_rate', nargs='?', type=baud_rate_arg, default=g_serialBaudRate,
+                        help='serial baud rate, or "auto" to use the fastest at which '
+                             'camera 1 answers reliably. Default 9600')
+    parser.add_argument('http_port', nargs='?', type=int, default=g_serverPort,
+                        help='HTTP port. Default 8080')
+    parser.add_argument('--ip-transport', choices=list(ViscaIpChannels.TRANSPORTS),
+                        default=g_ip_transport,
+                        help='how to reach cameras named by IP address: visca-ip (Sony, UDP '
+                             f'port {g_visca_udp_port}), tcp (port {g_visca_tcp_port}) or '
+                             f'raw-udp (port {g_visca_raw_udp_port}). Cameras in the --config '
+                             f'file may choose their own. Default {g_ip_transport}')
+    parser.add_argument('--state-age', type=float, default=g_state_max_age,
+                        help='seconds a cached camera position may be used for a jog '
+                             'instead of asking the camera. 0 to always ask. '
+                             f'Default {g_state_max_age}')
+    parser.add_argument('--poll-interval', type=float, default=g_poll_interval,
+                        help='seconds between camera polls for /events clients. '
+                             f'Default {g_poll_interval}')
+    parser.add_argument('--control-rate', type=float, default=g_control_rate,
+                        help='speed updates per second for velocity commands. '
+                             f'Default {g_control_rate}')
+    parser.add_argument('--acceleration', type=float, default=g_acceleration,
+                        help='velocity command acceleration, in full speeds per second. '
+                             f'Default {g_acceleration}')
+    parser.add_argument('--velocity-timeout', type=float, default=g_velocity_timeout,
+                        help='seconds without a velocity command before a moving '
+                             f'camera is stopped. 0 for never. Default {g_velocity_timeout}')
+    parser.add_argument('--preset-file', default=g_preset_file,
+                        help='JSON file for preset positions. '
+                             'Default visca-presets.json beside this script')
+    parser.add_argument('--config',
+                        help='JSON file naming cameras, with the serial port and address '
+                             'or IP address of each. See README.md')
+    parser.add_argument('--discover', default='',
+                        help='comma-separated serial addresses and IP addresses of cameras '
+                             'to identify at startup, such as 1,2,192.168.0.20. Cameras '
+                             'in the --config file, and found before, are identified as well')
+    parser.add_argument('--camera-file', default=g_camera_file,
+                        help='JSON file for cameras found. '
+                             'Default visca-cameras.json beside this script')
+    parser.add_argument('--models',
+                        help='JSON file with a list of camera model capabilities, '
+                             'used before the built-in ones')
+    parser.add_argument('--queue-limit', type=int, default=g_queue_limit,
+                        help='most commands waiting for each camera. '
+                             f'Default {g_queue_limit}')
+    parser.add_argument('--drop-policy', choices=g_drop_policies, default=g_drop_policy,
+                        help='when a camera queue is full, drop the oldest waiting jog, slew '
+                             'or zoom, or reject the new command. Stops, batches and scheduled '
+                             'moves are always queued. '
+                             f'Default {g_drop_policy}')
+    parser.add_argument('--retries', type=int, default=g_retry_count,
+                        help='times to resend a command that gets no reply. '
+                             f'Default {g_retry_count}')
+    parser.add_argument('--breaker-failures', type=int, default=g_breaker_failures,
+                        help='commands in a row with no reply, after their retries, '
+                             'before a camera is offline, '
+                             'and its commands fail at once until it answers a probe. '
+                             f'0 to never fail fast. Default {g_breaker_failures}')
+    parser.add_argument('--log-level', choices=g_log_levels, default=g_log_level,
+                        help='least important messages to log. DEBUG shows every VISCA '
+                             f'message sent and received. Default {g_log_level}')
+    parser.add_argument('--log-file', default=g_log_file,
+                        help='also log to this file, rotated at '
+                             f'{g_log_max_bytes // 1000000} MB, keeping {g_log_backups} old files')
+    parser.add_argument('--capture',
+                        help='append every VISCA message sent and the replies to this '
+                             'file, for visca-replay.py')
+    parser.add_argument('--probe', action='store_true',
+                        help='time camera 1 replies at each baud rate '
+                             f'({", ".join(str(r) for r in g_probe_baud_rates)}) and exit')
     if (len(sys.argv) <= 1):
-        print( 'visca-server.py {serial port} {baud rate] {TCP port}')
-        print( '  parameters are optional' )
-        print( '  - {serial port} serial port for VISCA. Default COM1' )
-        print( '    Specify SIM for simulated serial operation.' )
-        print( '    Specify UDP for IP-only operation without a serial port.' )
-        print( '  - {baud rate}   serial baud rate. Default 9600' )
-        print( '  - {port}        HTTP port. Default 8080' )
-
-    if (len(sys.argv) > 1):
-        g_serialPort = sys.argv[1]
-        
-    if (len(sys.argv) > 2):
-        g_serialBaudRate = int(sys.argv[2])
-
-    if (len(sys.argv) > 3):
-        g_serverPort = int(sys.argv[3])
-
-    g_viscaTalker = ViscaTalker(g_serialPort, g_serialBaudRate)
-
-    webServer = HTTPServer((g_hostName, g_serverPort), MyServer)
-    print(f'VISCA Server started http://{g_hostName}:{g_serverPort}')
+        parser.print_help()
+    args = parser.parse_args()
+
+    g_serialPort     = args.serial_port
+    g_serialBaudRate = args.baud_rate
+    g_serverPort     = args.http_port
+    g_state_max_age  = args.state_age
+    g_poll_interval  = args.poll_interval
+    g_control_rate   = args.control_rate
+    g_acceleration   = args.acceleration
+    g_velocity_timeout = args.velocity_timeout
+    g_preset_file    = args.preset_file
+    g_queue_limit    = max(1, args.queue_limit)
+    g_drop_policy    = args.drop_policy
+    g_ip_transport   = args.ip_transport
+    g_retry_count    = max(0, args.retries)
+    g_breaker_failures = args.breaker_failures
+    g_camera_file    = args.camera_file
+    g_log_level      = args.log_level
+    g_log_file       = args.log_file
+    setup_logging(g_log_level, g_log_file)
+    if args.models:
+        g_camera_models = load_camera_models(args.models) + g_camera_models
+
+    if args.probe or (g_serialBaudRate == 'auto'):
+        if g_serialPort in ('SIM', 'UDP'):
+            g_log.info('No serial port to probe')
+            if args.probe:
+                return
+            g_serialBaudRate = g_probe_baud_rates[-1]
+        else:
+            g_log.info('Probing baud rates on %s', g_serialPort)
+            g_baud_probe = probe_baud_rates(g_serialPort, g_probe_baud_rates)
+            reliable = [r['baud_rate'] for r in g_baud_probe if r['errors'] == 0]
+            if args.probe:
+                return
+            if not reliable:
+                raise ErrorEx(f'Camera 1 on {g_serialPort} did not answer at any baud rate')
+            g_serialBaudRate = reliable[0]
+            g_log.info('Using %s baud', g_serialBaudRate)
+
+    if args.capture:
+        try:
+            g_recorder = visca_capture.CaptureWriter(args.capture)
+        except (OSError, ValueError) as exc:
+            raise ErrorEx(f'Cannot capture to {args.capture}: {exc}')
+        g_log.info('Capturing VISCA traffic to %s', args.capture)
+
+    g_preset_store = PresetStore(g_preset_file)
+    g_camera_directory = CameraDirectory(g_camera_file, g_camera_models)
+    config_cameras = {}
+    if args.config:
+        g_config_file = args.config
+        config_cameras = load_config(g_config_file).get('cameras', {})
+    g_viscaTalker = ViscaTalker(g_serialPort, g_serialBaudRate, config_cameras)
+    g_state_poller = StatePoller(g_poll_interval)
+    g_motion_planner = MotionPlanner(g_control_rate)
+    g_move_scheduler = MoveScheduler()
+
+    # Identify cameras in the background, so the server can start at once
+    cameras = list(config_cameras)
+    for camera in list(g_camera_directory.get_all()) + args.discover.split(','):
+        if camera and (camera not in cameras):
+            cameras.append(camera)
+    if cameras:
+        threading.Thread(target=discover_cameras, args=(cameras,), daemon=True,
+                         name='discovery').start()
+
+    # Each request is handled on its own thread, and passed to a worker
+    # thread for its camera.
+    webServer = ViscaHttpServer((g_hostName, g_serverPort), MyServer)
+    g_log.info('VISCA Server started http://%s:%s', g_hostName, g_serverPort)
 
     try:
         webServer.serve_forever()
@@ -881,7 +3895,10 @@ def main():
         pass
 
     webServer.server_close()
-    print('Server stopped.')
+    g_viscaTalker.close()
+    if g_recorder is not None:
+        g_recorder.close()
+    g_log.info('Server stopped.')
 
 #==============================================================================
 if __name__ == "__main__":    
@@ -0,0 +1,582 @@
+# Simulated VISCA PTZ cameras, for testing and benchmarking visca-server.py
+# without camera hardware.
+#
+# Serves the serial VISCA byte protocol on a pseudo-terminal, with up to 7
+# daisy-chained cameras, Sony VISCA over IP on UDP port 52381, and bare VISCA
+# packets on TCP port 5678 and in UDP datagrams on port 1259, one camera per
+# IP address. The cameras model pan, tilt and zoom motion over time, so
+# the positions reported change as a real camera's would.
+#
+# Realism options:
+#   --baud             delay serial messages by their transmission time
+#   --latency          camera processing time before each reply
+#   --late-completion  delay Completion until motion ends, as the Vaddio HD-20
+#                      does for goto-preset
+#   --loss             fraction of UDP replies lost
+#   --reorder          fraction of UDP replies delayed behind the next reply
+#
+# Example: two serial cameras, a UDP camera at 127.0.0.2 and a TCP camera
+# at 127.0.0.3
+#   python visca-sim.py --serial 2 --udp 127.0.0.2 --tcp 127.0.0.3
+# then run visca-server.py with the pty name printed at startup.
+# (The serial simulation needs a POSIX pty, so isn't available on Windows.)
+#
+# Units are VISCA position units. The server defines "left" as increasing
+# pan, "up" as increasing tilt, and "in" as increasing zoom; so do we.
+
+import sys
+import os
+import time
+import argparse
+import threading
+import socket
+import random
+
+g_version = "1.0"
+
+# Position limits, roughly those of a Sony EVI-H100
+PAN_MIN  = -2448
+PAN_MAX  = 2448
+TILT_MIN = -432
+TILT_MAX = 1296
+ZOOM_MIN = 0
+ZOOM_MAX = 0x4000
+
+# Position units per second for each step of VISCA pan/tilt speed (1 to 0x18)
+# and zoom speed (0 to 7). Absolute moves with speed 0 use the maximum.
+PAN_TILT_UNITS_PER_STEP = 20
+ZOOM_UNITS_PER_STEP = 500
+PAN_TILT_MAX_SPEED = 0x18
+ZOOM_DIRECT_SPEED = 8
+
+g_verbose = False
+
+#==============================================================================
+def log(a_text):
+    if g_verbose:
+        print(f'{time.monotonic():.3f} {a_text}')
+
+#==============================================================================
+# One axis of motion: pan, tilt or zoom.
+# Either moving toward a target at a fixed speed, or slewing at a velocity
+# until stopped or a limit is reached.
+class Axis:
+    def __init__(self, a_min, a_max, a_value):
+        self.min = a_min
+        self.max = a_max
+        self.value = a_value
+        self.time = time.monotonic()
+        self.velocity = 0       # units/sec for slew
+        self.target = None      # target of absolute move
+        self.speed = 0          # units/sec for absolute move
+
+    #===========================================================================
+    # Value at time a_now
+    def at(self, a_now):
+        dt = a_now - self.time
+        if self.target is not None:
+            distance = self.target - self.value
+            step = min(abs(distance), self.speed * dt)
+            return self.value + step if distance >= 0 else self.value - step
+        return min(self.max, max(self.min, self.value + self.velocity * dt))
+
+    #===========================================================================
+    # Update the value to a_now, before changing the motion
+    def settle(self, a_now):
+        self.value = self.at(a_now)
+        self.time = a_now
+        if self.value == self.target:
+            self.target = None
+
+    #===========================================================================
+    def move_to(self, a_now, a_target, a_speed):
+        self.settle(a_now)
+        self.target = min(self.max, max(self.min, a_target))
+        self.speed = a_speed
+        self.velocity = 0
+
+    #===========================================================================
+    def slew(self, a_now, a_velocity):
+        self.settle(a_now)
+        self.target = None
+        self.velocity = a_velocity
+
+    #===========================================================================
+    # Seconds until an absolute move reaches its target; 0 if not moving
+    # to a target. (A slew never "arrives".)
+    def eta(self, a_now):
+        if self.target is None:
+            return 0
+        return abs(self.target - self.at(a_now)) / self.speed
+
+#==============================================================================
+# One simulated camera
+class SimCamera:
+    def __init__(self, a_name, a_options):
+        self.name = a_name
+        self.options = a_options
+        self.lock = threading.Lock()
+        self.pan  = Axis(PAN_MIN, PAN_MAX, 0)
+        self.tilt = Axis(TILT_MIN, TILT_MAX, 0)
+        self.zoom = Axis(ZOOM_MIN, ZOOM_MAX, 0)
+        self.presets = {}
+        # VISCA command sockets 1 and 2, True while awaiting Completion
+        self.busy_sockets = {1: False, 2: False}
+
+    #===========================================================================
+    # Handle one VISCA message a_msg (address byte through FF).
+    # a_reply(bytes) sends a reply message; a_address_byte is the reply's
+    # first byte, such as 0x90 for camera 1.
+    def handle(self, a_msg, a_reply, a_address_byte):
+        time.sleep(self.options.latency)
+        if len(a_msg) < 4:
+            a_reply(bytes([a_address_byte, 0x60, 0x02, 0xFF]))
+            return
+
+        kind = a_msg[1]
+        body = bytes(a_msg[2:-1])
+        if kind == 0x09:
+            self.inquiry(body, a_reply, a_address_byte)
+        elif kind == 0x01:
+            self.command(body, a_reply, a_address_byte)
+        else:
+            # Syntax error
+            a_reply(bytes([a_address_byte, 0x60, 0x02, 0xFF]))
+
+    #===========================================================================
+    def inquiry(self, a_body, a_reply, a_address_byte):
+        now = time.monotonic()
+        with self.lock:
+            if a_body == bytes([0x06, 0x12]):
+                # Pan/tilt position: y0 50 0p 0p 0p 0p 0t 0t 0t 0t FF
+                reply = bytes([a_address_byte, 0x50]) + \
+                        nibbles(round(self.pan.at(now))) + \
+                        nibbles(round(self.tilt.at(now))) + b'\xFF'
+            elif a_body == bytes([0x04, 0x47]):
+                # Zoom position: y0 50 0p 0p 0p 0p FF
+                reply = bytes([a_address_byte, 0x50]) + \
+                        nibbles(round(self.zoom.at(now))) + b'\xFF'
+            elif a_body == bytes([0x00, 0x02]):
+                # Version: y0 50 GG GG HH HH JJ JJ KK FF
+                reply = bytes([a_address_byte, 0x50]) + \
+                        self.options.vendor.to_bytes(2, 'big') + \
+                        self.options.model.to_bytes(2, 'big') + \
+                        self.options.rom.to_bytes(2, 'big') + \
+                        bytes([2, 0xFF])
+            else:
+                reply = bytes([a_address_byte, 0x60, 0x02, 0xFF])
+        log(f'{self.name} inquiry {a_body.hex(" ")}')
+        a_reply(reply)
+
+    #===========================================================================
+    def command(self, a_body, a_reply, a_address_byte):
+        now = time.monotonic()
+        with self.lock:
+            free = [s for s, busy in self.busy_sockets.items() if not busy]
+            if not free:
+                # Command buffer full
+                a_reply(bytes([a_address_byte, 0x60, 0x03, 0xFF]))
+                return
+            sock = free[0]
+
+            error = False
+            late = False
+            if (a_body[:2] == bytes([0x06, 0x02])) and (len(a_body) == 12):
+                # Absolute pan/tilt: 06 02 vv ww 0p 0p 0p 0p 0t 0t 0t 0t
+                speed = a_body[2] or PAN_TILT_MAX_SPEED
+                self.pan.move_to(now, signed(a_body[4:8]), speed * PAN_TILT_UNITS_PER_STEP)
+                speed = a_body[3] or speed
+                self.tilt.move_to(now, signed(a_body[8:12]), speed * PAN_TILT_UNITS_PER_STEP)
+                late = self.options.late_completion == 'all'
+            elif (a_body[:2] == bytes([0x04, 0x47])) and (len(a_body) == 6):
+                # Zoom direct: 04 47 0p 0p 0p 0p
+                self.zoom.move_to(now, unsigned(a_body[2:6]),
+                                  ZOOM_DIRECT_SPEED * ZOOM_UNITS_PER_STEP)
+                late = self.options.late_completion == 'all'
+            elif (a_body[:2] == bytes([0x06, 0x01])) and (len(a_body) == 6):
+                # Slew: 06 01 vv ww dp dt where d is 1=left/up 2=right/down 3=stop
+                self.pan.slew(now, direction(a_body[4]) * a_body[2] * PAN_TILT_UNITS_PER_STEP)
+                self.tilt.slew(now, direction(a_body[5]) * a_body[3] * PAN_TILT_UNITS_PER_STEP)
+            elif (a_body[:2] == bytes([0x04, 0x07])) and (len(a_body) == 3):
+                # Zoom: 04 07 00=stop, 2p=in, 3p=out
+                p = a_body[2]
+                v = ((p & 0x07) + 1) * ZOOM_UNITS_PER_STEP
+                if (p & 0xF0) == 0x20:
+                    self.zoom.slew(now, v)
+                elif (p & 0xF0) == 0x30:
+                    self.zoom.slew(now, -v)
+                else:
+                    self.zoom.slew(now, 0)
+            elif (a_body[:2] == bytes([0x04, 0x3F])) and (len(a_body) == 4):
+                # Preset: 04 3F 01 pp = set, 04 3F 02 pp = recall
+                number = a_body[3]
+                if a_body[2] == 0x01:
+                    self.presets[number] = (self.pan.at(now), self.tilt.at(now), self.zoom.at(now))
+                elif number in self.presets:
+                    pan, tilt, zoom = self.presets[number]
+                    self.pan.move_to(now, pan, PAN_TILT_MAX_SPEED * PAN_TILT_UNITS_PER_STEP)
+                    self.tilt.move_to(now, tilt, PAN_TILT_MAX_SPEED * PAN_TILT_UNITS_PER_STEP)
+                    self.zoom.move_to(now, zoom, ZOOM_DIRECT_SPEED * ZOOM_UNITS_PER_STEP)
+                    late = self.options.late_completion in ('preset', 'all')
+            elif a_body == bytes([0x06, 0x04]):
+                # Home
+                self.pan.move_to(now, 0, PAN_TILT_MAX_SPEED * PAN_TILT_UNITS_PER_STEP)
+                self.tilt.move_to(now, 0, PAN_TILT_MAX_SPEED * PAN_TILT_UNITS_PER_STEP)
+            elif a_body == bytes([0x06, 0x05]):
+                # Reset
+                self.pan.move_to(now, 0, PAN_TILT_MAX_SPEED * PAN_TILT_UNITS_PER_STEP)
+                self.tilt.move_to(now, 0, PAN_TILT_MAX_SPEED * PAN_TILT_UNITS_PER_STEP)
+                late = self.options.late_completion != 'none'
+            else:
+                error = True
+
+            delay = 0
+            if late:
+                delay = max(self.pan.eta(now), self.tilt.eta(now), self.zoom.eta(now))
+            if delay > 0:
+                self.busy_sockets[sock] = True
+
+        log(f'{self.name} command {a_body.hex(" ")} socket {sock} completion in {delay:.2f}s')
+        if error:
+            # Syntax error
+            a_reply(bytes([a_address_byte, 0x60, 0x02, 0xFF]))
+            return
+
+        a_reply(bytes([a_address_byte, 0x40 | sock, 0xFF]))
+        if delay > 0:
+            def complete():
+                with self.lock:
+                    self.busy_sockets[sock] = False
+                a_reply(bytes([a_address_byte, 0x50 | sock, 0xFF]))
+            threading.Timer(delay, complete).start()
+        else:
+            a_reply(bytes([a_address_byte, 0x50 | sock, 0xFF]))
+
+#==============================================================================
+# 16-bit value as four VISCA nibbles
+def nibbles(a_value):
+    v = a_value & 0xFFFF
+    return bytes([(v >> 12) & 0x0F, (v >> 8) & 0x0F, (v >> 4) & 0x0F, v & 0x0F])
+
+#==============================================================================
+# Four VISCA nibbles as an unsigned value
+def unsigned(a_bytes):
+    return ((a_bytes[0] & 0x0F) << 12) | ((a_bytes[1] & 0x0F) << 8) | \
+           ((a_bytes[2] & 0x0F) << 4)  |  (a_bytes[3] & 0x0F)
+
+#==============================================================================
+# Four VISCA nibbles as a signed value
+def signed(a_bytes):
+    v = unsigned(a_bytes)
+    return v - 0x10000 if v >= 0x8000 else v
+
+#==============================================================================
+# Slew direction byte as +1 (left/up), -1 (right/down) or 0 (stop)
+def direction(a_byte):
+    return {0x01: 1, 0x02: -1}.get(a_byte, 0)
+
+#==============================================================================
+# Daisy chain of cameras on a pseudo-terminal
+class SerialChain:
+    def __init__(self, a_count, a_options):
+        import tty
+        self.options = a_options
+        self.master, self.slave = os.openpty()
+        # Raw mode, so the line discipline doesn't echo our replies back to us
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.write_lock = threading.Lock()
+        self.cameras = {}
+        for address in range(1, a_count + 1):
+            self.cameras[address] = SimCamera(f'serial {address}', a_options)
+        self.thread = threading.Thread(target=self.run, daemon=True, name='serial')
+        self.thread.start()
+
+    #===========================================================================
+    # Time to send a_count bytes at our baud rate: 1 start, 8 data, 1 stop bit
+    def byte_time(self, a_count):
+        return a_count * 10.0 / self.options.baud
+
+    #===========================================================================
+    # Like a real camera, we only understand a client at our own baud rate.
+    # The pseudo-terminal's settings are the client's.
+    def line_speed_ok(self):
+        import termios
+        expected = getattr(termios, f'B{self.options.baud}', None)
+        if expected is None:
+            return True
+        return termios.tcgetattr(self.master)[5] == expected
+
+    #===========================================================================
+    def write(self, a_bytes):
+        with self.write_lock:
+            time.sleep(self.byte_time(len(a_bytes)))
+            os.write(self.master, a_bytes)
+        log(f'serial sent {a_bytes.hex(" ")}')
+
+    #===========================================================================
+    # Read bytes, frame messages on FF, and pass them to their cameras
+    def run(self):
+        buf = bytearray()
+        while True:
+            buf.extend(os.read(self.master, 256))
+            while 0xFF in buf:
+                end = buf.index(0xFF) + 1
+                msg = bytes(buf[:end])
+                del buf[:end]
+                # Message arrives after its transmission time
+                time.sleep(self.byte_time(len(msg)))
+                if not self.line_speed_ok():
+                    log(f'serial received {msg.hex(" ")} at the wrong baud rate: ignored')
+                    continue
+                log(f'serial received {msg.hex(" ")}')
+                threading.Thread(target=self.dispatch, args=(msg,), daemon=True).start()
+
+    #===========================================================================
+    def dispatch(self, a_msg):
+        header = a_msg[0]
+        if header == 0x88:
+            self.broadcast(a_msg)
+            return
+
+        address = header & 0x07
+        camera = self.cameras.get(address)
+        if camera is not None:
+            camera.handle(a_msg, self.write, (address | 8) << 4)
+
+    #===========================================================================
+    # Broadcast: address set and IF_clear reply; other commands are
+    # performed by every camera, without replies
+    def broadcast(self, a_msg):
+        if a_msg[1:3] == bytes([0x30, 0x01]):
+            # Address set: reply with the next free address
+            self.write(bytes([0x88, 0x30, len(self.cameras) + 1, 0xFF]))
+        elif a_msg[1:4] == bytes([0x01, 0x00, 0x01]):
+            # IF_clear
+            self.write(bytes(a_msg))
+        else:
+            for camera in self.cameras.values():
+                camera.handle(a_msg, lambda a_bytes: None, 0x80)
+
+#==============================================================================
+# A camera serving VISCA over IP on one UDP address
+class UdpCamera:
+    NAME = 'udp'
+
+    def __init__(self, a_ip, a_options, a_port=None):
+        self.options = a_options
+        self.camera = SimCamera(f'{self.NAME} {a_ip}', a_options)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((a_ip, a_port or a_options.udp_port))
+        self.lock = threading.Lock()
+        self.held = None    # Reply held back to be sent out of order
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name=f'{self.NAME} {a_ip}')
+        self.thread.start()
+
+    #===========================================================================
+    def run(self):
+        while True:
+            data, addr = self.sock.recvfrom(1024)
+            if len(data) < 9:
+                continue
+            seq = int.from_bytes(data[4:8], 'big')
+            msg = data[8:]
+            log(f'{self.camera.name} received seq {seq}: {msg.hex(" ")}')
+
+            def reply(a_bytes, a_seq=seq, a_addr=addr):
+                self.send(a_bytes, a_seq, a_addr)
+            threading.Thread(target=self.camera.handle, args=(msg, reply, 0x90),
+                             daemon=True).start()
+
+    #===========================================================================
+    # Reply a_bytes as a datagram
+    def packet(self, a_bytes, a_seq):
+        return bytes([0x01, 0x11]) + len(a_bytes).to_bytes(2, 'big') + \
+               a_seq.to_bytes(4, 'big') + a_bytes
+
+    #===========================================================================
+    # Send a reply, perhaps losing or delaying it
+    def send(self, a_bytes, a_seq, a_addr):
+        packet = self.packet(a_bytes, a_seq)
+        if random.random() < self.options.loss:
+            log(f'{self.camera.name} lost seq {a_seq}: {a_bytes.hex(" ")}')
+            return
+
+        with self.lock:
+            held = self.held
+            self.held = None
+            if (held is None) and (random.random() < self.options.reorder):
+                # Hold this reply until the next one, or 50 msec at most
+                self.held = (packet, a_addr)
+                threading.Timer(0.05, self.flush).start()
+                log(f'{self.camera.name} holding seq {a_seq}: {a_bytes.hex(" ")}')
+                return
+
+        self.sock.sendto(packet, a_addr)
+        if held is not None:
+            self.sock.sendto(*held)
+
+    #===========================================================================
+    def flush(self):
+        with self.lock:
+            held = self.held
+            self.held = None
+        if held is not None:
+            self.sock.sendto(*held)
+
+#==============================================================================
+# A camera serving bare VISCA packets on TCP, to any number of connections
+class TcpCamera:
+    def __init__(self, a_ip, a_options):
+        self.camera = SimCamera(f'tcp {a_ip}', a_options)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((a_ip, a_options.tcp_port))
+        self.listener.listen()
+        self.thread = threading.Thread(target=self.run, daemon=True, name=f'tcp {a_ip}')
+        self.thread.start()
+
+    #===========================================================================
+    def run(self):
+        while True:
+            conn, addr = self.listener.accept()
+            # Send the Ack and Completion at once, rather than waiting for
+            # the client's delayed ACK of the first
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            log(f'{self.camera.name} connection from {addr}')
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    #===========================================================================
+    # Read from connection a_conn, frame messages on FF and handle them
+    def serve(self, a_conn):
+        write_lock = threading.Lock()
+
+        def reply(a_bytes):
+            with write_lock:
+                try:
+                    a_conn.sendall(a_bytes)
+                except OSError:
+                    pass
+
+        buf = bytearray()
+        with a_conn:
+            while True:
+                try:
+                    data = a_conn.recv(256)
+                except OSError:
+                    data = b''
+                if not data:
+                    log(f'{self.camera.name} connection closed')
+                    return
+                buf.extend(data)
+                while 0xFF in buf:
+                    end = buf.index(0xFF) + 1
+                    msg = bytes(buf[:end])
+                    del buf[:end]
+                    log(f'{self.camera.name} received {msg.hex(" ")}')
+                    threading.Thread(target=self.camera.handle, args=(msg, reply, 0x90),
+                                     daemon=True).start()
+
+#==============================================================================
+# A camera serving bare VISCA packets in UDP datagrams, without Sony's
+# header. --loss and --reorder apply as for UdpCamera.
+class RawUdpCamera(UdpCamera):
+    NAME = 'raw-udp'
+
+    def __init__(self, a_ip, a_options):
+        super().__init__(a_ip, a_options, a_options.raw_udp_port)
+
+    #===========================================================================
+    def run(self):
+        while True:
+            data, addr = self.sock.recvfrom(1024)
+            log(f'{self.camera.name} received {data.hex(" ")}')
+
+            def reply(a_bytes, a_addr=addr):
+                self.send(a_bytes, 0, a_addr)
+            threading.Thread(target=self.camera.handle, args=(data, reply, 0x90),
+                             daemon=True).start()
+
+    #===========================================================================
+    def packet(self, a_bytes, a_seq):
+        return a_bytes
+
+#==============================================================================
+def main():
+    global g_verbose
+
+    parser = argparse.ArgumentParser(
+        description='Simulated VISCA cameras for testing visca-server.py.')
+    parser.add_argument('--serial', type=int, default=0,
+                        help='number of daisy-chained serial cameras (0 to 7) '
+                             'on a pseudo-terminal. Default 0')
+    parser.add_argument('--udp', nargs='*', default=[], metavar='IP',
+                        help='IP addresses for VISCA-over-IP cameras, such as 127.0.0.2')
+    parser.add_argument('--udp-port', type=int, default=52381,
+                        help='UDP port. Default 52381')
+    parser.add_argument('--tcp', nargs='*', default=[], metavar='IP',
+                        help='IP addresses for cameras taking VISCA packets on TCP')
+    parser.add_argument('--tcp-port', type=int, default=5678,
+                        help='TCP port. Default 5678')
+    parser.add_argument('--raw-udp', nargs='*', default=[], metavar='IP',
+                        help='IP addresses for cameras taking VISCA packets in UDP '
+                             'datagrams without a header')
+    parser.add_argument('--raw-udp-port', type=int, default=1259,
+                        help='raw UDP port. Default 1259')
+    parser.add_argument('--baud', type=int, default=9600,
+                        help='serial baud rate for transmission delay. Default 9600')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='camera processing time in seconds before replying. Default 0.005')
+    parser.add_argument('--late-completion', choices=['none', 'preset', 'all'], default='none',
+                        help='delay Completion until motion ends: none (like Aver), '
+                             'preset (goto-preset only, like Vaddio HD-20), or all moves. '
+                             'Default none')
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help='fraction of UDP replies lost. Default 0')
+    parser.add_argument('--reorder', type=float, default=0.0,
+                        help='fraction of UDP replies sent after the following reply. Default 0')
+    parser.add_argument('--vendor', type=lambda v: int(v, 0), default=0x0001,
+                        help='vendor ID for version inquiry. Default 0x0001 (Sony)')
+    parser.add_argument('--model', type=lambda v: int(v, 0), default=0x0513,
+                        help='model ID for version inquiry. Default 0x0513')
+    parser.add_argument('--rom', type=lambda v: int(v, 0), default=0x0100,
+                        help='ROM version for version inquiry. Default 0x0100')
+    parser.add_argument('--verbose', action='store_true',
+                        help='log each message')
+    options = parser.parse_args()
+    g_verbose = options.verbose
+
+    print(f'visca-sim version {g_version}')
+    if (options.serial == 0) and not (options.udp or options.tcp or options.raw_udp):
+        print('No cameras: specify --serial, --udp, --tcp and/or --raw-udp')
+        return
+
+    if options.serial > 0:
+        if not hasattr(os, 'openpty'):
+            print('Serial simulation needs a POSIX pseudo-terminal')
+            return
+        chain = SerialChain(min(options.serial, 7), options)
+        print(f'Serial cameras 1 to {len(chain.cameras)} on {chain.name} at {options.baud} baud')
+
+    for ip in options.udp:
+        UdpCamera(ip, options)
+        print(f'UDP camera on {ip}:{options.udp_port}')
+
+    for ip in options.tcp:
+        TcpCamera(ip, options)
+        print(f'TCP camera on {ip}:{options.tcp_port}')
+
+    for ip in options.raw_udp:
+        RawUdpCamera(ip, options)
+        print(f'Raw UDP camera on {ip}:{options.raw_udp_port}')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print('Simulator stopped.')
+
+#==============================================================================
+if __name__ == "__main__":
+    main()
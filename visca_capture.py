@@ -0,0 +1,117 @@
+# Binary capture of VISCA exchanges, written by visca-server.py --capture
+# and read by visca-replay.py
+#
+# The file starts with MAGIC, followed by one record for each exchange:
+#   RECORD header: start time (from time.time()), latency in seconds from
+#                  sending to the last reply, transport, and the lengths of
+#                  the address, the bytes sent and the bytes received
+#   then the address (ASCII), the bytes sent, and the bytes received
+# Numbers are little-endian. For Sony VISCA over IP, the bytes are the VISCA
+# message and replies without the 8-byte header. The address is the serial
+# port and camera address (such as COM3:1), the IP address for Sony VISCA
+# over IP, or the IP address and port (such as 192.168.0.20:5678) for TCP
+# and raw UDP.
+#
+# Records are only appended, so a capture can be copied while the server
+# is running; a partial record at the end is ignored.
+
+import struct
+import queue
+import threading
+import collections
+
+MAGIC  = b'VISCAP1\n'
+RECORD = struct.Struct('<dfBBHH')
+
+# Transports
+SERIAL    = 0
+UDP       = 1   # Sony VISCA over IP
+BROADCAST = 2
+TCP       = 3   # VISCA packets on a TCP connection
+RAW_UDP   = 4   # VISCA packets in UDP datagrams, without a header
+TRANSPORT_NAMES = {SERIAL: 'serial', UDP: 'udp', BROADCAST: 'broadcast',
+                   TCP: 'tcp', RAW_UDP: 'raw-udp'}
+
+Exchange = collections.namedtuple('Exchange', 'time latency transport address sent received')
+
+#==============================================================================
+# A record as bytes
+def pack(a_time, a_latency, a_transport, a_address, a_sent, a_received):
+    address = str(a_address).encode('ascii')
+    return RECORD.pack(a_time, a_latency, a_transport,
+                       len(address), len(a_sent), len(a_received)) + \
+           address + bytes(a_sent) + bytes(a_received)
+
+#==============================================================================
+# Generate the Exchanges in binary file a_file
+# Throws ValueError if it isn't a capture
+def read(a_file):
+    if a_file.read(len(MAGIC)) != MAGIC:
+        raise ValueError('not a VISCA capture file')
+    while True:
+        header = a_file.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return
+        when, latency, transport, address_len, sent_len, received_len = RECORD.unpack(header)
+        body = a_file.read(address_len + sent_len + received_len)
+        if len(body) < address_len + sent_len + received_len:
+            return
+        yield Exchange(when, latency, transport,
+                       body[:address_len].decode('ascii'),
+                       body[address_len:address_len + sent_len],
+                       body[address_len + sent_len:])
+
+#==============================================================================
+# The packets in a_bytes, each ending with FF
+def split_packets(a_bytes):
+    packets = []
+    start = 0
+    for ix, value in enumerate(a_bytes):
+        if value == 0xFF:
+            packets.append(bytes(a_bytes[start:ix + 1]))
+            start = ix + 1
+    return packets
+
+#==============================================================================
+# Appends records to a capture file on a background thread, so the threads
+# talking to cameras only pack each record and queue it.
+# Throws OSError if the file can't be opened, or ValueError if it exists
+# but isn't a capture.
+class CaptureWriter:
+    def __init__(self, a_path):
+        self.path = a_path
+        self.file = open(a_path, 'a+b')
+        self.file.seek(0)
+        start = self.file.read(len(MAGIC))
+        if not start:
+            self.file.write(MAGIC)
+        elif start != MAGIC:
+            self.file.close()
+            raise ValueError(f'{a_path} is not a VISCA capture file')
+
+        self.records = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True, name='capture')
+        self.thread.start()
+
+    #===========================================================================
+    # Record an exchange that started a_latency seconds ago
+    def record(self, a_transport, a_address, a_sent, a_received, a_time, a_latency):
+        self.records.put(pack(a_time, a_latency, a_transport, a_address, a_sent, a_received))
+
+    #===========================================================================
+    # Write records as they come, flushing whenever there are no more waiting
+    def run(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                break
+            self.file.write(record)
+            if self.records.empty():
+                self.file.flush()
+        self.file.close()
+
+    #===========================================================================
+    # Write any queued records and close the file
+    def close(self):
+        self.records.put(None)
+        self.thread.join()